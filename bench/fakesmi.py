@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# stands in for nvidia-smi, emulating K gpus (installed as bin/nvidia-smi by fakesys.py)
+#
+#   fakesmi.py --gpus K --query-gpu=index,name,... --format=csv,noheader,nounits [-lms N]
+#   fakesmi.py --gpus K --query-compute-apps=pid,process_name,used_memory --format=csv,noheader,nounits
+#
+# values drift a little between samples, --latency emulates the driver initialization
+# every real invocation pays before the first row
+
+import argparse
+import math
+import sys
+import time
+
+# field -> (value for gpu i at time t, unit shown without nounits)
+GPU_FIELDS = {
+    "index": (lambda i, t: str(i), ""),
+    "name": (lambda i, t: f"NVIDIA Fake RTX {4090 - 10 * i}", ""),
+    "uuid": (lambda i, t: f"GPU-00000000-0000-0000-0000-{i:012d}", ""),
+    "pci.bus_id": (lambda i, t: f"00000000:{i + 1:02X}:00.0", ""),
+    "pstate": (lambda i, t: "P2", ""),
+    "temperature.gpu": (lambda i, t: str(int(50 + i + 5 * math.sin(t / 7))), ""),
+    "temperature.memory": (lambda i, t: "[N/A]", ""),
+    "power.draw": (lambda i, t: f"{100 + 10 * i + 20 * math.sin(t):.2f}", " W"),
+    "power.limit": (lambda i, t: "450.00", " W"),
+    "enforced.power.limit": (lambda i, t: "450.00", " W"),
+    "clocks.gr": (lambda i, t: str(1500 + int(300 * abs(math.sin(t / 3)))), " MHz"),
+    "clocks.sm": (lambda i, t: str(1500 + int(300 * abs(math.sin(t / 3)))), " MHz"),
+    "clocks.mem": (lambda i, t: "10501", " MHz"),
+    "clocks.video": (lambda i, t: "1395", " MHz"),
+    "utilization.gpu": (lambda i, t: str(int(50 + 40 * math.sin(t / 2))), " %"),
+    "utilization.memory": (lambda i, t: str(int(20 + 10 * math.sin(t / 2))), " %"),
+    "memory.total": (lambda i, t: "24564", " MiB"),
+    "memory.used": (lambda i, t: str(4000 + 100 * i), " MiB"),
+    "memory.free": (lambda i, t: str(20564 - 100 * i), " MiB"),
+    "fan.speed": (lambda i, t: str(30 + i), " %"),
+    "pcie.link.gen.current": (lambda i, t: "4", ""),
+    "pcie.link.width.current": (lambda i, t: "16", ""),
+    "clocks_throttle_reasons.sw_power_cap": (lambda i, t: "Active" if math.sin(t) > 0.8 else "Not Active", ""),
+    "clocks_throttle_reasons.hw_slowdown": (lambda i, t: "Not Active", ""),
+    "clocks_throttle_reasons.sw_thermal_slowdown": (lambda i, t: "Not Active", ""),
+    "clocks_throttle_reasons.hw_thermal_slowdown": (lambda i, t: "Not Active", ""),
+}
+
+APP_FIELDS = {
+    "gpu_uuid": lambda i, pid: GPU_FIELDS["uuid"][0](i, 0),
+    "pid": lambda i, pid: str(pid),
+    "process_name": lambda i, pid: f"/usr/bin/fake-app-{pid}",
+    "used_memory": lambda i, pid: str(512 + pid % 1000),
+}
+
+def invalid(field: str) -> None:
+    print(f'Field "{field}" is not a valid field to query.', file=sys.stderr)
+    sys.exit(2)
+
+def gpuRows(gpus: int, fields: list, units: bool) -> str:
+    t = time.time()
+    rows = []
+    for i in range(gpus):
+        values = []
+        for field in fields:
+            value, unit = GPU_FIELDS[field]
+            values.append(value(i, t) + (unit if units else ""))
+        rows.append(", ".join(values))
+    return "\n".join(rows) + "\n"
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--gpus", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--query-gpu")
+    parser.add_argument("--query-compute-apps")
+    parser.add_argument("--format", default="csv")
+    parser.add_argument("-lms", type=int)
+    parser.add_argument("-l", type=int)
+    args = parser.parse_args()
+
+    time.sleep(args.latency)
+    options = args.format.split(",")
+    units = "nounits" not in options
+    header = "noheader" not in options
+
+    if args.query_compute_apps:
+        fields = args.query_compute_apps.split(",")
+        for field in fields:
+            if field not in APP_FIELDS:
+                invalid(field)
+        if header:
+            print(", ".join(fields))
+        for i in range(args.gpus):
+            for pid in (1000 + 10 * i, 1001 + 10 * i):
+                print(", ".join(APP_FIELDS[field](i, pid) for field in fields))
+        return
+
+    if not args.query_gpu:
+        print("fake nvidia-smi: only --query-gpu and --query-compute-apps are emulated", file=sys.stderr)
+        sys.exit(2)
+    fields = args.query_gpu.split(",")
+    for field in fields:
+        if field not in GPU_FIELDS:
+            invalid(field)
+
+    if header:
+        sys.stdout.write(", ".join(fields) + "\n")
+    interval = args.lms / 1000 if args.lms else args.l
+    try:
+        while True:
+            sys.stdout.write(gpuRows(args.gpus, fields, units))
+            sys.stdout.flush()
+            if not interval:
+                break
+            time.sleep(interval)
+    except (BrokenPipeError, KeyboardInterrupt):
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# generates a fake sysfs/procfs tree for running sensmon without the hardware
+#
+#   python3 bench/fakesys.py ROOT [--devices N] [--sensors M] [--gpus K] [--slow S] [--cpus C] [--serve]
+#   SENSMON_ROOT=ROOT PATH=ROOT/bin:$PATH ./sensmon
+#
+# the tree mimics what HwmonManager reads:
+#   sys/class/hwmon/hwmonN -> symlinks into sys/devices/..., like the kernel's class links
+#   every fourth device keeps name and sensors under device/ instead of the hwmon dir
+#   every third sensor has no _label file, so the file name is shown
+#   a few sensors hold garbage ("N/A") or nothing, reading them fails
+#   temperatures, voltages and fans get _min/_max/_crit limits and _alarm flags like real chips
+#   --slow sensors are fifos answered by SlowFeeder after --delay seconds, --serve keeps
+#   the feeder running so the GUI can be pointed at the tree
+#   bin/nvidia-smi runs bench/fakesmi.py for K gpus
+#   --cpus cores get a cpufreq directory and a RAPL zone is added for the other providers
+
+import argparse
+import os
+import shutil
+import stat
+import sys
+import threading
+import time
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parent
+
+# kernel names cycled through, they exercise every display name lookup except glxinfo
+DRIVERS = ("k10temp", "nct6798", "nvme", "lm75", "it8688", "acpitz", "coretemp", "jc42")
+
+# sensor file prefix -> raw value base (millidegrees, millivolts, rpm, microwatts, Hz)
+KINDS = (
+    ("temp", 40000),
+    ("in", 1100),
+    ("fan", 1200),
+    ("power", 25000000),
+    ("freq", 1800000000)
+)
+
+def sensorFiles(count: int) -> list:
+    files = []
+    numbers = {}
+    for i in range(count):
+        prefix, base = KINDS[0] if i % 2 == 0 else KINDS[1 + i % (len(KINDS) - 1)]
+        numbers[prefix] = numbers.get(prefix, 0) + 1
+        files.append((f"{prefix}{numbers[prefix]}", base + i))
+    return files
+
+# limit and alarm attributes of one sensor, every value sits well inside its limits
+def writeLimits(sensorDir: Path, name: str, value: int) -> None:
+    attributes = {}
+    if name.startswith("temp"):
+        attributes = {"max": 80000, "crit": 95000, "crit_hyst": 90000, "crit_alarm": 0}
+    elif name.startswith("in"):
+        attributes = {"min": value * 9 // 10, "max": value * 11 // 10, "alarm": 0}
+    elif name.startswith("fan"):
+        attributes = {"min": 300, "alarm": 0}
+    for attribute, limit in attributes.items():
+        (sensorDir / f"{name}_{attribute}").write_text(f"{limit}\n")
+
+# devices -> hwmon devices, sensors -> _input files per device
+# errors -> every n-th sensor is unreadable (0 disables), slow -> number of fifo sensors
+# smiLatency -> seconds the fake nvidia-smi takes to start, cpus -> cpufreq cores
+# returns the paths of the fifo sensors
+def build(root: Path, devices: int, sensors: int, gpus: int = 0, errors: int = 50, slow: int = 0, smiLatency: float = 0.05,
+          cpus: int = 0) -> list:
+    root = Path(root)
+    if root.exists():
+        shutil.rmtree(root)
+
+    (root / "proc").mkdir(parents=True)
+    (root / "proc/cpuinfo").write_text("processor\t: 0\nmodel name\t: Fake Ryzen 9 7950X 16-Core Processor\n")
+    dmi = root / "sys/class/dmi/id"
+    dmi.mkdir(parents=True)
+    (dmi / "board_vendor").write_text("Fake Vendor\n")
+    (dmi / "board_name").write_text("X999 FAKE\n")
+
+    hwmon = root / "sys/class/hwmon"
+    hwmon.mkdir(parents=True)
+
+    fifos = []
+    count = 0
+    for n in range(devices):
+        driver = DRIVERS[n % len(DRIVERS)]
+        deviceDir = root / f"sys/devices/platform/{driver}.{n}"
+        hwmonDir = deviceDir / f"hwmon/hwmon{n}"
+        hwmonDir.mkdir(parents=True)
+        os.symlink(os.path.relpath(hwmonDir, hwmon), hwmon / f"hwmon{n}")
+        os.symlink(os.path.relpath(deviceDir, hwmonDir), hwmonDir / "device")
+        if driver == "nvme":
+            (deviceDir / "model").write_text(f"Fake NVMe SSD {n}\n")
+
+        # device/name indirection, the sensors live next to the name file
+        sensorDir = deviceDir if n % 4 == 3 else hwmonDir
+        (sensorDir / "name").write_text(f"{driver}\n")
+
+        for i, (name, value) in enumerate(sensorFiles(sensors)):
+            count += 1
+            inputPath = sensorDir / f"{name}_input"
+            if i % 3 != 2:
+                (sensorDir / f"{name}_label").write_text(f"{name.capitalize()} {n}.{i}\n")
+            if len(fifos) < slow and i == sensors - 1:
+                os.mkfifo(inputPath)
+                fifos.append(inputPath)
+            elif errors and count % errors == 0:
+                inputPath.write_text("N/A\n" if count % (2 * errors) else "")
+            else:
+                inputPath.write_text(f"{value}\n")
+            writeLimits(sensorDir, name, value)
+
+    # cpufreq cores and a RAPL package zone for the providers beyond hwmon, the energy
+    # counter does not move, so its power reads 0 W
+    for core in range(cpus):
+        cpufreq = root / f"sys/devices/system/cpu/cpu{core}/cpufreq"
+        cpufreq.mkdir(parents=True)
+        (cpufreq / "scaling_cur_freq").write_text(f"{3000000 + core * 100000}\n")
+    if cpus:
+        zone = root / "sys/devices/virtual/powercap/intel-rapl/intel-rapl:0"
+        zone.mkdir(parents=True)
+        (zone / "name").write_text("package-0\n")
+        (zone / "energy_uj").write_text("123456789\n")
+        (zone / "max_energy_range_uj").write_text("262143328850\n")
+        (root / "sys/class/powercap").mkdir(parents=True)
+        os.symlink(os.path.relpath(zone, root / "sys/class/powercap"), root / "sys/class/powercap/intel-rapl:0")
+
+    if gpus:
+        binDir = root / "bin"
+        binDir.mkdir()
+        script = binDir / "nvidia-smi"
+        script.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{BENCH / "fakesmi.py"}" --gpus {gpus} --latency {smiLatency} "$@"\n')
+        script.chmod(script.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    return fifos
+
+# answers every open of a fifo sensor with a value after `delay` seconds,
+# like an attribute whose driver waits on a slow bus
+class SlowFeeder:
+    def __init__(self, fifos: list, delay: float = 0.05, value: int = 45000) -> None:
+        self.fifos = fifos
+        self.delay = delay
+        self.value = f"{value}\n".encode()
+        self.running = True
+        self.threads = [threading.Thread(target=self.feed, args=(path,), daemon=True) for path in fifos]
+
+    def start(self) -> "SlowFeeder":
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def feed(self, path: Path) -> None:
+        while self.running:
+            try:
+                # blocks until a reader opens the fifo
+                fd = os.open(path, os.O_WRONLY)
+            except OSError:
+                return
+            try:
+                time.sleep(self.delay)
+                os.write(fd, self.value)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+
+    # blocked writers are daemon threads, they end with the process
+    def stop(self) -> None:
+        self.running = False
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate a fake hwmon tree for SENSMON_ROOT.")
+    parser.add_argument("root", type=Path)
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--sensors", type=int, default=12, help="sensors per device")
+    parser.add_argument("--gpus", type=int, default=0, help="gpus reported by bin/nvidia-smi")
+    parser.add_argument("--errors", type=int, default=50, help="every n-th sensor is unreadable, 0 for none")
+    parser.add_argument("--slow", type=int, default=0, help="number of fifo sensors")
+    parser.add_argument("--delay", type=float, default=0.05, help="seconds a slow sensor takes to answer")
+    parser.add_argument("--cpus", type=int, default=4, help="cores with cpufreq, plus a RAPL zone unless 0")
+    parser.add_argument("--serve", action="store_true", help="keep answering slow sensors until interrupted")
+    args = parser.parse_args()
+
+    fifos = build(args.root, args.devices, args.sensors, args.gpus, args.errors, args.slow, cpus=args.cpus)
+    print(f"{args.devices * args.sensors} sensors on {args.devices} devices under {args.root}")
+    if args.serve and fifos:
+        SlowFeeder(fifos, args.delay).start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
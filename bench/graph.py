@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# frame times of the graph window with many long series
+#
+#   python3 bench/graph.py [--series N] [--points N] [--frames N]
+#
+# every series gets --points samples one second apart, then the benchmark times laying
+# out all columns (open, resize, zoom), drawing them from scratch, painting a frame into
+# an offscreen image, and a frame with one new sample per series as the live view does
+# it. a frame has to stay well under 16.7 ms for 60 fps. uses QT_QPA_PLATFORM=offscreen
+# unless a display is configured.
+
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+if not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtGui import QImage, QPainter
+from PyQt6.QtWidgets import QApplication
+
+import collector
+from graph import GraphWidget
+from sensortable import RowInfo
+
+def median(function, runs: int) -> float:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--series", type=int, default=20)
+    parser.add_argument("--points", type=int, default=100000)
+    parser.add_argument("--frames", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1600)
+    parser.add_argument("--height", type=int, default=800)
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv[:1])
+    widget = GraphWidget(live=False)
+    widget.resize(args.width, args.height)
+
+    # the whole run is visible, every pixel column holds many samples
+    end = 1.7e9
+    start = end - args.points
+    widget.span = args.points
+    for row in range(args.series):
+        info = RowInfo(f"dev/s{row}", "dev", "Bench", "Temperature", f"s{row}", 1, "°C")
+        widget.addSeries(None, row, info, True)
+        times = [start + i for i in range(args.points)]
+        widget.series[-1].prepend(times, [50 + 20 * math.sin(t / 300 + row) + (i * 7919 % 97) / 10 for i, t in enumerate(times)])
+    widget.newest = end
+    widget.relayout()
+
+    image = QImage(args.width, args.height, QImage.Format.Format_ARGB32_Premultiplied)
+    def paint() -> None:
+        painter = QPainter(image)
+        widget.render(painter)
+        painter.end()
+
+    # what opening, zooming or a change of the value axis costs
+    def redraw() -> None:
+        widget.layerRange = None
+        paint()
+
+    # one new sample per series, then a frame
+    current = [50.0] * args.series
+    def tick() -> None:
+        widget.newest += 1
+        widget.appendSnapshot(None, collector.Snapshot(widget.newest, True, (), (), current, current, current, 0))
+        paint()
+
+    points = args.series * args.points
+    print(f"{args.series} series x {args.points} points ({points} total), {args.width}x{args.height}")
+    print(f"  layout     {median(widget.relayout, 10):8.2f} ms")
+    print(f"  redraw     {median(redraw, 10):8.2f} ms")
+    print(f"  paint      {median(paint, args.frames):8.2f} ms")
+    print(f"  live frame {median(tick, args.frames):8.2f} ms")
+    app.quit()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# compares Sensor.read in open/read/close mode against the persistent pread mode
+#
+#   python3 bench/readers.py [--sensors N] [--ticks T] [--root DIR]
+#
+# without --root a throwaway tree of plain files is generated, point --root at a
+# real hwmon device directory (e.g. /sys/class/hwmon/hwmon2) to measure sysfs.
+# syscall counts are taken with strace -c when it is installed.
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import sensors
+
+def makeTree(root: Path, count: int) -> None:
+    for i in range(1, count + 1):
+        (root / f"temp{i}_input").write_text(f"{40000 + i}\n")
+
+def loadSensors(root: Path, persistent: bool) -> list:
+    dev = sensors.HwmonDevice("bench", root, persistent)
+    dev.findSensors()
+    return dev.sensors
+
+def runTicks(root: Path, persistent: bool, ticks: int) -> int:
+    sensorList = loadSensors(root, persistent)
+    start = time.perf_counter_ns()
+    for _ in range(ticks):
+        for sensor in sensorList:
+            sensor.read()
+    elapsed = time.perf_counter_ns() - start
+    for sensor in sensorList:
+        sensor.close()
+    return elapsed
+
+def countSyscalls(root: Path, persistent: bool, ticks: int) -> dict:
+    out = subprocess.run([
+        "strace", "-f", "-c", "-U", "name,calls",
+        sys.executable, __file__, "--root", str(root), "--ticks", str(ticks),
+        "--only", "fd" if persistent else "text"
+    ], capture_output=True, text=True).stderr
+
+    calls = {}
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            calls[parts[0]] = int(parts[1])
+    return calls
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sensors", type=int, default=300)
+    parser.add_argument("--ticks", type=int, default=100)
+    parser.add_argument("--root")
+    parser.add_argument("--only", choices=("text", "fd"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    tmp = None
+    if args.root:
+        root = Path(args.root)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        root = Path(tmp.name)
+        makeTree(root, args.sensors)
+
+    if args.only:
+        runTicks(root, args.only == "fd", args.ticks)
+        return
+
+    count = len(loadSensors(root, False))
+    reads = count * args.ticks
+    print(f"{count} sensors x {args.ticks} ticks")
+
+    for mode, persistent in (("read_text", False), ("pread", True)):
+        elapsed = runTicks(root, persistent, args.ticks)
+        print(f"  {mode:<10} {elapsed / reads:8.0f} ns/read  {elapsed / args.ticks / 1e6:8.3f} ms/tick")
+
+        if shutil.which("strace"):
+            calls = countSyscalls(root, persistent, args.ticks)
+            hot = {k: v for k, v in calls.items() if k in ("openat", "read", "pread64", "preadv", "close", "fstat", "newfstatat", "lseek", "ioctl")}
+            print(f"  {'':<10} syscalls/read: " + ", ".join(f"{k}={v / reads:.2f}" for k, v in sorted(hot.items())))
+
+    if tmp:
+        tmp.cleanup()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# compares startup time and peak RSS of the headless collector against the GUI
+#
+#   python3 bench/startup.py [--runs N]
+#
+# startup is measured from process launch until the first sample is out: the first
+# json line for --headless, the first paint of the tree showing sensors for the GUI. the
+# GUI also reports its first frame, the first paint of the (still empty) window.
+# SENSMON_STARTUP_PROBE makes the window report both and quit. the GUI run uses
+# QT_QPA_PLATFORM=offscreen unless a display is configured.
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# seconds from launch until each marker line (None if it never came, the last one ends
+# the run) and the peak RSS in MiB
+def measure(args: list, env: dict, markers: tuple):
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, env=env)
+
+    elapsed = dict.fromkeys(markers)
+    for line in proc.stdout:
+        for marker in markers:
+            if elapsed[marker] is None and line.startswith(marker):
+                elapsed[marker] = time.perf_counter() - start
+        if elapsed[markers[-1]] is not None:
+            break
+    proc.stdout.close()
+    proc.terminate()
+
+    _, status, usage = os.wait4(proc.pid, 0)
+    # ru_maxrss is reported in KiB on Linux
+    return elapsed, usage.ru_maxrss / 1024
+
+# markers -> label printed for each
+def report(name: str, results: list, markers: dict) -> None:
+    rss = max(r for _, r in results)
+    for marker, label in markers.items():
+        times = [elapsed[marker] for elapsed, _ in results if elapsed[marker] is not None]
+        if not times:
+            print(f"  {name:<9} {label:<12} never came")
+            continue
+        print(f"  {name:<9} {label:<12} {statistics.median(times) * 1000:8.1f} ms (median of {len(times)})")
+    print(f"  {name:<9} peak RSS     {rss:8.1f} MiB")
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    headless = [sys.executable, str(SRC / "headless.py"), "--count", "1"]
+    results = [measure(headless, env, ("{\"t\"",)) for _ in range(args.runs)]
+    report("headless", results, {"{\"t\"": "first sample"})
+
+    guiEnv = dict(env, SENSMON_STARTUP_PROBE="1")
+    if not guiEnv.get("DISPLAY") and not guiEnv.get("WAYLAND_DISPLAY"):
+        guiEnv.setdefault("QT_QPA_PLATFORM", "offscreen")
+    gui = [sys.executable, str(SRC / "monitor.py")]
+    results = [measure(gui, guiEnv, ("frame", "ready")) for _ in range(args.runs)]
+    report("gui", results, {"frame": "first frame", "ready": "first sample"})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# measures sensmon at 10 to 10,000 sensors against generated trees (see fakesys.py)
+#
+#   python3 bench/suite.py [--sizes 10,100,1000,10000] [--gpus K] [--out results.json]
+#   python3 bench/suite.py --compare old.json [--input new.json] [--threshold 0.15]
+#
+# per size it reports, as medians in milliseconds:
+#   discoveryMs  HwmonManager.findDevices() including display name resolution
+#   tickMs       reading every sensor plus the batched SensorTable.update()
+#   sampleMs     HwmonProvider.sample() of every sensor, slow ones (--slow) are read by its pool
+#   statsMs      SensorStats.update() of every sensor, i.e. the per-tick cost of the statistics
+#   statsShowMs  SensorStats.display() after every sensor was sampled once, with percentiles
+#   virtualMs    VirtualSensors.update() of every sensor with a total power, a hottest sensor and
+#                a dT/dt per temperature defined, i.e. the per-tick cost of the virtual sensors
+#   nvForkMs     NvidiaProvider.sample() forking the fake nvidia-smi
+#   nvStreamMs   NvidiaProvider.sample() draining the streaming nvidia-smi
+#   uiBuildMs    first snapshot into SensorTreeModel + QTreeView, offscreen
+#   uiUpdateMs   one snapshot with every value changed, offscreen
+# with --compare the results are diffed against an earlier run, the exit status is 1
+# if any metric got slower by more than --threshold
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH = Path(__file__).resolve().parent
+SRC = BENCH.parent / "src"
+sys.path.insert(0, str(SRC))
+sys.path.insert(0, str(BENCH))
+
+import fakesys
+import nvidiaGPU
+import sensors
+from collector import Snapshot
+from namecache import NameCache
+from sensortable import SensorTable, np
+from stats import SensorStats
+from virtual import VirtualSensors, parseDefinition
+
+METRICS = ("discoveryMs", "tickMs", "sampleMs", "statsMs", "statsShowMs", "virtualMs", "nvForkMs", "nvStreamMs", "uiBuildMs", "uiUpdateMs")
+
+def median(samples: list):
+    return round(statistics.median(samples) / 1e6, 4) if samples else None
+
+def timed(function) -> int:
+    start = time.perf_counter_ns()
+    function()
+    return time.perf_counter_ns() - start
+
+def manager(root: Path) -> sensors.HwmonManager:
+    return sensors.HwmonManager(table=SensorTable(), names=NameCache(persist=False), root=root)
+
+def benchDiscovery(root: Path, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        components = manager(root)
+        samples.append(timed(components.findDevices))
+        components.close()
+    return samples
+
+def benchTicks(components: sensors.HwmonManager, ticks: int) -> list:
+    def tick() -> None:
+        components.readAll()
+        components.table.update()
+    return [timed(tick) for _ in range(ticks)]
+
+# what the engine waits for per tick, after a first pass moved slow sensors to the pool
+def benchSample(root: Path, ticks: int) -> list:
+    loop = asyncio.new_event_loop()
+    provider = sensors.HwmonProvider(SensorTable(), root=root)
+    provider.manager.names = NameCache(persist=False)
+    try:
+        loop.run_until_complete(provider.discover())
+        rows = list(provider.sensors)
+        loop.run_until_complete(provider.sample(rows))
+        return [timed(lambda: loop.run_until_complete(provider.sample(rows))) for _ in range(ticks)]
+    finally:
+        provider.close()
+        loop.close()
+
+def benchStats(components: sensors.HwmonManager, ticks: int) -> tuple:
+    table = components.table
+    stats = SensorStats(table)
+    rows = list(range(table.size))
+    updateSamples, showSamples = [], []
+    for tick in range(ticks):
+        components.readAll()
+        table.update()
+        updateSamples.append(timed(lambda: stats.update(rows, tick)))
+        showSamples.append(timed(lambda: stats.display(True)))
+    return updateSamples, showSamples
+
+# on a table of its own, the virtual rows would otherwise show up in the ui measurements
+def benchVirtual(root: Path, ticks: int) -> list:
+    components = manager(root)
+    components.findDevices()
+    table = components.table
+    definitions = (
+        parseDefinition({"name": "Total power", "type": "Power", "expr": "sum('hwmon*/power*_input')"}, 0),
+        parseDefinition({"name": "Hottest", "type": "Temperature", "expr": "max('hwmon*/temp*_input')"}, 1),
+        parseDefinition({"name": "dT/dt", "each": "hwmon*/temp*_input", "expr": "rate(this)"}, 2)
+    )
+    virtual = VirtualSensors(table, definitions)
+    virtual.compile()
+    rows = [row for row, info in enumerate(table.rows) if info.device != "virtual"]
+    samples = []
+    for tick in range(ticks):
+        components.readAll()
+        samples.append(timed(lambda: virtual.update(rows, tick)))
+    components.close()
+    return samples
+
+def benchNvidia(root: Path, repeat: int) -> tuple:
+    path = os.environ.get("PATH", "")
+    os.environ["PATH"] = f"{root / 'bin'}{os.pathsep}{path}"
+    loop = asyncio.new_event_loop()
+    try:
+        fork = nvidiaGPU.NvidiaProvider(SensorTable(), stream=False)
+        loop.run_until_complete(fork.discover())
+        # every row is due, only the fields queried on every sample are read again
+        rows = list(fork.channels())
+        forkSamples = [timed(lambda: loop.run_until_complete(fork.sample(rows))) for _ in range(repeat)]
+
+        stream = nvidiaGPU.NvidiaProvider(SensorTable(), stream=True, interval=20)
+        stream.deadline = 10
+        loop.run_until_complete(stream.discover())
+        rows = list(stream.channels())
+        streamSamples = []
+        for _ in range(repeat):
+            loop.run_until_complete(asyncio.sleep(0.03))
+            streamSamples.append(timed(lambda: loop.run_until_complete(stream.sample(rows))))
+        stream.close()
+        loop.run_until_complete(asyncio.sleep(0.1))
+    finally:
+        loop.close()
+        os.environ["PATH"] = path
+    return forkSamples, streamSamples
+
+# the tree view is driven directly, without the collector thread
+def benchUi(components: sensors.HwmonManager, ticks: int) -> tuple:
+    try:
+        from PyQt6.QtWidgets import QApplication, QTreeView
+        from sensormodel import SensorTreeModel
+    except ImportError:
+        return [], []
+
+    app = QApplication.instance() or QApplication([])
+    # configured like the treeView in ui/monitor.ui
+    view = QTreeView()
+    view.setAlternatingRowColors(True)
+    view.setUniformRowHeights(True)
+    model = SensorTreeModel(view)
+    view.setModel(model)
+    view.resize(800, 1000)
+    view.show()
+    app.processEvents()
+
+    table = components.table
+    devices = tuple(dev.id for dev in components.hwmonx)
+
+    def snapshot() -> Snapshot:
+        current, minimum, maximum = table.display(True)
+        return Snapshot(time.time(), True, devices, table.schema, current, minimum, maximum, 0)
+
+    def build() -> None:
+        model.applySnapshot(snapshot())
+        # new devices go into the tree in batches from the event loop
+        while any(source.waiting for source in model.sources.values()):
+            app.processEvents()
+        view.expandAll()
+        app.processEvents()
+
+    components.readAll()
+    table.update()
+    buildSamples = [timed(build)]
+
+    updateSamples = []
+    for tick in range(ticks):
+        for row in range(table.size):
+            table.cur[row] += 1000
+        table.update()
+        current = snapshot()
+        updateSamples.append(timed(lambda: (model.applySnapshot(current), app.processEvents())))
+
+    view.close()
+    view.deleteLater()
+    app.processEvents()
+    return buildSamples, updateSamples
+
+def runSize(workDir: Path, size: int, args) -> dict:
+    devices = max(1, math.ceil(size / args.per_device))
+    perDevice = max(1, size // devices)
+    root = workDir / f"tree{size}"
+    fifos = fakesys.build(root, devices, perDevice, args.gpus, args.errors, args.slow, args.smi_latency)
+    feeder = fakesys.SlowFeeder(fifos, args.delay).start() if fifos else None
+
+    result = {"sensors": devices * perDevice, "devices": devices}
+    try:
+        result["discoveryMs"] = median(benchDiscovery(root, args.repeat))
+
+        components = manager(root)
+        components.findDevices()
+        result["tickMs"] = median(benchTicks(components, args.ticks))
+        result["sampleMs"] = median(benchSample(root, args.ticks))
+        update, show = benchStats(components, args.ticks)
+        result["statsMs"] = median(update)
+        result["statsShowMs"] = median(show)
+        result["virtualMs"] = median(benchVirtual(root, args.ticks))
+
+        if args.gpus:
+            fork, stream = benchNvidia(root, args.repeat)
+            result["nvForkMs"] = median(fork)
+            result["nvStreamMs"] = median(stream)
+
+        if not args.no_ui:
+            build, update = benchUi(components, args.ticks)
+            result["uiBuildMs"] = median(build)
+            result["uiUpdateMs"] = median(update)
+        components.close()
+    finally:
+        if feeder:
+            feeder.stop()
+    return result
+
+def compare(old: dict, new: dict, threshold: float) -> bool:
+    previous = {r["sensors"]: r for r in old["results"]}
+    regressed = False
+    print(f"{'sensors':>8} {'metric':<12} {'old':>10} {'new':>10} {'change':>8}")
+    for result in new["results"]:
+        before = previous.get(result["sensors"])
+        if before is None:
+            continue
+        for metric in METRICS:
+            a, b = before.get(metric), result.get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            flag = ""
+            if change > threshold:
+                flag = "  slower"
+                regressed = True
+            print(f"{result['sensors']:>8} {metric:<12} {a:>10.3f} {b:>10.3f} {change:>+8.1%}{flag}")
+    return regressed
+
+def report(results: dict) -> None:
+    print(f"{'sensors':>8} " + " ".join(f"{metric:>11}" for metric in METRICS))
+    for result in results["results"]:
+        cells = []
+        for metric in METRICS:
+            value = result.get(metric)
+            cells.append(f"{value:>11.3f}" if value is not None else f"{'-':>11}")
+        print(f"{result['sensors']:>8} " + " ".join(cells))
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark sensmon against generated sensor trees.")
+    parser.add_argument("--sizes", default="10,100,1000,10000", help="comma separated sensor counts")
+    parser.add_argument("--per-device", type=int, default=25, help="sensors per hwmon device")
+    parser.add_argument("--gpus", type=int, default=2, help="gpus emulated by the fake nvidia-smi, 0 to skip")
+    parser.add_argument("--smi-latency", type=float, default=0.0, help="startup delay of the fake nvidia-smi")
+    parser.add_argument("--errors", type=int, default=50, help="every n-th sensor is unreadable, 0 for none")
+    parser.add_argument("--slow", type=int, default=0, help="number of slow fifo sensors")
+    parser.add_argument("--delay", type=float, default=0.005, help="seconds a slow sensor takes to answer")
+    parser.add_argument("--ticks", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-ui", action="store_true", help="skip the offscreen Qt measurements")
+    parser.add_argument("--out", type=Path, help="write results as json")
+    parser.add_argument("--input", type=Path, help="compare this result file instead of running")
+    parser.add_argument("--compare", type=Path, help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    if args.input:
+        results = json.loads(args.input.read_text())
+    else:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        # one persistent fd per sensor
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        # icons are looked up relative to src, as in monitor.py
+        os.chdir(SRC)
+
+        results = {
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "numpy": np is not None,
+                "args": {k: str(v) for k, v in vars(args).items()}
+            },
+            "results": []
+        }
+        with tempfile.TemporaryDirectory(prefix="sensmon-bench-") as workDir:
+            for size in (int(s) for s in args.sizes.split(",")):
+                results["results"].append(runSize(Path(workDir), size, args))
+                print(f"  {size} sensors done", file=sys.stderr)
+        if args.out:
+            args.out.write_text(json.dumps(results, indent=1) + "\n")
+
+    report(results)
+    if args.compare:
+        print()
+        if compare(json.loads(args.compare.read_text()), results, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import argparse
+import os
+import selectors
+import signal
+import socket
+import stat
+import sys
+
+import collector
+import protocol
+
+# a client whose unsent backlog exceeds this skips samples until it caught up
+BACKLOG_LIMIT = 1024 * 1024
+
+# one connected client and the values it was last sent
+class Connection:
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.reader = protocol.FrameReader()
+        self.outbuf = bytearray()
+        self.schema = None
+        self.current = []
+        self.minimum = []
+        self.maximum = []
+
+    # queues the rows that changed since the values queued last, every row after a new schema
+    def push(self, snapshot: collector.Snapshot, schemaFrame: bytes, current: list, minimum: list, maximum: list) -> None:
+        if len(self.outbuf) > BACKLOG_LIMIT:
+            return
+
+        if snapshot.schema is not self.schema:
+            self.schema = snapshot.schema
+            self.outbuf += schemaFrame
+            changed = range(len(current))
+        else:
+            same = protocol.same
+            old = (self.current, self.minimum, self.maximum)
+            changed = [row for row in range(len(current))
+                       if not (same(current[row], old[0][row]) and same(minimum[row], old[1][row]) and same(maximum[row], old[2][row]))]
+
+        self.outbuf += protocol.valuesFrame(snapshot.timestamp, snapshot.reads,
+                                            [(row, current[row], minimum[row], maximum[row]) for row in changed])
+        self.current, self.minimum, self.maximum = current, minimum, maximum
+
+# serves the local collector's samples to any number of remote.py clients over TCP or a
+# unix socket, all sockets are non-blocking and driven by one selector on the main thread
+class Agent:
+    def __init__(self, address: str, interval: float = 1.0, adaptive: bool = True) -> None:
+        self.hostname = socket.gethostname()
+        self.selector = selectors.DefaultSelector()
+        self.clients = {}
+
+        self.unixPath = None
+        self.listener = self.listen(address)
+
+        # the collector thread wakes the selector through this pair
+        self.wakeRead, self.wakeWrite = socket.socketpair()
+        self.wakeRead.setblocking(False)
+        self.wakeWrite.setblocking(False)
+
+        # latest sample and its encodings shared by every connection
+        self.snapshot = None
+        self.schemaFrame = b""
+        self.values = ([], [], [])
+
+        self.collector = collector.Collector(interval, self.notify, adaptive=adaptive)
+
+    def listen(self, address: str) -> socket.socket:
+        family, target = protocol.parseAddress(address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            # a socket left behind by an agent that did not shut down cleanly
+            try:
+                if stat.S_ISSOCK(os.stat(target).st_mode):
+                    os.unlink(target)
+            except OSError:
+                pass
+            self.unixPath = target
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(target)
+        sock.listen()
+        sock.setblocking(False)
+        return sock
+
+    # called on the collector thread
+    def notify(self) -> None:
+        try:
+            self.wakeWrite.send(b"\0")
+        except OSError:
+            pass
+
+    def run(self) -> None:
+        # exit through the cleanup below, which removes a unix socket
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self.wakeRead, selectors.EVENT_READ)
+        self.collector.start()
+
+        try:
+            while True:
+                for key, mask in self.selector.select():
+                    if key.fileobj is self.listener:
+                        self.accept()
+                    elif key.fileobj is self.wakeRead:
+                        self.publish()
+                    else:
+                        self.service(key.data, mask)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.collector.stop()
+            for conn in list(self.clients.values()):
+                self.drop(conn)
+            self.listener.close()
+            if self.unixPath:
+                try:
+                    os.unlink(self.unixPath)
+                except OSError:
+                    pass
+
+    def publish(self) -> None:
+        try:
+            while self.wakeRead.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        snapshot = self.collector.takeSnapshot()
+        if snapshot is None:
+            return
+        if self.snapshot is None or snapshot.schema is not self.snapshot.schema:
+            self.schemaFrame = protocol.schemaFrame(snapshot, self.hostname)
+        self.snapshot = snapshot
+        self.values = (snapshot.current.tolist(), snapshot.minimum.tolist(), snapshot.maximum.tolist())
+
+        for conn in self.clients.values():
+            conn.push(snapshot, self.schemaFrame, *self.values)
+            self.watch(conn)
+
+    def accept(self) -> None:
+        try:
+            sock, _ = self.listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        if sock.family != socket.AF_UNIX:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        conn = Connection(sock)
+        self.clients[sock] = conn
+        self.selector.register(sock, selectors.EVENT_READ, conn)
+        if self.snapshot is not None:
+            conn.push(self.snapshot, self.schemaFrame, *self.values)
+            self.watch(conn)
+
+    # wait for writability only while there is something to send
+    def watch(self, conn: Connection) -> None:
+        events = selectors.EVENT_READ
+        if conn.outbuf:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(conn.sock, events, conn)
+
+    def service(self, conn: Connection, mask: int) -> None:
+        if mask & selectors.EVENT_READ:
+            try:
+                data = conn.sock.recv(4096)
+            except BlockingIOError:
+                data = None
+            except OSError:
+                data = b""
+            if data == b"":
+                self.drop(conn)
+                return
+            if data:
+                try:
+                    frames = conn.reader.feed(data)
+                except protocol.ProtocolError:
+                    self.drop(conn)
+                    return
+                for kind, payload in frames:
+                    if kind == protocol.RESET:
+                        self.collector.requestReset()
+
+        if mask & selectors.EVENT_WRITE and conn.outbuf:
+            try:
+                sent = conn.sock.send(conn.outbuf)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.drop(conn)
+                return
+            del conn.outbuf[:sent]
+            self.watch(conn)
+
+    def drop(self, conn: Connection) -> None:
+        self.clients.pop(conn.sock, None)
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="sensmon --agent", description="Serve this host's sensors to remote sensmon windows.")
+    parser.add_argument("--listen", default=f"127.0.0.1:{protocol.DEFAULT_PORT}", metavar="ADDRESS",
+                        help=f"[HOST:]PORT or unix:PATH (default 127.0.0.1:{protocol.DEFAULT_PORT})")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between samples (default 1)")
+    parser.add_argument("--fixed-rate", action="store_true", help="read every sensor each interval instead of adapting per sensor")
+    args = parser.parse_args()
+
+    Agent(args.listen, args.interval, not args.fixed_rate).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,360 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import NamedTuple
+
+from config import configPath
+from sensortable import RowInfo, SensorTable
+
+# alert levels, the index is what snapshots carry per row
+SEVERITIES = ("", "warning", "critical")
+WARNING, CRITICAL = 1, 2
+
+# hysteresis of the hardware limits without a _hyst attribute, as a fraction of the limit
+LIMIT_HYSTERESIS = 0.02
+
+# seconds an alert command may run before it is killed
+COMMAND_TIMEOUT = 30
+
+# hardware limit -> (kind, severity, display name, attribute holding its clear threshold)
+LIMIT_RULES = {
+    "crit": ("above", CRITICAL, "critical limit", "crit_hyst"),
+    "max": ("above", WARNING, "max limit", "max_hyst"),
+    "lcrit": ("below", CRITICAL, "low critical limit", None),
+    "min": ("below", WARNING, "min limit", None)
+}
+ALARM_SEVERITIES = {"crit_alarm": CRITICAL, "lcrit_alarm": CRITICAL}
+
+# a user rule from alerts.json, thresholds are in display units with temperatures in °C
+#   match/device/label/type -> which sensors, glob patterns on the uid, device display name,
+#                              label and exact sensor type, every given one has to match
+#   above/below             -> threshold, rate -> change per second in either direction
+#   sustain                 -> seconds the condition has to hold before the alert is raised
+#   hysteresis              -> how far back past the threshold the value has to go to clear
+#   command/log             -> run through the shell / append a line, on raise and clear
+class Rule(NamedTuple):
+    name: str
+    match: str = None
+    device: str = None
+    label: str = None
+    sensType: str = None
+    above: float = None
+    below: float = None
+    rate: float = None
+    sustain: float = 0.0
+    hysteresis: float = 0.0
+    severity: int = WARNING
+    command: str = None
+    log: str = None
+
+    def matches(self, info: RowInfo) -> bool:
+        return ((self.match is None or fnmatchcase(info.uid, self.match))
+                and (self.device is None or fnmatchcase(info.deviceName, self.device))
+                and (self.label is None or fnmatchcase(info.label, self.label))
+                and (self.sensType is None or info.sensType == self.sensType))
+
+def parseRule(entry: dict, index: int) -> Rule:
+    entry = dict(entry)
+    if "type" in entry:
+        entry["sensType"] = entry.pop("type")
+    if "for" in entry:
+        entry["sustain"] = entry.pop("for")
+    severity = entry.pop("severity", "warning")
+    if severity not in SEVERITIES[1:]:
+        raise ValueError(f"rule {index}: severity must be warning or critical")
+    unknown = set(entry) - set(Rule._fields)
+    if unknown:
+        raise ValueError(f"rule {index}: unknown keys {', '.join(sorted(unknown))}")
+    if all(entry.get(key) is None for key in ("above", "below", "rate")):
+        raise ValueError(f"rule {index}: needs above, below or rate")
+    entry.setdefault("name", f"rule {index}")
+    for key in ("above", "below", "rate", "sustain", "hysteresis"):
+        if entry.get(key) is not None:
+            entry[key] = float(entry[key])
+    return Rule(severity=SEVERITIES.index(severity), **entry)
+
+# alerting configuration, e.g.
+#   {"limits": true, "log": "~/sensmon-alerts.log", "command": "notify-send sensmon \"$SENSMON_ALERT\"",
+#    "rules": [{"name": "GPU hot", "match": "gpu*/temp", "above": 85, "for": 10, "hysteresis": 3}]}
+#   limits  -> also alert on the limits and alarms the hardware reports
+#   command/log -> defaults for every alert, rules may override them
+class AlertConfig(NamedTuple):
+    rules: tuple = ()
+    limits: bool = True
+    command: str = None
+    log: str = None
+
+# a missing file means hardware limits only, a broken one is reported and ignored
+def loadConfig(path: Path = None) -> AlertConfig:
+    path = path or configPath("alerts.json")
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return AlertConfig()
+    except (OSError, ValueError) as e:
+        print(f"sensmon: ignoring {path}: {e}", file=sys.stderr, flush=True)
+        return AlertConfig()
+    try:
+        rules = tuple(parseRule(entry, i) for i, entry in enumerate(data.get("rules", [])))
+        return AlertConfig(rules, bool(data.get("limits", True)), data.get("command"), data.get("log"))
+    except (AttributeError, TypeError, ValueError) as e:
+        print(f"sensmon: ignoring {path}: {e}", file=sys.stderr, flush=True)
+        return AlertConfig()
+
+# a raised or cleared alert
+class AlertEvent(NamedTuple):
+    timestamp: float
+    raised: bool
+    name: str
+    severity: int
+    uid: str
+    device: str
+    label: str
+    value: float
+    unit: str
+
+    def describe(self) -> str:
+        state = "raised" if self.raised else "cleared"
+        return f"{SEVERITIES[self.severity]} {state}: {self.name} on {self.device} {self.label} at {self.value:g} {self.unit}".rstrip()
+
+# one condition of one table row, thresholds are converted to raw units when compiled so
+# a check is a couple of comparisons per sample
+#   kind    -> "above", "below", "rate" or "alarm" (a hardware alarm attribute)
+#   trigger -> raises at or past it, clear -> clears once back past it (hysteresis),
+#              the attribute name for alarms
+class Check:
+    __slots__ = ("name", "row", "kind", "trigger", "clear", "sustain", "severity", "command", "log", "since", "active", "previous")
+
+    def __init__(self, name: str, row: int, kind: str, trigger, clear, sustain: float, severity: int,
+                 command: str = None, log: str = None) -> None:
+        self.name = name
+        self.row = row
+        self.kind = kind
+        self.trigger = trigger
+        self.clear = clear
+        self.sustain = sustain
+        self.severity = severity
+        self.command = command
+        self.log = log
+        # when the condition started to hold, whether the alert is raised, (value, time) of the last sample
+        self.since = None
+        self.active = False
+        self.previous = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.name, self.row, self.kind)
+
+    # returns True when the alert was raised, False when it cleared, None otherwise
+    def evaluate(self, value: float, now: float):
+        kind = self.kind
+        if kind == "above":
+            hit = value > self.clear if self.active else value >= self.trigger
+        elif kind == "below":
+            hit = value < self.clear if self.active else value <= self.trigger
+        elif kind == "rate":
+            previous = self.previous
+            self.previous = (value, now)
+            if previous is None or now <= previous[1]:
+                return None
+            rate = abs(value - previous[0]) / (now - previous[1])
+            hit = rate > self.clear if self.active else rate >= self.trigger
+        else:
+            hit = bool(value)
+
+        if hit:
+            if self.active:
+                return None
+            if self.since is None:
+                self.since = now
+            if now - self.since >= self.sustain:
+                self.active = True
+                return True
+            return None
+
+        self.since = None
+        if self.active:
+            self.active = False
+            return False
+        return None
+
+# runs alert commands and writes alert logs on its own thread, one at a time, so a slow
+# command or disk never holds up sampling
+class ActionRunner(threading.Thread):
+    def __init__(self) -> None:
+        super().__init__(name="sensmon-alerts", daemon=True)
+        self.actions = queue.SimpleQueue()
+        self.start()
+
+    def submit(self, event: AlertEvent, command: str, log: str) -> None:
+        self.actions.put((event, command, log))
+
+    def run(self) -> None:
+        while True:
+            action = self.actions.get()
+            if action is None:
+                return
+            event, command, log = action
+            if log:
+                self.writeLog(event, log)
+            if command:
+                self.runCommand(event, command)
+
+    def writeLog(self, event: AlertEvent, log: str) -> None:
+        stamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(event.timestamp))
+        try:
+            with open(os.path.expanduser(log), "a") as file:
+                file.write(f"{stamp} {event.uid} {event.describe()}\n")
+        except OSError as e:
+            print(f"sensmon: cannot write alert log {log}: {e}", file=sys.stderr, flush=True)
+
+    # the event is passed in SENSMON_ALERT* variables, the command's output goes to stderr so it
+    # never ends up in headless JSON lines
+    def runCommand(self, event: AlertEvent, command: str) -> None:
+        env = dict(os.environ,
+                   SENSMON_ALERT=event.describe(),
+                   SENSMON_ALERT_STATE="raised" if event.raised else "cleared",
+                   SENSMON_ALERT_NAME=event.name,
+                   SENSMON_ALERT_SEVERITY=SEVERITIES[event.severity],
+                   SENSMON_ALERT_SENSOR=event.uid,
+                   SENSMON_ALERT_VALUE=f"{event.value:g}")
+        try:
+            subprocess.run(command, shell=True, env=env, stdin=subprocess.DEVNULL, stdout=sys.stderr,
+                           timeout=COMMAND_TIMEOUT)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"sensmon: alert command failed: {e}", file=sys.stderr, flush=True)
+
+    def stop(self) -> None:
+        self.actions.put(None)
+
+# checks every fresh sample against the hardware limits and the user's rules
+# rules are compiled into Checks per table row whenever rows are added, update() then only
+# visits the checks of the rows that were just sampled
+#
+# active() is the per-row state snapshots carry: row -> (severity, description) of the
+# worst raised alert, a new dict whenever it changed
+# the ActionRunner is started with the first alert that has a command or log
+class AlertEngine:
+    def __init__(self, table: SensorTable, config: AlertConfig = None) -> None:
+        self.table = table
+        self.config = config if config is not None else loadConfig()
+        self.runner = None
+        # table row -> [Check], and the checks of hardware alarm attributes
+        self.checks = {}
+        self.alarmChecks = []
+        self.raised = {}
+        self.state = {}
+        self.changed = False
+
+    # (re)build the checks for the current rows, raised alerts of existing checks stay raised
+    #   limits -> table row -> hardware limits in raw units, see Provider.limits()
+    def compile(self, limits: dict) -> None:
+        old = {check.key: check for checks in self.checks.values() for check in checks}
+        checks = {}
+        for row, info in enumerate(self.table.rows):
+            if info.retired:
+                continue
+            compiled = self.compileRow(row, info, limits.get(row, {}))
+            if compiled:
+                checks[row] = [old.get(check.key, check) for check in compiled]
+        self.checks = checks
+        self.alarmChecks = [check for rowChecks in checks.values() for check in rowChecks if check.kind == "alarm"]
+
+        # alerts of rows that went away
+        for key in [key for key in self.raised if key[1] not in checks]:
+            del self.raised[key]
+            self.changed = True
+
+    def compileRow(self, row: int, info: RowInfo, limits: dict) -> list:
+        config = self.config
+        scale = info.scale
+        compiled = []
+        if config.limits:
+            for limit, (kind, severity, name, hystName) in LIMIT_RULES.items():
+                value = limits.get(limit)
+                if value is None:
+                    continue
+                margin = abs(value) * LIMIT_HYSTERESIS
+                clear = min(limits.get(hystName, value - margin), value) if kind == "above" else value + margin
+                compiled.append(Check(name, row, kind, value, clear, 0.0, severity, config.command, config.log))
+            for alarm in limits.get("alarms", ()):
+                compiled.append(Check(alarm.replace("_", " "), row, "alarm", alarm, None, 0.0, ALARM_SEVERITIES.get(alarm, WARNING),
+                                      config.command, config.log))
+
+        for rule in config.rules:
+            if not rule.matches(info):
+                continue
+            command = rule.command if rule.command is not None else config.command
+            log = rule.log if rule.log is not None else config.log
+            hysteresis = rule.hysteresis * scale
+            if rule.above is not None:
+                compiled.append(Check(rule.name, row, "above", rule.above * scale, rule.above * scale - hysteresis,
+                                      rule.sustain, rule.severity, command, log))
+            if rule.below is not None:
+                compiled.append(Check(rule.name, row, "below", rule.below * scale, rule.below * scale + hysteresis,
+                                      rule.sustain, rule.severity, command, log))
+            if rule.rate is not None:
+                compiled.append(Check(rule.name, row, "rate", rule.rate * scale, max(rule.rate * scale - hysteresis, 0),
+                                      rule.sustain, rule.severity, command, log))
+        return compiled
+
+    # evaluate the checks of the freshly sampled rows, unread rows (NaN) are skipped
+    def update(self, rows, now: float) -> None:
+        checks = self.checks
+        if not checks:
+            return
+        cur = self.table.cur
+        for row in rows:
+            rowChecks = checks.get(row)
+            if rowChecks is None:
+                continue
+            value = float(cur[row])
+            if value != value:
+                continue
+            for check in rowChecks:
+                if check.kind != "alarm":
+                    self.transition(check, check.evaluate(value, now), value)
+
+    # hardware alarm attributes currently set, table row -> names, see Provider.alarms()
+    def updateAlarms(self, raised: dict, now: float) -> None:
+        cur = self.table.cur
+        for check in self.alarmChecks:
+            self.transition(check, check.evaluate(check.trigger in raised.get(check.row, ()), now), float(cur[check.row]))
+
+    def transition(self, check: Check, raised, value: float) -> None:
+        if raised is None:
+            return
+        if raised:
+            self.raised[check.key] = check
+        else:
+            self.raised.pop(check.key, None)
+        self.changed = True
+
+        if check.command or check.log:
+            if self.runner is None:
+                self.runner = ActionRunner()
+            info = self.table.rows[check.row]
+            event = AlertEvent(time.time(), raised, check.name, check.severity, info.uid, info.deviceName, info.label,
+                               round(value / info.scale, 3), info.unit)
+            self.runner.submit(event, check.command, check.log)
+
+    # row -> (severity, description) of its raised alerts, the most severe first
+    def active(self) -> dict:
+        if self.changed:
+            self.changed = False
+            state = {}
+            for check in sorted(self.raised.values(), key=lambda check: -check.severity):
+                severity, text = state.get(check.row, (check.severity, ""))
+                state[check.row] = (severity, f"{text}, {check.name}" if text else f"{SEVERITIES[check.severity].capitalize()}: {check.name}")
+            self.state = state
+        return self.state
+
+    def close(self) -> None:
+        if self.runner is not None:
+            self.runner.stop()
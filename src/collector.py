@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from typing import NamedTuple
+
+import sensors
+import nvidiaGPU
+import shmbus
+from alerts import AlertEngine
+from engine import Engine
+from history import History
+from profiler import Profiler
+from providers import CpuFreqProvider, RaplProvider
+from recorder import Recorder
+from scheduler import PollScheduler
+from sensortable import SensorTable
+from stats import SensorStats
+from virtual import VirtualSensors
+
+# immutable result of one sampling pass
+#   devices -> device ids in display order (gpus first, then hwmon and the other providers, virtual sensors last)
+#   schema  -> RowInfo per table row
+#   current/minimum/maximum -> read-only arrays in display units, indexed like schema
+#   reads   -> total channel reads so far, to verify the scheduler's savings
+#   stale   -> read-only flags, rows whose provider missed its deadline and show their last value
+#              None for snapshots that do not track it (remote agents, replays)
+#   stats   -> read-only arrays in display units in stats.STATS order, None without statistics
+#   alerts  -> row -> (severity, description) of the rows with a raised alert, see alerts.py
+class Snapshot(NamedTuple):
+    timestamp: float
+    celsius: bool
+    devices: tuple
+    schema: tuple
+    current: object
+    minimum: object
+    maximum: object
+    reads: int
+    stale: object = None
+    stats: tuple = None
+    alerts: dict = None
+
+# owns the providers (hwmon, nvidia-smi, cpufreq, RAPL) and samples them through an Engine
+# on an asyncio loop running on a background thread
+# every channel is polled on its own adaptive interval (see PollScheduler), a snapshot is
+# published every `interval` seconds, only the newest snapshot is kept, if the consumer
+# falls behind older ones are dropped
+class Collector(threading.Thread):
+    # record -> append every snapshot to this file, see recorder.py
+    # bus -> also publish every snapshot to the shared memory bus of this name, see shmbus.py
+    def __init__(self, interval: float = 1.0, publish=None, nvStream: bool = True, adaptive: bool = True, profile: bool = False,
+                 record: str = None, bus: str = None) -> None:
+        super().__init__(name="sensmon-collector", daemon=True)
+        self.interval = interval
+        # called from the collector thread whenever a snapshot becomes pending
+        self.publish = publish
+
+        # every provider shares one table so each tick is a single batched update
+        self.table = SensorTable()
+        self.hwmon = sensors.HwmonProvider(self.table)
+        self.nvidia = None
+        providers = [self.hwmon, CpuFreqProvider(self.table), RaplProvider(self.table)]
+        if nvidiaGPU.available():
+            # gpus are shown first
+            self.nvidia = nvidiaGPU.NvidiaProvider(self.table, nvStream, int(interval * 1000))
+            providers.insert(0, self.nvidia)
+        self.celsius = True
+        self.history = History(self.table)
+        self.scheduler = PollScheduler(self.table, fixed=None if adaptive else interval)
+        self.profiler = Profiler(profile)
+        self.stats = SensorStats(self.table)
+        self.alerts = AlertEngine(self.table)
+        self.virtual = VirtualSensors(self.table)
+        self.engine = Engine(self.table, providers, self.scheduler, self.profiler, self.stats, self.alerts, self.virtual)
+        self.recorder = Recorder(record) if record else None
+        self.bus = shmbus.BusPublisher(bus) if bus else None
+
+        self.lock = threading.Lock()
+        self.latest = None
+        self.pending = False
+        self.resetRequested = False
+        self.publishNow = False
+        self.running = True
+        # set from any thread through wake(), once the loop runs
+        self.loop = None
+        self.wakeEvent = None
+
+    def run(self) -> None:
+        asyncio.run(self.main())
+
+    async def main(self) -> None:
+        self.wakeEvent = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        try:
+            await self.engine.discover()
+
+            nextPublish = time.monotonic()
+            while self.running:
+                now = time.monotonic()
+                await self.engine.poll(now)
+
+                if now >= nextPublish or self.publishNow:
+                    self.publishNow = False
+                    await self.sample()
+                    nextPublish = max(nextPublish + self.interval, now)
+
+                timeout = min(self.scheduler.nextDue(), nextPublish) - time.monotonic()
+                if timeout > 0 and not self.wakeEvent.is_set():
+                    try:
+                        await asyncio.wait_for(self.wakeEvent.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                self.wakeEvent.clear()
+        finally:
+            self.loop = None
+            self.engine.close()
+            if self.recorder:
+                self.recorder.close()
+            if self.bus:
+                self.bus.close()
+
+    def wake(self) -> None:
+        loop = self.loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self.wakeEvent.set)
+            except RuntimeError:
+                # the loop already closed
+                pass
+
+    async def sample(self) -> None:
+        profiling = self.profiler.enabled
+        start = time.monotonic_ns() if profiling else 0
+        await self.engine.rescan()
+        if profiling:
+            rescanned = time.monotonic_ns()
+            self.profiler.record("rescan", rescanned - start)
+
+        self.alerts.updateAlarms(self.engine.alarms(), time.monotonic())
+
+        now = time.time()
+        self.history.append(now)
+
+        # resets are applied here so they never race with a read
+        if self.resetRequested:
+            self.resetRequested = False
+            self.table.reset()
+            self.stats.reset()
+
+        # the schema and the values are taken together, a rescan on a provider's worker thread
+        # may add rows in between, which would make the values wider than the schema
+        with self.table.lock:
+            schema = self.table.schema
+            current, minimum, maximum = self.table.display(self.celsius)
+            # recordings and the bus always hold celsius
+            if self.recorder or self.bus:
+                celsius = (current, minimum, maximum) if self.celsius else self.table.display(True)
+        snapshot = Snapshot(now, self.celsius, self.engine.devices(), schema, current, minimum, maximum,
+                            self.scheduler.reads, self.table.staleRows(), self.stats.display(self.celsius), self.alerts.active())
+        if profiling:
+            self.profiler.record("snapshot", time.monotonic_ns() - rescanned)
+
+        if self.recorder:
+            self.recorder.append(snapshot, celsius[0])
+        if self.bus:
+            self.bus.publish(snapshot, *celsius)
+
+        with self.lock:
+            self.latest = snapshot
+            notify = not self.pending
+            self.pending = True
+
+        if notify and self.publish:
+            self.publish()
+
+    # returns the newest snapshot and marks it consumed, None if nothing was sampled yet
+    def takeSnapshot(self):
+        with self.lock:
+            self.pending = False
+            return self.latest
+
+    # reset min/max and the statistics on the next pass and sample immediately
+    def requestReset(self) -> None:
+        self.resetRequested = True
+        self.publishNow = True
+        self.wake()
+
+    # switch temperature units, takes effect with an immediate resample
+    def setCelsius(self, celsius: bool) -> None:
+        self.celsius = celsius
+        self.publishNow = True
+        self.wake()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wake()
@@ -0,0 +1,7 @@
+import os
+from pathlib import Path
+
+# the user's config file `name` in ~/.config/sensmon, following XDG_CONFIG_HOME
+def configPath(name: str) -> Path:
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return Path(base) / "sensmon" / name
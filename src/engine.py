@@ -0,0 +1,283 @@
+import asyncio
+import queue
+import sys
+import threading
+import time
+
+from profiler import Profiler
+from scheduler import PollScheduler
+from sensortable import SensorTable
+from alerts import AlertEngine
+from stats import SensorStats
+from virtual import VirtualSensors
+
+# runs a provider's blocking calls one at a time, a daemon thread so a read stuck in the
+# kernel never holds up exiting (ThreadPoolExecutor workers are joined at exit)
+# workers given the same `calls` queue take turns on it, see readerpool.py
+class Worker(threading.Thread):
+    def __init__(self, name: str, calls: queue.SimpleQueue = None) -> None:
+        super().__init__(name=name, daemon=True)
+        self.calls = calls if calls is not None else queue.SimpleQueue()
+        self.start()
+
+    def run(self) -> None:
+        while True:
+            call = self.calls.get()
+            if call is None:
+                return
+            loop, future, function, args = call
+            try:
+                result = function(*args)
+            except BaseException as e:
+                self.resolve(loop, future, None, e)
+            else:
+                self.resolve(loop, future, result, None)
+
+    @staticmethod
+    def resolve(loop, future, result, error) -> None:
+        def done() -> None:
+            if future.done():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        try:
+            loop.call_soon_threadsafe(done)
+        except RuntimeError:
+            # the loop already closed
+            pass
+
+    async def call(self, function, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.calls.put((loop, future, function, args))
+        return await future
+
+    def stop(self) -> None:
+        self.calls.put(None)
+
+# a source of table rows, e.g. hwmon or nvidia-smi
+# the Engine calls discover() once, then sample() with the provider's rows that are due and
+# rescan() once per published snapshot, every provider runs concurrently with the others
+#
+# rows are added from discover() and rescan(), values are stored raw into table.cur by
+# sample() and folded into min/max by the engine, blocking file reads belong in blocking()
+# so a stuck read only holds up its own provider, or in a ReaderPool (see readerpool.py)
+# so it holds up nothing
+class Provider:
+    # phase name in profiles
+    name = "provider"
+    # seconds sample() may take before its rows are served stale
+    deadline = 0.5
+
+    def __init__(self, table: SensorTable) -> None:
+        self.table = table
+        self.profiler = None
+        self.worker = None
+        # a sample or rescan that overran its deadline and is still running
+        self.pending = None
+        self.timeouts = 0
+
+    async def discover(self) -> None:
+        pass
+
+    # table rows to poll, they are read by sample() when due
+    def channels(self) -> list:
+        return []
+
+    # device ids in display order
+    def devices(self) -> list:
+        return []
+
+    # table row -> limits the hardware reports in raw units, keys like hwmon's "max", "crit", "min",
+    # and "alarms" -> names of the row's alarm attributes
+    def limits(self) -> dict:
+        return {}
+
+    # table row -> names of the hardware alarms currently set, refreshed by rescan()
+    def alarms(self) -> dict:
+        return {}
+
+    # store fresh raw values of `rows` in table.cur, returns the rows that keep their last
+    # value -> whether they are overdue and served stale, None when every row was read
+    async def sample(self, rows: list):
+        pass
+
+    # pick up devices that appeared or went away
+    async def rescan(self) -> None:
+        pass
+
+    async def blocking(self, function, *args):
+        if self.worker is None:
+            self.worker = Worker(f"sensmon-{self.name}")
+        return await self.worker.call(function, *args)
+
+    def close(self) -> None:
+        if self.worker is not None:
+            self.worker.stop()
+
+# samples every provider concurrently on one asyncio loop
+# channels are still polled on their own adaptive intervals (see PollScheduler), the due
+# rows are grouped by provider and each group gets the provider's deadline, a provider that
+# misses it keeps its last values with the stale flag set until a sample completes again,
+# so do the rows a provider reports as overdue
+# freshly sampled rows are folded into min/max and, with `stats`, the running statistics,
+# `alerts` checks them against the hardware limits and the user's rules, `virtual` sensors
+# are recomputed from the sampled rows before they are folded
+class Engine:
+    def __init__(self, table: SensorTable, providers: list, scheduler: PollScheduler, profiler: Profiler,
+                 stats: SensorStats = None, alerts: AlertEngine = None, virtual: VirtualSensors = None) -> None:
+        self.table = table
+        self.providers = providers
+        self.scheduler = scheduler
+        self.profiler = profiler
+        self.stats = stats
+        self.alerts = alerts
+        self.virtual = virtual
+        self.scheduled = -1
+        # table row -> provider
+        self.owner = {}
+        # (provider name, exception type) already reported
+        self.reported = set()
+        for provider in providers:
+            provider.profiler = profiler
+
+    async def discover(self) -> None:
+        start = time.monotonic_ns()
+        results = await asyncio.gather(*(provider.discover() for provider in self.providers), return_exceptions=True)
+        for provider, result in zip(self.providers, results):
+            if isinstance(result, Exception):
+                self.report(provider, result)
+        if self.profiler.enabled:
+            self.profiler.record("discovery", time.monotonic_ns() - start)
+
+    # keep the scheduler's channels in line with the table rows
+    def syncChannels(self, now: float) -> None:
+        if self.scheduled == self.table.generation:
+            return
+        if self.virtual is not None:
+            # adds and retires rows of its own
+            self.virtual.compile()
+        self.scheduled = self.table.generation
+
+        for provider in self.providers:
+            for row in provider.channels():
+                self.owner[row] = provider
+        for row, info in enumerate(self.table.rows):
+            if info.retired:
+                self.scheduler.remove(row)
+                self.owner.pop(row, None)
+            elif row not in self.scheduler.channels and row in self.owner:
+                self.scheduler.add(row, now)
+        if self.alerts is not None:
+            self.alerts.compile(self.limits())
+
+    # sample the channels that are due and fold them into min/max and the statistics
+    async def poll(self, now: float) -> None:
+        self.syncChannels(now)
+        due = self.scheduler.due(now)
+        if not due:
+            return
+
+        groups = {}
+        for channel in due:
+            provider = self.owner.get(channel.row)
+            if provider is not None:
+                groups.setdefault(provider, []).append(channel.row)
+        sampled = await asyncio.gather(*(self.sample(provider, rows) for provider, rows in groups.items()))
+
+        profiling = self.profiler.enabled
+        start = time.monotonic_ns() if profiling else 0
+        # stale rows only repeat their last value
+        fresh = [row for rows in sampled for row in rows]
+        if self.virtual is not None:
+            fresh += self.virtual.update([channel.row for channel in due], now)
+        self.table.update()
+        if fresh:
+            if self.stats is not None:
+                self.stats.update(fresh, now)
+            if self.alerts is not None:
+                self.alerts.update(fresh, now)
+        if profiling:
+            self.profiler.record("update", time.monotonic_ns() - start)
+        for channel in due:
+            self.scheduler.sampled(channel, now)
+
+    # runs `work` until the provider's deadline, returns (whether it completed in time, its result)
+    # work that overruns keeps running, the provider is skipped until it finished
+    async def guarded(self, provider: Provider, work) -> tuple:
+        task = asyncio.ensure_future(work)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), provider.deadline)
+        except asyncio.TimeoutError:
+            provider.pending = task
+            provider.timeouts += 1
+            task.add_done_callback(lambda task: self.finished(provider, task))
+            return (False, None)
+        except Exception as e:
+            self.report(provider, e)
+            return (False, None)
+        return (True, result)
+
+    # retrieves the outcome of an overrun, so a failure is reported rather than dropped
+    def finished(self, provider: Provider, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.report(provider, task.exception())
+
+    # a failing provider keeps failing every sample, each kind of error is printed once
+    def report(self, provider: Provider, error: Exception) -> None:
+        key = (provider.name, type(error))
+        if key in self.reported:
+            return
+        self.reported.add(key)
+        print(f"sensmon: {provider.name} failed: {type(error).__name__}: {error}", file=sys.stderr, flush=True)
+
+    # returns the rows of `rows` that hold fresh values
+    async def sample(self, provider: Provider, rows: list) -> list:
+        if provider.pending is not None and not provider.pending.done():
+            self.table.setStale(rows, True)
+            return []
+        provider.pending = None
+
+        start = time.monotonic_ns()
+        completed, late = await self.guarded(provider, provider.sample(rows))
+        if not completed:
+            self.table.setStale(rows, True)
+            return []
+        if self.profiler.enabled:
+            self.profiler.record(provider.name, time.monotonic_ns() - start)
+        if late:
+            self.table.setStale([row for row, overdue in late.items() if overdue], True)
+            rows = [row for row in rows if row not in late]
+        self.table.setStale(rows, False)
+        return rows
+
+    async def rescan(self) -> None:
+        for provider in self.providers:
+            if provider.pending is None or provider.pending.done():
+                provider.pending = None
+                await self.guarded(provider, provider.rescan())
+
+    # device ids of every provider in display order
+    def devices(self) -> tuple:
+        devices = tuple(device for provider in self.providers for device in provider.devices())
+        return devices + tuple(self.virtual.devices()) if self.virtual is not None else devices
+
+    def limits(self) -> dict:
+        limits = {}
+        for provider in self.providers:
+            limits.update(provider.limits())
+        return limits
+
+    def alarms(self) -> dict:
+        alarms = {}
+        for provider in self.providers:
+            alarms.update(provider.alarms())
+        return alarms
+
+    def close(self) -> None:
+        for provider in self.providers:
+            provider.close()
+        if self.alerts is not None:
+            self.alerts.close()
@@ -0,0 +1,528 @@
+import math
+import time
+from array import array
+from bisect import bisect_left
+
+from PyQt6.QtCore import QPointF, QRectF, QSize, Qt, QTimer
+from PyQt6.QtGui import QColor, QImage, QPainter, QPen, QPolygonF, QTransform
+from PyQt6.QtWidgets import QWidget
+
+from sensortable import RowInfo, displayUnit
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# series colors, cycled through as channels are added
+COLORS = ("#4e9af1", "#f28e2b", "#59a14f", "#e15759", "#b07aa1", "#edc948", "#76b7b2", "#ff9da7", "#9c755f", "#bab0ac")
+
+# ms between frames while the graph is shown, ~60 fps
+FRAME = 16
+
+# visible time span in seconds, the mouse wheel steps through these
+SPANS = (10, 30, 60, 300, 600, 1800, 3600, 3 * 3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600)
+DEFAULT_SPAN = 600
+
+# raw points kept per series, the oldest half is dropped once it is reached
+MAX_POINTS = 1000000
+
+# seconds between time axis ticks, the smallest one giving at most 8 ticks is used
+TIME_STEPS = (1, 2, 5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 3 * 3600, 6 * 3600, 12 * 3600, 86400)
+
+# pixel columns the plot layer reaches past the right edge, it is scrolled that far before
+# being drawn again
+RESERVE = 256
+
+# plot area insets for the axis labels, in pixels
+LEFT, RIGHT, TOP, BOTTOM = 64, 12, 12, 24
+
+# points as a QPolygonF, written in place when numpy is around
+def polygon(x, y) -> QPolygonF:
+    n = len(x)
+    if np is None:
+        return QPolygonF([QPointF(a, b) for a, b in zip(x, y)])
+    poly = QPolygonF()
+    poly.resize(n)
+    if n:
+        pointer = poly.data()
+        pointer.setsize(n * 16)
+        points = np.frombuffer(pointer, dtype=np.float64).reshape(n, 2)
+        points[:, 0] = x
+        points[:, 1] = y
+    return poly
+
+# min and max of the points of every pixel column, column = floor((t - origin) / step)
+# returns (columns, minimums, maximums), columns ascending
+def decimate(times, values, origin: float, step: float) -> tuple:
+    if np is not None:
+        times = np.asarray(times)
+        values = np.asarray(values)
+        valid = ~np.isnan(values)
+        times, values = times[valid], values[valid]
+        if not len(times):
+            return (np.zeros(0), np.zeros(0), np.zeros(0))
+        columns = np.floor((times - origin) / step)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+        return (columns[starts], np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts))
+
+    columns, low, high = array('d'), array('d'), array('d')
+    for t, v in zip(times, values):
+        if v != v:
+            continue
+        column = math.floor((t - origin) / step)
+        if columns and columns[-1] == column:
+            low[-1] = min(low[-1], v)
+            high[-1] = max(high[-1], v)
+        else:
+            columns.append(column)
+            low.append(v)
+            high.append(v)
+    return (columns, low, high)
+
+# step of about `count` round ticks between low and high
+def tickStep(low: float, high: float, count: int = 5) -> float:
+    raw = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 2.5, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude
+
+# one channel of a graph, values in display units
+# every point ever received is kept (up to MAX_POINTS) for zooming out, what is drawn is
+# a line through the min and max of every pixel column (columns/low/high), so no spike is
+# ever lost however far the graph is zoomed out, a new sample only extends or adjusts the
+# last column
+class Series:
+    def __init__(self, key, row: int, info: RowInfo, color: str) -> None:
+        self.key = key
+        self.row = row
+        self.info = info
+        self.label = f"{info.deviceName} {info.label}"
+        self.isTemp = info.sensType == "Temperature"
+        self.color = QColor(color)
+        self.size = 0
+        if np is not None:
+            self.times = np.zeros(1024)
+            self.values = np.zeros(1024)
+        else:
+            self.times = array('d')
+            self.values = array('d')
+        self.clearColumns()
+
+    def clearColumns(self) -> None:
+        self.columns = array('d')
+        self.low = array('d')
+        self.high = array('d')
+
+    @property
+    def last(self):
+        return self.times[self.size - 1] if self.size else None
+
+    def points(self, start: int = 0) -> tuple:
+        return (self.times[start:self.size], self.values[start:self.size])
+
+    # older points, e.g. from History, go in front of what is there
+    def prepend(self, times, values) -> None:
+        if not len(times):
+            return
+        if np is not None:
+            self.times = np.concatenate((np.asarray(times, dtype=float), self.times[:self.size]))
+            self.values = np.concatenate((np.asarray(values, dtype=float), self.values[:self.size]))
+            self.size = len(self.times)
+        else:
+            self.times = array('d', times) + self.times
+            self.values = array('d', values) + self.values
+            self.size = len(self.times)
+
+    def append(self, timestamp: float, value: float) -> None:
+        if self.size >= MAX_POINTS:
+            half = self.size // 2
+            if np is not None:
+                self.times[:self.size - half] = self.times[half:self.size]
+                self.values[:self.size - half] = self.values[half:self.size]
+            else:
+                del self.times[:half]
+                del self.values[:half]
+            self.size -= half
+
+        if np is not None:
+            if self.size == len(self.times):
+                self.times = np.concatenate((self.times, np.zeros(self.size)))
+                self.values = np.concatenate((self.values, np.zeros(self.size)))
+            self.times[self.size] = timestamp
+            self.values[self.size] = value
+        else:
+            self.times.append(timestamp)
+            self.values.append(value)
+        self.size += 1
+
+    def clear(self) -> None:
+        self.size = 0
+        if np is None:
+            self.times = array('d')
+            self.values = array('d')
+        self.clearColumns()
+
+    # °C <-> °F for temperature series, the columns have to be rebuilt afterwards
+    def convert(self, celsius: bool) -> None:
+        if not self.isTemp:
+            return
+        if np is not None:
+            values = self.values[:self.size]
+            values[:] = (values - 32) / 1.8 if celsius else values * 1.8 + 32
+            return
+        for i in range(self.size):
+            self.values[i] = (self.values[i] - 32) / 1.8 if celsius else self.values[i] * 1.8 + 32
+
+    # decimate the points from `start` on into pixel columns of `step` seconds
+    def rebuild(self, start: float, origin: float, step: float) -> None:
+        if np is not None:
+            first = int(np.searchsorted(self.times[:self.size], start))
+        else:
+            first = next((i for i in range(self.size) if self.times[i] >= start), self.size)
+        columns, low, high = decimate(*self.points(first), origin, step)
+        self.columns = array('d', columns)
+        self.low = array('d', low)
+        self.high = array('d', high)
+
+    # fold the newest point into the columns, returns the column it changed or None
+    def extend(self, timestamp: float, value: float, origin: float, step: float):
+        if value != value:
+            return None
+        column = math.floor((timestamp - origin) / step)
+        if self.columns and self.columns[-1] == column:
+            if self.low[-1] <= value <= self.high[-1]:
+                return None
+            if value < self.low[-1]:
+                self.low[-1] = value
+            else:
+                self.high[-1] = value
+            return column
+        self.columns.append(column)
+        self.low.append(value)
+        self.high.append(value)
+        return column
+
+    # min, max of every column from `column` on, in column/value coordinates
+    def line(self, column: float) -> QPolygonF:
+        first = bisect_left(self.columns, column)
+        if np is not None:
+            columns = np.frombuffer(self.columns, dtype=np.float64)[first:]
+            low = np.frombuffer(self.low, dtype=np.float64)[first:]
+            high = np.frombuffer(self.high, dtype=np.float64)[first:]
+            return polygon(np.repeat(columns, 2), np.column_stack((low, high)).ravel())
+        return polygon([c for c in self.columns[first:] for _ in (0, 1)],
+                       [v for pair in zip(self.low[first:], self.high[first:]) for v in pair])
+
+    # (min, max) of the columns from `column` on, None when there are none
+    def extent(self, column: float):
+        columns = self.columns
+        if not columns:
+            return None
+        if np is not None:
+            first = int(np.searchsorted(np.frombuffer(columns, dtype=np.float64), column))
+            if first >= len(columns):
+                return None
+            return (float(np.min(np.frombuffer(self.low, dtype=np.float64)[first:])),
+                    float(np.max(np.frombuffer(self.high, dtype=np.float64)[first:])))
+        first = next((i for i, c in enumerate(columns) if c >= column), None)
+        if first is None:
+            return None
+        return (min(self.low[first:]), max(self.high[first:]))
+
+# live time series of one or more sensors, fed with the snapshots the window receives
+# the newest sample is at the right edge and the mouse wheel zooms the visible span
+# `history` (collector.History) fills in what happened before the graph was opened and
+# when zooming out past the oldest point, for the series of source `historyKey`
+# live -> the right edge follows the wall clock, otherwise the newest snapshot (replays)
+#
+# the series are drawn into `layer`, an image RESERVE columns wider than the plot, which
+# every frame only blits at the current scroll offset, new samples redraw the columns they
+# touched and the layer is only drawn from scratch when the axes or the layout change
+class GraphWidget(QWidget):
+    def __init__(self, history=None, table=None, historyKey=None, live: bool = True, parent=None) -> None:
+        super().__init__(parent)
+        self.history = history
+        self.table = table
+        self.historyKey = historyKey
+        self.live = live
+        self.series = []
+        self.span = DEFAULT_SPAN
+        self.celsius = True
+        self.newest = None
+        # time of pixel column 0 and seconds per column, None until laid out
+        self.origin = None
+        self.step = None
+        # column at the layer's left edge, value range it was drawn for, None to redraw it
+        self.layer = None
+        self.layerFirst = 0
+        self.layerRange = None
+        # lowest column changed since the layer was drawn
+        self.dirtyFrom = None
+        self.setMinimumSize(480, 240)
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(FRAME)
+        self.timer.timeout.connect(self.update)
+
+    def addSeries(self, key, row: int, info: RowInfo, celsius: bool) -> None:
+        if any(series.key == key and series.row == row for series in self.series):
+            return
+        if celsius != self.celsius:
+            self.setCelsius(celsius)
+        series = Series(key, row, info, COLORS[len(self.series) % len(COLORS)])
+        self.series.append(series)
+        self.fill(series, self.end() - 2 * self.span)
+        self.relayout()
+
+    # history of a local series from `start` up to its oldest point
+    def fill(self, series: Series, start: float) -> None:
+        if self.history is None or series.key != self.historyKey:
+            return
+        end = series.times[0] if series.size else self.end()
+        if start >= end:
+            return
+        scale = self.table.scale[series.row]
+        times, values = [], []
+        # a bucket of the coarser tiers spans many samples, its min and max both become points
+        # so the columns keep the spikes its mean flattens
+        for segment in self.history.query(series.row, start, end):
+            for t, low, high in zip(segment.times, segment.min, segment.max):
+                if t < end:
+                    times.append(float(t))
+                    values.append(float(low) / scale)
+                    if high != low:
+                        times.append(float(t))
+                        values.append(float(high) / scale)
+        if series.isTemp and not self.celsius:
+            values = [v * 1.8 + 32 for v in values]
+        series.prepend(times, values)
+
+    def end(self) -> float:
+        if self.live or self.newest is None:
+            return time.time()
+        return self.newest
+
+    def plotRect(self) -> QRectF:
+        return QRectF(LEFT, TOP, max(self.width() - LEFT - RIGHT, 1), max(self.height() - TOP - BOTTOM, 1))
+
+    # one pixel column per `step` seconds, every series is decimated again for the new scale
+    # columns reach two spans back so zooming out by one step has something to show at once
+    def relayout(self) -> None:
+        self.step = self.span / self.plotRect().width()
+        start = self.end() - 2 * self.span
+        self.origin = math.floor(start / self.step) * self.step
+        for series in self.series:
+            series.rebuild(start, self.origin, self.step)
+        self.layerRange = None
+
+    def setCelsius(self, celsius: bool) -> None:
+        self.celsius = celsius
+        for series in self.series:
+            series.convert(celsius)
+        self.relayout()
+
+    # newest values of the series fed by source `key`
+    def appendSnapshot(self, key, snapshot) -> None:
+        if snapshot.celsius != self.celsius:
+            self.setCelsius(snapshot.celsius)
+
+        timestamp = float(snapshot.timestamp)
+        if not self.live:
+            self.newest = timestamp
+        current = snapshot.current
+        rewound = False
+        for series in self.series:
+            if series.key != key or series.row >= len(current):
+                continue
+            last = series.last
+            if last is not None and timestamp <= last:
+                if timestamp == last:
+                    continue
+                # a replay was seeked backwards
+                series.clear()
+                rewound = True
+            value = float(current[series.row])
+            series.append(timestamp, value)
+            if self.step is not None and not rewound:
+                column = series.extend(timestamp, value, self.origin, self.step)
+                if column is not None and (self.dirtyFrom is None or column < self.dirtyFrom):
+                    self.dirtyFrom = column
+
+        # start over once the columns hold four spans or the replay went back in time
+        if self.step is not None and (rewound or not 0 <= self.end() - self.origin <= 4 * self.span):
+            self.relayout()
+
+    def resizeEvent(self, event) -> None:
+        self.relayout()
+        super().resizeEvent(event)
+
+    def wheelEvent(self, event) -> None:
+        i = min(range(len(SPANS)), key=lambda i: abs(SPANS[i] - self.span))
+        i += -1 if event.angleDelta().y() > 0 else 1
+        span = SPANS[min(max(i, 0), len(SPANS) - 1)]
+        if span != self.span:
+            self.span = span
+            for series in self.series:
+                self.fill(series, self.end() - 2 * span)
+            self.relayout()
+
+    def showEvent(self, event) -> None:
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event) -> None:
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        if self.step is None:
+            return
+        plot = self.plotRect()
+
+        # first visible column, fractional so the graph scrolls smoothly between samples
+        first = (self.end() - self.span - self.origin) / self.step
+        low, high = self.valueRange(math.floor(first))
+        self.paintAxes(painter, plot, low, high)
+        self.updateLayer(plot, first, low, high)
+        painter.setClipRect(plot)
+        painter.drawImage(QPointF(plot.left() - (first - self.layerFirst), plot.top()), self.layer)
+        painter.setClipping(False)
+        self.paintLegend(painter, plot)
+
+    # range of the values from `column` on, widened to whole ticks so it rarely changes
+    def valueRange(self, column: int) -> tuple:
+        extents = [extent for extent in (series.extent(column) for series in self.series) if extent is not None]
+        if not extents:
+            return (0.0, 1.0)
+        low = min(extent[0] for extent in extents)
+        high = max(extent[1] for extent in extents)
+        margin = (high - low) * 0.05 or max(abs(high) * 0.05, 0.5)
+        step = tickStep(low - margin, high + margin)
+        return (math.floor((low - margin) / step) * step, math.ceil((high + margin) / step) * step)
+
+    def updateLayer(self, plot: QRectF, first: float, low: float, high: float) -> None:
+        size = QSize(int(plot.width()) + RESERVE, int(plot.height()))
+        ratio = self.devicePixelRatioF()
+        if self.layer is None or self.layer.deviceIndependentSize().toSize() != size or self.layer.devicePixelRatio() != ratio:
+            self.layer = QImage(size * ratio, QImage.Format.Format_ARGB32_Premultiplied)
+            self.layer.setDevicePixelRatio(ratio)
+            self.layerRange = None
+
+        if self.layerRange != (low, high) or not 0 <= first - self.layerFirst <= RESERVE:
+            self.layerFirst = math.floor(first)
+            self.layerRange = (low, high)
+            self.layer.fill(Qt.GlobalColor.transparent)
+            self.drawSeries(None)
+        elif self.dirtyFrom is not None:
+            self.drawSeries(self.dirtyFrom)
+        self.dirtyFrom = None
+
+    # every column on the layer, or the ones from `since` on after clearing them
+    def drawSeries(self, since) -> None:
+        painter = QPainter(self.layer)
+        if since is not None:
+            # the segment into column `since` starts one column earlier
+            clip = QRectF(since - self.layerFirst, 0, self.layer.width(), self.layer.height())
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            painter.fillRect(clip, Qt.GlobalColor.transparent)
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+            painter.setClipRect(clip)
+
+        low, high = self.layerRange
+        scale = self.layer.deviceIndependentSize().height() / (high - low)
+        # column c -> the center of pixel column c - layerFirst
+        painter.setTransform(QTransform(1, 0, 0, -scale, 0.5 - self.layerFirst, high * scale))
+        for series in self.series:
+            pen = QPen(series.color)
+            pen.setCosmetic(True)
+            painter.setPen(pen)
+            painter.drawPolyline(series.line(self.layerFirst - 1 if since is None else since - 1))
+        painter.end()
+
+    def paintAxes(self, painter: QPainter, plot: QRectF, low: float, high: float) -> None:
+        text = self.palette().text().color()
+        base = self.palette().base().color()
+        # opaque, translucent lines are much slower to draw
+        grid = QColor.fromRgbF(*(b + (t - b) * 0.16 for t, b in zip(text.getRgbF()[:3], base.getRgbF()[:3])))
+        height = painter.fontMetrics().height()
+
+        step = tickStep(low, high)
+        value = math.ceil(low / step) * step
+        while value <= high:
+            y = plot.bottom() - (value - low) / (high - low) * plot.height()
+            painter.setPen(grid)
+            painter.drawLine(QPointF(plot.left(), y), QPointF(plot.right(), y))
+            painter.setPen(text)
+            painter.drawText(QRectF(0, y - height / 2, LEFT - 6, height),
+                             Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, f"{round(value, 6):g}")
+            value += step
+
+        # seconds before the right edge
+        step = next((step for step in TIME_STEPS if self.span / step <= 8), TIME_STEPS[-1])
+        ago = 0
+        while ago <= self.span:
+            x = plot.right() - ago / self.span * plot.width()
+            painter.setPen(grid)
+            painter.drawLine(QPointF(x, plot.top()), QPointF(x, plot.bottom()))
+            painter.setPen(text)
+            painter.drawText(QRectF(x - 40, plot.bottom() + 2, 80, BOTTOM - 2), Qt.AlignmentFlag.AlignHCenter,
+                             "now" if ago == 0 else f"-{formatSpan(ago)}")
+            ago += step
+        painter.drawRect(plot)
+
+    def paintLegend(self, painter: QPainter, plot: QRectF) -> None:
+        metrics = painter.fontMetrics()
+        labels = []
+        for series in self.series:
+            value = series.values[series.size - 1] if series.size else math.nan
+            unit = displayUnit(series.info, self.celsius)
+            labels.append(f"{series.label}: {value:g} {unit}".rstrip() if value == value else f"{series.label}: -")
+        if not labels:
+            return
+
+        # keeps the labels readable over the lines
+        background = self.palette().base().color()
+        background.setAlpha(200)
+        width = max(metrics.horizontalAdvance(label) for label in labels)
+        painter.fillRect(QRectF(plot.left() + 1, plot.top() + 1, width + 24, len(labels) * metrics.height() + 8), background)
+
+        painter.setPen(self.palette().text().color())
+        y = plot.top() + 4
+        for series, label in zip(self.series, labels):
+            painter.fillRect(QRectF(plot.left() + 6, y + metrics.height() / 2 - 4, 8, 8), series.color)
+            painter.drawText(QPointF(plot.left() + 18, y + metrics.ascent()), label)
+            y += metrics.height()
+
+def formatSpan(seconds: float) -> str:
+    if seconds < 120:
+        return f"{seconds:g}s"
+    if seconds < 7200:
+        return f"{seconds / 60:g}m"
+    if seconds < 172800:
+        return f"{seconds / 3600:g}h"
+    return f"{seconds / 86400:g}d"
+
+# top-level window around a GraphWidget, titled after its series
+class GraphWindow(QWidget):
+    def __init__(self, history=None, table=None, historyKey=None, live: bool = True) -> None:
+        super().__init__(None, Qt.WindowType.Window)
+        self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        self.graph = GraphWidget(history, table, historyKey, live, self)
+        self.resize(900, 420)
+
+    def resizeEvent(self, event) -> None:
+        self.graph.setGeometry(self.rect())
+        super().resizeEvent(event)
+
+    def addSeries(self, key, row: int, info: RowInfo, celsius: bool) -> None:
+        self.graph.addSeries(key, row, info, celsius)
+        self.setWindowTitle(", ".join(series.label for series in self.graph.series))
+
+    def appendSnapshot(self, key, snapshot) -> None:
+        self.graph.appendSnapshot(key, snapshot)
@@ -0,0 +1,205 @@
+import argparse
+import json
+import math
+import os
+import signal
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import collector
+import shmbus
+from alerts import SEVERITIES
+from profiler import PROFILE_ENV
+from recorder import RecordingError
+from sensortable import displayUnit
+
+# sensor type -> OpenMetrics family, values are published in display units (celsius)
+FAMILIES = {
+    "Temperature": ("sensmon_temperature_celsius", "Temperature"),
+    "Voltage": ("sensmon_voltage_volts", "Voltage"),
+    "RPM": ("sensmon_fan_rpm", "Fan speed"),
+    "Power": ("sensmon_power_watts", "Power draw"),
+    "Clock": ("sensmon_clock_megahertz", "Clock frequency")
+}
+
+def jsonValue(value: float):
+    return value if math.isfinite(value) else None
+
+def schemaLine(snapshot: collector.Snapshot) -> str:
+    return json.dumps({"schema": [{
+        "id": info.uid,
+        "device": info.deviceName,
+        "type": info.sensType,
+        "label": info.label,
+        "unit": displayUnit(info, snapshot.celsius)
+    } for info in snapshot.schema if not info.retired]}, separators=(",", ":"))
+
+# "s" lists the sensors that show their last value because their provider missed its deadline
+# "a" maps sensors with a raised alert to its severity, see alerts.py
+def valuesLine(snapshot: collector.Snapshot) -> str:
+    current = snapshot.current.tolist()
+    line = {
+        "t": round(snapshot.timestamp, 3),
+        "r": snapshot.reads,
+        "v": {info.uid: jsonValue(v) for info, v in zip(snapshot.schema, current) if not info.retired}
+    }
+    stale = [info.uid for info, flag in zip(snapshot.schema, snapshot.stale) if flag and not info.retired]
+    if stale:
+        line["s"] = stale
+    if snapshot.alerts:
+        line["a"] = {snapshot.schema[row].uid: SEVERITIES[severity] for row, (severity, text) in snapshot.alerts.items()}
+    return json.dumps(line, separators=(",", ":"))
+
+def escapeLabel(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def openMetrics(snapshot: collector.Snapshot) -> bytes:
+    families = {}
+    for info, value in zip(snapshot.schema, snapshot.current.tolist()):
+        if info.sensType in FAMILIES and not info.retired and math.isfinite(value):
+            families.setdefault(info.sensType, []).append((info, value))
+
+    lines = []
+    for sensType, samples in families.items():
+        name, help = FAMILIES[sensType]
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"# HELP {name} {help}")
+        for info, value in samples:
+            lines.append(
+                f'{name}{{id="{escapeLabel(info.uid)}",device="{escapeLabel(info.deviceName)}",'
+                f'sensor="{escapeLabel(info.label)}"}} {value}'
+            )
+    lines.append("# EOF\n")
+    return "\n".join(lines).encode()
+
+# serves the body rendered for the latest sample, scrapes never touch sysfs
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.headless.metricsBody()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+# collector without any Qt, streams json lines to stdout and/or serves OpenMetrics
+class Headless:
+    # profile -> where the profile report goes on exit and on SIGUSR1, "-" for stdout
+    # (stderr while json lines are written), None to not profile
+    # record -> append every sample to this file, see recorder.py
+    # bus -> publish every sample to the shared memory bus of this name, see shmbus.py
+    # attach -> read the samples from this bus instead of sampling
+    def __init__(self, interval: float, listen: str = None, jsonLines: bool = True, count: int = 0, adaptive: bool = True,
+                 profile: str = None, record: str = None, bus: str = None, attach: str = None) -> None:
+        self.jsonLines = jsonLines
+        self.count = count
+        self.profile = profile
+        self.ready = threading.Event()
+        self.schema = None
+        self.server = None
+
+        # scrape body and the snapshot it was rendered from
+        self.bodyLock = threading.Lock()
+        self.body = b"# EOF\n"
+        self.bodySnapshot = None
+
+        if listen:
+            host, _, port = listen.rpartition(":")
+            self.server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), MetricsHandler)
+            self.server.daemon_threads = True
+            self.server.headless = self
+
+        if attach:
+            self.collector = shmbus.BusClient(attach, self.ready.set)
+        else:
+            self.collector = collector.Collector(interval, self.ready.set, adaptive=adaptive, profile=profile is not None,
+                                                 record=record, bus=bus)
+
+    # rendered at most once per sample no matter how many scrapes come in
+    def metricsBody(self) -> bytes:
+        snapshot = self.collector.latest
+        with self.bodyLock:
+            if snapshot is not None and snapshot is not self.bodySnapshot:
+                self.body = openMetrics(snapshot)
+                self.bodySnapshot = snapshot
+            return self.body
+
+    def dumpProfile(self, *args) -> None:
+        target = self.profile
+        stream = sys.stderr if self.jsonLines else sys.stdout
+        self.collector.profiler.dump(self.collector.table.schema, None if target == "-" else target, stream)
+        stream.flush()
+
+    def run(self) -> None:
+        if self.profile is not None:
+            signal.signal(signal.SIGUSR1, self.dumpProfile)
+        self.collector.start()
+        if self.server:
+            threading.Thread(target=self.server.serve_forever, name="sensmon-http", daemon=True).start()
+
+        written = 0
+        try:
+            while True:
+                self.ready.wait()
+                self.ready.clear()
+                snapshot = self.collector.takeSnapshot()
+                if snapshot is None:
+                    continue
+
+                if self.jsonLines:
+                    if snapshot.schema is not self.schema:
+                        self.schema = snapshot.schema
+                        sys.stdout.write(schemaLine(snapshot) + "\n")
+                    sys.stdout.write(valuesLine(snapshot) + "\n")
+                    sys.stdout.flush()
+
+                written += 1
+                if self.count and written >= self.count:
+                    break
+        except (KeyboardInterrupt, BrokenPipeError):
+            pass
+        finally:
+            self.collector.stop()
+            # the recorder and the bus are closed by the collector thread
+            if self.collector.recorder or self.collector.bus:
+                self.collector.join(2)
+            if self.server:
+                self.server.shutdown()
+            if self.profile is not None:
+                self.dumpProfile()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="sensmon --headless", description="Sample sensors without the GUI.")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between samples (default 1)")
+    parser.add_argument("--listen", metavar="[HOST:]PORT", help="serve OpenMetrics on http://HOST:PORT/metrics")
+    parser.add_argument("--no-json", action="store_true", help="do not write json lines to stdout")
+    parser.add_argument("--count", type=int, default=0, help="exit after COUNT samples")
+    parser.add_argument("--fixed-rate", action="store_true", help="read every sensor each interval instead of adapting per sensor")
+    parser.add_argument("--profile", nargs="?", const="-", default=os.environ.get(PROFILE_ENV), metavar="FILE",
+                        help="time every phase and sensor read, the report is written on exit and on SIGUSR1 "
+                             "(stdout, or stderr while json lines are written, or FILE, json for *.json)")
+    parser.add_argument("--record", metavar="FILE", help="record every sample to FILE for replay with sensmon --replay")
+    parser.add_argument("--publish", nargs="?", const=shmbus.BUS_NAME, metavar="NAME",
+                        help=f"publish every sample to the shared memory bus NAME (default {shmbus.BUS_NAME})")
+    parser.add_argument("--attach", nargs="?", const=shmbus.BUS_NAME, metavar="NAME",
+                        help="read the samples of a sensmon publishing to the bus NAME instead of sampling")
+    args = parser.parse_args()
+    if args.attach and (args.publish or args.record):
+        parser.error("--attach cannot be combined with --publish or --record")
+
+    try:
+        headless = Headless(args.interval, args.listen, not args.no_json, args.count, not args.fixed_rate, args.profile, args.record,
+                            args.publish, args.attach)
+    except (OSError, RecordingError, shmbus.BusError) as e:
+        parser.error(str(e))
+    headless.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple
+
+from sensortable import SensorTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# (bucket width in seconds, number of buckets) per resolution, finest first
+# 1 s for 10 minutes, 10 s for 6 hours, 1 min for 7 days
+DEFAULT_TIERS = ((1, 600), (10, 2160), (60, 10080))
+
+# a chronological run of buckets, every field is a zero-copy view into the ring buffers
+# the views are overwritten once the ring wraps, copy them if they have to outlive that
+class Segment(NamedTuple):
+    times: object
+    mean: object
+    min: object
+    max: object
+
+# one resolution, a preallocated ring of buckets for every history slot (see History)
+# values are stored slot-major (slot * capacity + position) so a slot's history is contiguous
+# the finest tier keeps a single value per bucket, coarser tiers keep min/max/mean
+class HistoryTier:
+    def __init__(self, step: float, capacity: int, aggregate: bool) -> None:
+        self.step = step
+        self.capacity = capacity
+        self.aggregate = aggregate
+        self.slots = 0
+        self.head = 0
+        self.count = 0
+        self.bucket = None
+
+        if np is not None:
+            self.times = np.full(capacity, np.nan)
+            self.mean = np.empty((0, capacity), dtype=np.float32)
+            self.min = self.mean
+            self.max = self.mean
+            self.sum = np.zeros(0)
+            self.samples = np.zeros(0, dtype=np.int32)
+            self.accMin = np.zeros(0)
+            self.accMax = np.zeros(0)
+        else:
+            self.times = array('d', [float("nan")]) * capacity
+            self.mean = array('f')
+            self.min = self.mean
+            self.max = self.mean
+            self.sum = array('d')
+            self.samples = array('l')
+            self.accMin = array('d')
+            self.accMax = array('d')
+
+    # make room for more slots, existing views keep pointing at the old buffers
+    def resize(self, slots: int) -> None:
+        added = slots - self.slots
+        if added <= 0:
+            return
+
+        if np is not None:
+            block = np.full((added, self.capacity), np.nan, dtype=np.float32)
+            self.mean = np.concatenate((self.mean, block))
+            if self.aggregate:
+                self.min = np.concatenate((self.min, block))
+                self.max = np.concatenate((self.max, block))
+            else:
+                self.min = self.max = self.mean
+            self.sum = np.concatenate((self.sum, np.zeros(added)))
+            self.samples = np.concatenate((self.samples, np.zeros(added, dtype=np.int32)))
+            self.accMin = np.concatenate((self.accMin, np.full(added, np.inf)))
+            self.accMax = np.concatenate((self.accMax, np.full(added, -np.inf)))
+        else:
+            block = array('f', [float("nan")]) * (added * self.capacity)
+            self.mean = self.mean + block
+            if self.aggregate:
+                self.min = self.min + block
+                self.max = self.max + block
+            else:
+                self.min = self.max = self.mean
+            self.sum = self.sum + array('d', [0.0]) * added
+            self.samples = self.samples + array('l', [0]) * added
+            self.accMin = self.accMin + array('d', [float("inf")]) * added
+            self.accMax = self.accMax + array('d', [float("-inf")]) * added
+
+        self.slots = slots
+
+    # forget what a slot held, before it is handed to another row
+    def clear(self, slot: int) -> None:
+        if np is not None:
+            for data in {id(self.mean): self.mean, id(self.min): self.min, id(self.max): self.max}.values():
+                data[slot].fill(np.nan)
+        else:
+            base = slot * self.capacity
+            empty = array('f', [float("nan")]) * self.capacity
+            for data in {id(self.mean): self.mean, id(self.min): self.min, id(self.max): self.max}.values():
+                data[base:base + self.capacity] = empty
+        self.sum[slot] = 0.0
+        self.samples[slot] = 0
+        self.accMin[slot] = float("inf")
+        self.accMax[slot] = float("-inf")
+
+    def append(self, timestamp: float, values) -> None:
+        bucket = int(timestamp // self.step)
+        if self.bucket is not None and bucket != self.bucket:
+            self.flush()
+        self.bucket = bucket
+
+        n = self.slots
+        if np is not None:
+            v = values[:n]
+            valid = ~np.isnan(v)
+            self.sum += np.where(valid, v, 0.0)
+            self.samples += valid
+            if self.aggregate:
+                np.fmin(self.accMin, v, out=self.accMin)
+                np.fmax(self.accMax, v, out=self.accMax)
+            return
+
+        for row in range(n):
+            v = values[row]
+            if v == v:
+                self.sum[row] += v
+                self.samples[row] += 1
+                if v < self.accMin[row]:
+                    self.accMin[row] = v
+                if v > self.accMax[row]:
+                    self.accMax[row] = v
+
+    # close the open bucket into the ring position at head
+    def flush(self) -> None:
+        position = self.head
+        self.times[position] = self.bucket * self.step
+
+        if np is not None:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                self.mean[:, position] = self.sum / self.samples
+            if self.aggregate:
+                empty = self.samples == 0
+                self.min[:, position] = np.where(empty, np.nan, self.accMin)
+                self.max[:, position] = np.where(empty, np.nan, self.accMax)
+                self.accMin.fill(np.inf)
+                self.accMax.fill(-np.inf)
+            self.sum.fill(0.0)
+            self.samples.fill(0)
+        else:
+            nan = float("nan")
+            for row in range(self.slots):
+                i = row * self.capacity + position
+                count = self.samples[row]
+                self.mean[i] = self.sum[row] / count if count else nan
+                if self.aggregate:
+                    self.min[i] = self.accMin[row] if count else nan
+                    self.max[i] = self.accMax[row] if count else nan
+                    self.accMin[row] = float("inf")
+                    self.accMax[row] = float("-inf")
+                self.sum[row] = 0.0
+                self.samples[row] = 0
+
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    # oldest closed bucket still retained, None while empty
+    def oldest(self):
+        if self.count == 0:
+            return None
+        return self.times[(self.head - self.count) % self.capacity]
+
+    # chronological slot ranges of the ring, at most two
+    def spans(self) -> list:
+        if self.count < self.capacity:
+            return [(0, self.head)]
+        if self.head == 0:
+            return [(0, self.capacity)]
+        return [(self.head, self.capacity), (0, self.head)]
+
+    def view(self, data, slot: int, start: int, end: int):
+        if np is not None:
+            return data[slot, start:end]
+        base = slot * self.capacity
+        return memoryview(data)[base + start:base + end]
+
+    def query(self, slot: int, start: float, end: float) -> list:
+        times = self.times if np is not None else memoryview(self.times)
+        segments = []
+        for lo, hi in self.spans():
+            run = times[lo:hi]
+            a = lo + bisect_left(run, start)
+            b = lo + bisect_right(run, end)
+            if a < b:
+                segments.append(Segment(
+                    times[a:b],
+                    self.view(self.mean, slot, a, b),
+                    self.view(self.min, slot, a, b),
+                    self.view(self.max, slot, a, b)
+                ))
+        return segments
+
+# slots allocated at once, the number of slots doubles whenever they run out
+MIN_SLOTS = 64
+
+# fixed-memory history of every live table row at several resolutions
+# each tier downsamples the incoming samples on its own as they arrive, so memory is
+# constant no matter how long the monitor runs
+# rows get a slot in every tier, a retired row gives its slot back and the next new row
+# reuses it, so memory follows the number of live rows rather than every row ever added
+class History:
+    def __init__(self, table: SensorTable, tiers: tuple = DEFAULT_TIERS) -> None:
+        self.table = table
+        self.tiers = [HistoryTier(step, capacity, i > 0) for i, (step, capacity) in enumerate(tiers)]
+        self.lock = threading.Lock()
+        self.generation = -1
+        # table row -> slot, slot -> table row (-1 while free), free slots
+        self.slotOf = {}
+        self.rowOf = []
+        self.free = []
+        # value of every slot in the next append, free slots stay NaN
+        self.values = None
+        self.live = None
+        self.liveRows = None
+
+    # give new rows a slot and take them back from retired ones
+    def sync(self) -> None:
+        table = self.table
+        if self.generation == table.generation:
+            return
+        self.generation = table.generation
+
+        for row, info in enumerate(table.schema):
+            slot = self.slotOf.get(row)
+            if info.retired:
+                if slot is not None:
+                    del self.slotOf[row]
+                    self.rowOf[slot] = -1
+                    self.free.append(slot)
+            elif slot is None:
+                self.assign(row)
+
+        slots = self.tiers[0].slots
+        if np is not None:
+            rowOf = np.array(self.rowOf, dtype=np.intp)
+            self.live = np.flatnonzero(rowOf >= 0)
+            self.liveRows = rowOf[self.live]
+            self.values = np.full(slots, np.nan)
+
+    def assign(self, row: int) -> None:
+        if self.free:
+            slot = self.free.pop()
+            for tier in self.tiers:
+                tier.clear(slot)
+            self.rowOf[slot] = row
+        else:
+            slot = len(self.rowOf)
+            self.rowOf.append(row)
+            if slot >= self.tiers[0].slots:
+                for tier in self.tiers:
+                    tier.resize(max(MIN_SLOTS, 2 * tier.slots))
+        self.slotOf[row] = slot
+
+    # called by the tick owner after table.update()
+    def append(self, timestamp: float) -> None:
+        with self.lock:
+            self.sync()
+            cur = self.table.cur
+            if np is not None:
+                values = self.values
+                values[self.live] = cur[self.liveRows]
+            else:
+                nan = float("nan")
+                values = [cur[row] if row >= 0 else nan for row in self.rowOf]
+                values += [nan] * (self.tiers[0].slots - len(values))
+            for tier in self.tiers:
+                tier.append(timestamp, values)
+
+    # history of one row (index or uid) between start and end, from the finest tier that
+    # still reaches back to start, returned as a list of zero-copy Segments
+    def query(self, row, start: float, end: float = float("inf"), tier: int = None) -> list:
+        if isinstance(row, str):
+            row = self.table.index[row]
+
+        with self.lock:
+            if tier is None:
+                tier = len(self.tiers) - 1
+                for i, candidate in enumerate(self.tiers):
+                    oldest = candidate.oldest()
+                    if oldest is not None and oldest <= start:
+                        tier = i
+                        break
+            slot = self.slotOf.get(row)
+            if slot is None:
+                return []
+            return self.tiers[tier].query(slot, start, end)
+
+    # bytes held by the ring buffers
+    def memoryUsage(self) -> int:
+        total = 0
+        for tier in self.tiers:
+            for data in {id(tier.mean): tier.mean, id(tier.min): tier.min, id(tier.max): tier.max}.values():
+                total += data.nbytes if np is not None else len(data) * data.itemsize
+            total += tier.times.nbytes if np is not None else len(tier.times) * tier.times.itemsize
+        return total
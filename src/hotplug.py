@@ -0,0 +1,92 @@
+import ctypes
+import os
+import time
+from pathlib import Path
+
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+def mountType(path: Path) -> str:
+    target = os.path.realpath(path)
+    best, fsType = "", ""
+    try:
+        with open("/proc/self/mounts") as mounts:
+            for line in mounts:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                point = fields[1]
+                if (target == point or target.startswith(point.rstrip("/") + "/")) and len(point) > len(best):
+                    best, fsType = point, fields[2]
+    except OSError:
+        pass
+    return fsType
+
+# tells cheaply whether entries were added to or removed from the hwmon class directory
+# inotify is used where the filesystem reports changes, sysfs does not emit inotify events
+# for kernel-created entries and does not reliably bump the directory mtime, so there the
+# directory mtime and the entry -> symlink target listing are polled every pollInterval
+class HwmonWatcher:
+    def __init__(self, path: Path, pollInterval: float = 2.0) -> None:
+        self.path = path
+        self.pollInterval = pollInterval
+        self.fd = -1
+        self.lastPoll = 0.0
+        self.signature = self.currentSignature()
+
+        if mountType(path) != "sysfs":
+            self.fd = self.initInotify()
+
+    def initInotify(self) -> int:
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return -1
+            mask = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+            if libc.inotify_add_watch(fd, os.fsencode(self.path), mask) < 0:
+                os.close(fd)
+                return -1
+            return fd
+        except (OSError, AttributeError):
+            return -1
+
+    def currentSignature(self) -> tuple:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            entries = []
+            for entry in os.scandir(self.path):
+                try:
+                    entries.append((entry.name, os.readlink(entry.path)))
+                except OSError:
+                    entries.append((entry.name, ""))
+            return (mtime, frozenset(entries))
+        except OSError:
+            return (0, frozenset())
+
+    def changed(self) -> bool:
+        if self.fd >= 0:
+            try:
+                return bool(os.read(self.fd, 4096))
+            except BlockingIOError:
+                return False
+            except OSError:
+                return False
+
+        now = time.monotonic()
+        if now - self.lastPoll < self.pollInterval:
+            return False
+        self.lastPoll = now
+
+        signature = self.currentSignature()
+        if signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
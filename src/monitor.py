@@ -1,273 +1,303 @@
+import argparse
 import os
+import socket
 import sys
-import subprocess
-from PyQt6.QtWidgets import QApplication, QMainWindow, QTreeWidgetItem
-from PyQt6.QtCore import QSize, QTimer
-from PyQt6 import uic
-from PyQt6.QtGui import QIcon
-
-import sensors
-import nvidiaGPU
+import time
+from PyQt6.QtWidgets import QApplication, QComboBox, QFileDialog, QLabel, QMainWindow, QSlider
+from PyQt6.QtCore import QEvent, QObject, QSize, Qt, pyqtSignal
+
+import collector
+import remote
+import replay
+import shmbus
+from graph import GraphWindow
+from profiler import PROFILE_ENV, Profiler
+from recorder import RecordingError
+from sensormodel import HEADERS, STATS_COLUMN, SensorTreeModel
+# generated from ui/monitor.ui so startup does not parse xml, after editing the .ui run
+#   pyuic6 ui/monitor.ui -o ui/monitor_ui.py
+from ui.monitor_ui import Ui_MainWindow
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# file arguments are relative to where sensmon was started
+LAUNCH_DIR = os.getcwd()
 os.chdir(BASE_DIR)
 
-class MainWindow(QMainWindow):
-    def __init__(self) -> None:
+# bench/startup.py sets this to time launch -> first frame and launch -> first sample shown,
+# the window prints "frame" and "ready" when they are painted and quits after the latter
+STARTUP_PROBE = bool(os.environ.get("SENSMON_STARTUP_PROBE"))
+
+# profile from startup and dump the report here on exit, see profiler.py
+PROFILE = os.environ.get(PROFILE_ENV)
+
+# model source key of the local collector once remote hosts are shown
+LOCAL = "local"
+
+# replay speeds offered in the status bar, recorded seconds per second
+SPEEDS = (0, 1, 10, 60, 600, 3600)
+
+# carries the collector's and remote client's "snapshot pending" notifications onto the GUI thread
+class CollectorBridge(QObject):
+    snapshotReady = pyqtSignal()
+    remoteReady = pyqtSignal()
+
+class MainWindow(QMainWindow, Ui_MainWindow):
+    # connect -> agent addresses (see agent.py), every host then becomes a top-level node
+    # local -> also sample this machine
+    # record -> append every local sample to this file
+    # replayFile -> play a recording back instead of sampling, at `speed` recorded seconds per second
+    # bus -> publish every local sample to the shared memory bus of this name
+    # attach -> show the local samples of another sensmon publishing to this bus instead of sampling
+    def __init__(self, connect: list = None, local: bool = True, record: str = None, replayFile: str = None, speed: float = 1.0,
+                 bus: str = None, attach: str = None) -> None:
         super().__init__()
 
         self.darkMode = True
         self.isCelcius = True
 
-        self.hasNvidia = False
-        self.nvidia = None
-
-        self.components = sensors.HwmonManager()
-        self.components.findDevices()
-        self.sensorRows = {}
-        self.nvRows = {}
+        self.snapshot = None
+        self.framePainted = False
 
-        uic.loadUi('ui/monitor.ui', self)
+        self.setupUi(self)
         self.setWindowTitle("Sensmon")
-        self.treeWidget.setSelectionMode(self.treeWidget.SelectionMode.NoSelection)
-        self.treeWidget.setColumnWidth(0, 350)
-        self.treeWidget.setIndentation(40)
-        self.treeWidget.setIconSize(QSize(18, 18))
-        self.resize(800,1000)
+
+        # devices and groups are expanded as they are inserted
+        self.model = SensorTreeModel(self)
+        self.model.rowsInserted.connect(self.expandInserted)
+        self.treeView.setModel(self.model)
+        self.treeView.setSelectionMode(self.treeView.SelectionMode.NoSelection)
+        self.treeView.setColumnWidth(0, 350)
+        self.treeView.setIndentation(40)
+        self.treeView.setIconSize(QSize(18, 18))
+        self.resize(1200,1000)
+
+        # double-clicking a sensor graphs it, a sensor type group graphs all of its sensors
+        self.graphs = []
+        self.treeView.doubleClicked.connect(self.openGraph)
 
         self.actionExitProgram.triggered.connect(QApplication.quit)
         self.actionSwitchUnits.triggered.connect(self.switchUnits)
         self.actionSwitchTheme.triggered.connect(self.changeTheme)
         self.actionResetValues.triggered.connect(self.resetMinMax)
-
-        self.hasNvidia = self.detectNvidia()
-        if self.hasNvidia:
-            self.nvidia = nvidiaGPU.NvManager()
-            self.nvidia.refresh()
-            for gpu in self.nvidia.gpus.values():
-                self.addNvidiaEntry(gpu)
-
-        for hwmon in self.components.hwmonx:
-            self.addHwmonEntry(hwmon)
-
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.updateValues)
-        self.timer.start(1000)
-
-    def detectNvidia(self) -> bool:
-        try:
-            subprocess.check_output(["nvidia-smi"], stderr = subprocess.DEVNULL)
+        self.actionStatistics.toggled.connect(self.showStatistics)
+
+        # sampling runs on the collector thread, the GUI thread only applies the newest snapshot
+        self.bridge = CollectorBridge()
+        self.bridge.snapshotReady.connect(self.updateValues)
+        self.bridge.remoteReady.connect(self.updateRemote)
+        self.collector = None
+        self.remote = None
+        self.localKey = None
+        self.replay = None
+        if replayFile:
+            # takes the collector's place, the window cannot tell the difference
+            self.replay = self.collector = replay.Replay(replayFile, speed, self.bridge.snapshotReady.emit)
+            self.addReplayControls(replayFile, speed)
+        elif attach:
+            # takes the collector's place as well
+            self.collector = shmbus.BusClient(attach, self.bridge.snapshotReady.emit)
+        elif local:
+            self.collector = collector.Collector(1.0, self.bridge.snapshotReady.emit, profile=bool(PROFILE), record=record, bus=bus)
+        if connect:
+            self.remote = remote.RemoteClient(connect, self.bridge.remoteReady.emit)
+            if local:
+                self.localKey = LOCAL
+                self.addHost(LOCAL, socket.gethostname(), "local")
+            for host in self.remote.hosts:
+                self.addHost(host.address, host.address, "connecting")
+
+        # the collector thread times discovery, reads and nvidia-smi, the GUI thread
+        # adds applying snapshots and repainting the tree
+        self.profiler = self.collector.profiler if self.collector else Profiler(bool(PROFILE))
+        self.actionProfiling.setChecked(self.profiler.enabled)
+        self.actionProfiling.toggled.connect(self.profiler.enable)
+        self.actionDumpProfile.triggered.connect(self.dumpProfile)
+        self.treeView.viewport().installEventFilter(self)
+
+        if self.collector:
+            self.collector.start()
+        if self.remote:
+            self.remote.start()
+
+    def closeEvent(self, event) -> None:
+        if self.collector:
+            self.collector.stop()
+            # the recorder and the bus are closed by the collector thread
+            if not self.replay and (self.collector.recorder or self.collector.bus):
+                self.collector.join(2)
+        if self.remote:
+            self.remote.stop()
+        for window in list(self.graphs):
+            window.close()
+        if PROFILE:
+            self.profiler.dump(self.localSchema(), PROFILE)
+        super().closeEvent(event)
+
+    # per-sensor profile entries refer to local table rows
+    def localSchema(self) -> tuple:
+        return self.collector.table.schema if self.collector else ()
+
+    # seek bar, playback time and speed in the status bar
+    def addReplayControls(self, path: str, speed: float) -> None:
+        recording = self.replay.recording
+        self.setWindowTitle(f"Sensmon - {os.path.basename(path)}")
+
+        self.replayTime = QLabel()
+        self.seekBar = QSlider(Qt.Orientation.Horizontal)
+        self.seekBar.setRange(0, int(recording.end - recording.start))
+        self.seekBar.setMinimumWidth(240)
+        self.seekBar.actionTriggered.connect(self.seek)
+
+        speeds = sorted(set(SPEEDS) | {speed})
+        self.speedBox = QComboBox()
+        for value in speeds:
+            self.speedBox.addItem(f"{value:g}x" if value else "Paused", value)
+        self.speedBox.setCurrentIndex(speeds.index(speed))
+        self.speedBox.currentIndexChanged.connect(lambda i: self.replay.setSpeed(self.speedBox.itemData(i)))
+
+        for widget in (self.replayTime, self.seekBar, self.speedBox):
+            self.statusbar.addPermanentWidget(widget)
+
+    # clicks and drags on the seek bar, the slider position is already updated
+    def seek(self, action: int) -> None:
+        self.replay.seek(self.replay.recording.start + self.seekBar.sliderPosition())
+
+    def showReplayTime(self, snapshot: collector.Snapshot) -> None:
+        self.replayTime.setText(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.timestamp)))
+        if not self.seekBar.isSliderDown():
+            self.seekBar.setValue(int(snapshot.timestamp - self.replay.recording.start))
+
+    def addHost(self, key: str, label: str, status: str) -> None:
+        self.model.addHost(key, label)
+        self.model.setHostStatus(key, label, status)
+        self.treeView.expand(self.model.index(self.model.rowCount() - 1, 0))
+
+    # times repaints of the tree while profiling, and the first ones for bench/startup.py
+    def eventFilter(self, obj, event) -> bool:
+        if (self.profiler.enabled or STARTUP_PROBE) and event.type() == QEvent.Type.Paint and obj is self.treeView.viewport():
+            start = time.monotonic_ns()
+            self.treeView.viewportEvent(event)
+            if self.profiler.enabled:
+                self.profiler.record("paint", time.monotonic_ns() - start)
+            if STARTUP_PROBE:
+                self.probePainted()
             return True
-        except Exception:
-            return False
-
-    def addNvidiaEntry(self, gpu: nvidiaGPU.NvGPU) -> None:
-        entry = QTreeWidgetItem([f"{gpu.model} (GPU {gpu.id})"])
-        self.treeWidget.addTopLevelItem(entry)
-        
-        entryType = QTreeWidgetItem(["Temperature"])
-        entryType.setIcon(0, QIcon('../assets/icons/Temperature.svg'))
-        entry.addChild(entryType)
-        unit = "°C" if self.isCelcius else "°F" 
-
-        dataRow = QTreeWidgetItem([
-            "Temperature",
-            f"{self.convertTemp(gpu.temp.currentValue, self.isCelcius)} {unit}",
-            f"{self.convertTemp(gpu.temp.minValue, self.isCelcius)} {unit}",
-            f"{self.convertTemp(gpu.temp.maxValue, self.isCelcius)} {unit}"
-        ])
-
-        entryType.addChild(dataRow)
-        self.nvRows[f"GPU{gpu.id}_temp"] = (dataRow, gpu)
-        entryType.setExpanded(True)
-
-        entryType = QTreeWidgetItem(["Power"])
-        entryType.setIcon(0, QIcon('../assets/icons/Power.svg'))
-        entry.addChild(entryType)
-
-        dataRow = QTreeWidgetItem([
-            "Power",
-            f"{gpu.power.currentValue} W",
-            f"{gpu.power.minValue} W",
-            f"{gpu.power.maxValue} W"
-        ])
-
-        entryType.addChild(dataRow)
-        self.nvRows[f"GPU{gpu.id}_pwr"] = (dataRow, gpu)
-        entryType.setExpanded(True)
-
-        clockEntry = QTreeWidgetItem(["Clock"])
-        clockEntry.setIcon(0, QIcon('../assets/icons/Clock.svg'))
-        entry.addChild(clockEntry)
-        
-        gcRow = QTreeWidgetItem([
-            "Graphics",
-            f"{gpu.graphicsClock.currentValue} MHz",
-            f"{gpu.graphicsClock.minValue} MHz",
-            f"{gpu.graphicsClock.maxValue} MHz"
-        ])
-
-        mcRow = QTreeWidgetItem([
-            "Memory",
-            f"{gpu.memoryClock.currentValue} MHz",
-            f"{gpu.memoryClock.minValue} MHz",
-            f"{gpu.memoryClock.maxValue} MHz"
-        ])
-
-        clockEntry.addChild(gcRow)
-        clockEntry.addChild(mcRow)
-        self.nvRows[f"GPU{gpu.id}_gc"] = (gcRow, gpu)
-        self.nvRows[f"GPU{gpu.id}_mc"] = (mcRow, gpu)
-        
-        clockEntry.setExpanded(True)
-        entry.setExpanded(True)
-
-    def addHwmonEntry(self, hwmon: sensors.HwmonDevice) -> None:
-        device = QTreeWidgetItem([hwmon.name])
-        self.treeWidget.addTopLevelItem(device)
-        sensType = ""
-        entryType = QTreeWidgetItem([sensType])
-
-        for sensor in hwmon.sensors:
-            sensor.read()
-            if sensor.sensType != sensType:
-                entryType.setExpanded(True)
-                sensType = sensor.sensType
-                entryType = QTreeWidgetItem([sensType])
-                entryType.setIcon(0, QIcon(f'../assets/icons/{sensType}.svg'))
-                device.addChild(entryType)
-
-            dataRow = self.createSensorRow(sensor)
-
-            unique_id = f"{hwmon.id}_{sensor.label}"
-            self.sensorRows[unique_id] = (dataRow, sensor)
-
-            entryType.addChild(dataRow)
-
-        device.setExpanded(True)
-        entryType.setExpanded(True)
-
-    def createSensorRow(self, sensor:sensors.Sensor) -> QTreeWidgetItem:
-        tempDiv = 1000
-        voltDiv = 1000
-        clockDiv = 1000000
-
-        if sensor.sensType == "Temperature":
-            unit = "°C" if self.isCelcius else "°F" 
-            return QTreeWidgetItem([
-                sensor.label,
-                f"{self.convertTemp(sensor.getCurrent()/tempDiv, self.isCelcius)} {unit}",
-                f"{self.convertTemp(sensor.getMin()/tempDiv, self.isCelcius)} {unit}",
-                f"{self.convertTemp(sensor.getMax()/tempDiv, self.isCelcius)} {unit}"
-            ])
-
-        elif sensor.sensType == "Voltage":
-            return QTreeWidgetItem([
-                sensor.label,
-                f"{sensor.getCurrent()/voltDiv} V",
-                f"{sensor.getMin()/voltDiv} V",
-                f"{sensor.getMax()/voltDiv} V"
-            ])
-
-        elif sensor.sensType == "Clock":
-            return QTreeWidgetItem([
-                sensor.label,
-                f"{sensor.getCurrent()/clockDiv} MHz",
-                f"{sensor.getMin()/clockDiv} MHz",
-                f"{sensor.getMax()/clockDiv} MHz"
-            ])
-
-        elif sensor.sensType == "RPM":
-            return QTreeWidgetItem([
-                sensor.label,
-                f"{sensor.getCurrent()} RPM",
-                f"{sensor.getMin()} RPM",
-                f"{sensor.getMax()} RPM"
-            ])
-
-        return QTreeWidgetItem([
-            sensor.label,
-            f"{sensor.getCurrent()}",
-            f"{sensor.getMin()}",
-            f"{sensor.getMax()}"
-        ])
-
+        return super().eventFilter(obj, event)
+
+    def probePainted(self) -> None:
+        if not self.framePainted:
+            self.framePainted = True
+            print("frame", flush=True)
+        if self.snapshot is not None and self.model.rowCount():
+            print("ready", flush=True)
+            QApplication.quit()
+
+    # .json files get the full report as json, anything else the text report
+    def dumpProfile(self) -> None:
+        path, _ = QFileDialog.getSaveFileName(self, "Dump Profile", "sensmon-profile.txt", "Text (*.txt);;JSON (*.json)")
+        if path:
+            self.profiler.dump(self.localSchema(), path)
+
+    def expandInserted(self, parent, first: int, last: int) -> None:
+        for row in range(first, last + 1):
+            index = self.model.index(row, 0, parent)
+            if self.model.hasChildren(index):
+                self.treeView.expandRecursively(index)
+
+    # sysfs/nvidia reads per second since the previous snapshot, shows what adaptive polling saves
+    def showReadRate(self, snapshot: collector.Snapshot) -> None:
+        previous = self.snapshot
+        if previous is None or snapshot.timestamp <= previous.timestamp:
+            return
+        rate = (snapshot.reads - previous.reads) / (snapshot.timestamp - previous.timestamp)
+        channels = sum(1 for info in snapshot.schema if not info.retired)
+        message = f"{channels} channels, {rate:.1f} reads/s"
+        if self.remote:
+            message += f", {self.connectedHosts()}"
+        if self.profiler.enabled:
+            message += f"  |  {self.profiler.summary()}"
+        self.statusbar.showMessage(message)
+
+    # pulls the newest snapshot from the collector, stale ones were already dropped
     def updateValues(self) -> None:
-        if self.nvidia: 
-            self.nvidia.refresh()
-            for unique_id, (item, gpu) in self.nvRows.items():
-                if "_temp" in unique_id:
-                    unit = "°C" if self.isCelcius else "°F" 
-                    item.setText(1, f"{self.convertTemp(gpu.temp.currentValue,self.isCelcius)} {unit}")
-                    item.setText(2, f"{self.convertTemp(gpu.temp.minValue, self.isCelcius)} {unit}")
-                    item.setText(3, f"{self.convertTemp(gpu.temp.maxValue, self.isCelcius)} {unit}")
-                elif "_pwr" in unique_id:
-                    item.setText(1, f"{gpu.power.currentValue} W")
-                    item.setText(2, f"{gpu.power.minValue} W")
-                    item.setText(3, f"{gpu.power.maxValue} W")
-                elif "_gc" in unique_id:
-                    item.setText(1, f"{gpu.graphicsClock.currentValue} MHz")
-                    item.setText(2, f"{gpu.graphicsClock.minValue} MHz")
-                    item.setText(3, f"{gpu.graphicsClock.maxValue} MHz")
-                elif "_mc" in unique_id:
-                    item.setText(1, f"{gpu.memoryClock.currentValue} MHz")
-                    item.setText(2, f"{gpu.memoryClock.minValue} MHz")
-                    item.setText(3, f"{gpu.memoryClock.maxValue} MHz")
-                
-        for unique_id, (item, sensor) in self.sensorRows.items():
-            sensor.read()
-            tempDiv = 1000
-            voltDiv = 1000
-            clockDiv = 1000000
-            
-            if sensor.sensType == "Temperature":
-                vCurr = self.convertTemp(sensor.getCurrent()/tempDiv, self.isCelcius)
-                vMin = self.convertTemp(sensor.getMin()/tempDiv, self.isCelcius)
-                vMax = self.convertTemp(sensor.getMax()/tempDiv, self.isCelcius)
-                unit = ("°C" if self.isCelcius else "°F")
-            elif sensor.sensType == "Voltage":
-                vCurr = sensor.getCurrent()/voltDiv
-                vMin = sensor.getMin()/voltDiv
-                vMax = sensor.getMax()/voltDiv
-                unit = "V"
-            elif sensor.sensType == "Clock":
-                vCurr = sensor.getCurrent()/clockDiv
-                vMin = sensor.getMin()/clockDiv
-                vMax = sensor.getMax()/clockDiv
-                unit = "MHz"
+        snapshot = self.collector.takeSnapshot()
+        if snapshot is not None:
+            if self.profiler.enabled:
+                start = time.monotonic_ns()
+                self.applySnapshot(snapshot)
+                self.profiler.record("ui", time.monotonic_ns() - start)
             else:
-                vCurr = sensor.getCurrent()
-                vMin = sensor.getMin()
-                vMax = sensor.getMax()
-                unit = "RPM"
-
-            item.setText(1, f"{vCurr} {unit}")
-            item.setText(2, f"{vMin} {unit}")
-            item.setText(3, f"{vMax} {unit}")
+                self.applySnapshot(snapshot)
+
+    # the model only signals the rows whose values changed since the previous snapshot
+    def applySnapshot(self, snapshot: collector.Snapshot) -> None:
+        self.showReadRate(snapshot)
+        if self.replay:
+            self.showReplayTime(snapshot)
+        self.snapshot = snapshot
+        self.model.applySnapshot(snapshot, self.localKey)
+        for window in self.graphs:
+            window.appendSnapshot(self.localKey, snapshot)
+
+    # a new graph window, or with Ctrl held the sensors are added to the newest one
+    def openGraph(self, index) -> None:
+        sensors = self.model.sensorsAt(index)
+        if not sensors:
+            return
+        if self.graphs and QApplication.keyboardModifiers() & Qt.KeyboardModifier.ControlModifier:
+            window = self.graphs[-1]
+        else:
+            # recorded history is only kept for the local sensors, replays have none
+            local = self.collector and not self.replay
+            window = GraphWindow(self.collector.history if local else None, self.collector.table if local else None,
+                                 self.localKey, not self.replay)
+            window.destroyed.connect(lambda: self.graphs.remove(window))
+            self.graphs.append(window)
+        for key, row, info in sensors:
+            window.addSeries(key, row, info, self.isCelcius)
+            window.appendSnapshot(key, self.model.sources[key].snapshot)
+        window.show()
+        window.raise_()
+
+    def connectedHosts(self) -> str:
+        connected = sum(1 for host in self.remote.hosts if host.connected)
+        return f"{connected}/{len(self.remote.hosts)} agents connected"
+
+    # newest snapshot of every agent that sent values or connected/disconnected since the last call
+    def updateRemote(self) -> None:
+        for host, snapshot in self.remote.takeSnapshots():
+            if snapshot is not None:
+                self.model.applySnapshot(snapshot, host.address)
+                for window in self.graphs:
+                    window.appendSnapshot(host.address, snapshot)
+            label = host.address if host.name == host.address else f"{host.name} ({host.address})"
+            self.model.setHostStatus(host.address, label, "connected" if host.connected else "offline")
+        if not self.collector:
+            self.statusbar.showMessage(self.connectedHosts())
 
     def resetMinMax(self) -> None:
-        for i in self.components.hwmonx:
-            for j in i.sensors:
-                j.maxValue = j.currentValue
-                j.minValue = j.currentValue
-        if self.nvidia:
-            self.nvidia.resetValues()
+        if self.collector:
+            self.collector.requestReset()
+        if self.remote:
+            self.remote.requestReset()
 
-        self.updateValues()
-
-    def convertTemp(self, temp: float, isCelcius: bool) -> float:
-        if isCelcius:
-            return round(temp, 2)
-        return round((temp * 9/5) + 32, 2)
+    # mean, std dev, moving average and percentiles next to min/max
+    def showStatistics(self, shown: bool) -> None:
+        for column in range(STATS_COLUMN, len(HEADERS)):
+            self.treeView.setColumnHidden(column, not shown)
 
     def switchUnits(self) -> None:
         self.isCelcius = not self.isCelcius
-        self.updateValues()
+        if self.collector:
+            self.collector.setCelsius(self.isCelcius)
+        if self.remote:
+            self.remote.setCelsius(self.isCelcius)
 
     def changeTheme(self) -> None:
         self.darkMode = not self.darkMode
         self.applyStyle()
 
+    # row colors are set on the view, not on ::item, so alert highlighting stays visible
     def applyStyle(self) -> None:
         if self.darkMode:
             darkStyle = """
@@ -275,14 +305,10 @@ class MainWindow(QMainWindow):
                     color: white;
                     background-color: #292c30;
                 }
-                QTreeWidget {
-                    color: white 
-                }
-                QTreeWidget::item {
+                QTreeView {
+                    color: white;
                     background-color: #141618;
-                }
-                QTreeWidget::item:alternate {
-                    background-color: #1d1f22;
+                    alternate-background-color: #1d1f22;
                 }
             """
 
@@ -293,29 +319,49 @@ class MainWindow(QMainWindow):
                     color: black;
                     background-color: white;
                 }
-                QTreeWidget {
-                    background-color: #f7f7f7;
+                QTreeView {
                     color: black;
-                }
-                QTreeWidget::item {
                     background-color: #f2f2f2;
-                }
-                QTreeWidget::item:alternate {
-                    background-color: #d5d5d5;
+                    alternate-background-color: #d5d5d5;
                 }
             """
 
             self.setStyleSheet(lightStyle)
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(prog="sensmon")
+    parser.add_argument("--connect", action="append", metavar="ADDRESS",
+                        help="also show the sensors of the agent at [HOST:]PORT or unix:PATH, may be repeated")
+    parser.add_argument("--no-local", action="store_true", help="only show remote agents")
+    parser.add_argument("--record", metavar="FILE", help="record every local sample to FILE")
+    parser.add_argument("--replay", metavar="FILE", help="play back a recording made with --record")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, recorded seconds per second (default 1)")
+    parser.add_argument("--publish", nargs="?", const=shmbus.BUS_NAME, metavar="NAME",
+                        help=f"publish every local sample to the shared memory bus NAME (default {shmbus.BUS_NAME})")
+    parser.add_argument("--attach", nargs="?", const=shmbus.BUS_NAME, metavar="NAME",
+                        help="show the samples of a sensmon publishing to the bus NAME instead of sampling")
+    args, qtArgs = parser.parse_known_args()
+    if args.replay and (args.connect or args.record or args.publish or args.attach):
+        parser.error("--replay cannot be combined with --connect, --record, --publish or --attach")
+    if args.attach and (args.record or args.publish or args.no_local):
+        parser.error("--attach cannot be combined with --record, --publish or --no-local")
+    if args.speed < 0:
+        parser.error("--speed must not be negative")
+    record = args.record and os.path.join(LAUNCH_DIR, args.record)
+    replayFile = args.replay and os.path.join(LAUNCH_DIR, args.replay)
+
+    app = QApplication(sys.argv[:1] + qtArgs)
     app.setStyleSheet('''
         QWidget {
             font-size: 14px;
         }
     ''')
 
-    sensmon = MainWindow()
+    try:
+        sensmon = MainWindow(args.connect, not args.no_local or not args.connect, record, replayFile, args.speed, args.publish,
+                             args.attach)
+    except (OSError, RecordingError, shmbus.BusError) as e:
+        parser.error(str(e))
     sensmon.show()
 
     try:
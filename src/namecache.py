@@ -0,0 +1,61 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+def defaultPath() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "sensmon" / "devnames.json"
+
+# device identity, stable across reboots as long as the same hardware sits at the same bus address
+#   driver name + target of the hwmon device's `device` symlink
+def deviceIdentity(hwmonPath: Path, driverName: str) -> str:
+    try:
+        target = os.readlink(hwmonPath / "device")
+    except OSError:
+        target = os.path.realpath(hwmonPath)
+    return f"{driverName}:{target}"
+
+# display names resolved by HwmonManager.getDeviceDisplayName, memoized in-process and
+# persisted as json under $XDG_CACHE_HOME/sensmon/devnames.json
+#
+# entries are keyed by device identity, an entry whose hwmon directory now belongs to a
+# different identity is dropped the next time that directory is resolved
+class NameCache:
+    def __init__(self, path: Path = None, persist: bool = True) -> None:
+        self.path = path or defaultPath()
+        self.persist = persist
+        self.entries = {}
+        self.lock = threading.Lock()
+
+        if persist:
+            try:
+                self.entries = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def get(self, identity: str):
+        with self.lock:
+            entry = self.entries.get(identity)
+            return entry["name"] if entry else None
+
+    def put(self, identity: str, hwmon: str, name: str) -> None:
+        with self.lock:
+            stale = [key for key, entry in self.entries.items() if entry.get("hwmon") == hwmon and key != identity]
+            if self.entries.get(identity) == {"name": name, "hwmon": hwmon} and not stale:
+                return
+            for key in stale:
+                del self.entries[key]
+            self.entries[identity] = {"name": name, "hwmon": hwmon}
+            if self.persist:
+                self.save()
+
+    # write to a temp file and rename so a crash never leaves a truncated cache
+    def save(self) -> None:
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.entries, indent=1))
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
@@ -1,81 +1,416 @@
-import subprocess
+import asyncio
+import math
+import re
+import shutil
+import sys
+import time
+from typing import NamedTuple
 
-def safe_float(value):
+from engine import Provider
+from sensortable import RowInfo, SensorTable
+
+# columns every --query-gpu query starts with, they identify the gpu of a line
+IDENTITY = "index,name,uuid"
+
+# compute processes, polled rarely as the list is expensive for the driver to build
+APPS_QUERY = "gpu_uuid,pid,process_name,used_memory"
+APPS_INTERVAL = 10.0
+
+# what nvidia-smi prints for a field it does not know, the field is dropped and the
+# query retried without it
+INVALID_FIELD = re.compile(r'Field "([^"]+)" is not a valid field')
+
+# only checks PATH, actual driver problems surface through refresh()
+def available() -> bool:
+    return shutil.which("nvidia-smi") is not None
+
+# "[N/A]", "[Not Supported]" and the like are NaN
+def number(value: str) -> float:
     try:
-        return float(value.strip())
-    except(ValueError, TypeError):
-        return 0.0
+        return float(value)
+    except ValueError:
+        return math.nan
 
+# throttle reason flags, "Active" or "Not Active"
+def active(value: str) -> float:
+    return 1.0 if value == "Active" else 0.0 if value == "Not Active" else math.nan
+
+# one --query-gpu field
+#   key      -> id of its row under the gpu, e.g. "temp" for "gpu0/temp"
+#   query    -> the nvidia-smi field
+#   scale    -> reported value / scale = value in `unit`
+#   interval -> seconds between two queries, 0 for every sample, fields with the same
+#               interval are queried together
+#   parse    -> reported text -> number, NaN for values the gpu does not report, fields
+#               a gpu never reports get no row
+class Field(NamedTuple):
+    key: str
+    query: str
+    sensType: str
+    label: str
+    unit: str
+    scale: float = 1
+    interval: float = 0.0
+    parse: object = number
+
+# the gpu rows, in tree order
+# PCIe throughput is not a --query-gpu field (only `nvidia-smi dmon -s t` and NVML report
+# it), the link generation and width are
+FIELDS = (
+    Field("temp", "temperature.gpu", "Temperature", "Temperature", "°C"),
+    Field("power", "power.draw", "Power", "Power", "W"),
+    Field("gc", "clocks.gr", "Clock", "Graphics", "MHz"),
+    Field("mc", "clocks.mem", "Clock", "Memory", "MHz"),
+    Field("util", "utilization.gpu", "Utilization", "GPU", "%"),
+    Field("memutil", "utilization.memory", "Utilization", "Memory", "%"),
+    Field("fan", "fan.speed", "Fan", "Fan", "%", interval=5.0),
+    Field("memused", "memory.used", "Memory", "Used", "GiB", 1024, 5.0),
+    Field("pciegen", "pcie.link.gen.current", "PCIe", "Link generation", "", interval=5.0),
+    Field("pciewidth", "pcie.link.width.current", "PCIe", "Link width", "lanes", interval=5.0),
+    Field("powercap", "clocks_throttle_reasons.sw_power_cap", "Throttle", "Power cap", "", interval=5.0, parse=active),
+    Field("hwslowdown", "clocks_throttle_reasons.hw_slowdown", "Throttle", "Hardware slowdown", "", interval=5.0, parse=active),
+    Field("swthermal", "clocks_throttle_reasons.sw_thermal_slowdown", "Throttle", "Software thermal", "", interval=5.0, parse=active),
+    Field("hwthermal", "clocks_throttle_reasons.hw_thermal_slowdown", "Throttle", "Hardware thermal", "", interval=5.0, parse=active)
+)
+
+# a single gpu value, a view over one SensorTable row
+# min/max are folded in by SensorTable.update() once per tick
 class Metric:
-    def __init__(self, value: float) -> None:
-        self.currentValue = value
-        self.maxValue = value
-        self.minValue = value
+    def __init__(self, table: SensorTable, info: RowInfo, value: float) -> None:
+        self.table = table
+        self.row = table.addRow(info)
+        self.update(value)
+
+    @property
+    def currentValue(self) -> float:
+        return self.table.cur[self.row]
+
+    @property
+    def maxValue(self) -> float:
+        return self.table.max[self.row]
+
+    @property
+    def minValue(self) -> float:
+        return self.table.min[self.row]
 
     def update(self, value: float) -> None:
-        self.currentValue = value
-        self.maxValue = max(self.maxValue, value)
-        self.minValue = min(self.minValue, value)
+        self.table.cur[self.row] = value
 
-# represents a single gpu entry, keeps track of current/min/max values
+# a single gpu, its rows are generated from the fields it reports
+#   metrics   -> field key -> Metric
+#   processes -> (pid, process name, used memory in MiB) of its compute processes as of the
+#                last query, kept out of the table so processes coming and going add no rows,
+#                `count` and `memory` hold how many there are and the memory they use
 class NvGPU:
-    # parameters are strings values returned from nvidia-smi
-    def __init__(self, idNum: str, model: str, temp: str, power: str, gc: str, mc: str) -> None:
+    def __init__(self, idNum: str, model: str, uuid: str, table: SensorTable) -> None:
         self.id = idNum
         self.model = model
+        self.uuid = uuid
+        self.table = table
+        self.device = f"gpu{idNum}"
+        self.name = f"{model} (GPU {idNum})"
+        self.metrics = {}
+        self.processes = []
+        self.count = None
+        self.memory = None
+
+    def info(self, key: str, sensType: str, label: str, scale: float, unit: str) -> RowInfo:
+        return RowInfo(f"{self.device}/{key}", self.device, self.name, sensType, label, scale, unit)
+
+    # values as reported for `fields`, returns the rows that got a value
+    def update(self, fields: list, values: list) -> list:
+        rows = []
+        for field, text in zip(fields, values):
+            value = field.parse(text)
+            metric = self.metrics.get(field.key)
+            if metric is not None:
+                metric.update(value)
+            elif value == value:
+                metric = self.metrics[field.key] = Metric(self.table, self.info(field.key, field.sensType, field.label, field.scale, field.unit), value)
+            else:
+                continue
+            rows.append(metric.row)
+        return rows
+
+    # (pid, process name, used memory in MiB) of every compute process on this gpu as
+    # reported, returns the rows that got a value
+    def updateProcesses(self, processes: list) -> list:
+        self.processes = [(pid, name, number(memory)) for pid, name, memory in processes]
+        # NaN when the driver reports no process's memory
+        used = [memory for _, _, memory in self.processes if memory == memory]
+        memory = sum(used) if used or not processes else math.nan
+
+        if self.count is None:
+            self.count = Metric(self.table, self.info("processes", "Process", "Compute processes", 1, ""), len(processes))
+            self.memory = Metric(self.table, self.info("procmem", "Process", "Process memory", 1, "MiB"), memory)
+        else:
+            self.count.update(len(processes))
+            self.memory.update(memory)
+        return [self.count.row, self.memory.row]
+
+    def rows(self) -> list:
+        rows = [metric.row for metric in self.metrics.values()]
+        if self.count is not None:
+            rows += [self.count.row, self.memory.row]
+        return rows
+
+# fields of one interval, queried with one nvidia-smi call (or stream)
+#   last   -> monotonic time of the last query
+#   latest -> newest line per gpu index from the stream
+class FieldGroup:
+    def __init__(self, interval: float, fields: list) -> None:
+        self.interval = interval
+        self.fields = fields
+        self.last = -math.inf
+        self.latest = {}
+        self.received = None
+        self.task = None
+        self.proc = None
+
+    def query(self) -> str:
+        return ",".join([IDENTITY] + [field.query for field in self.fields])
 
-        self.temp = Metric(safe_float(temp))
-        self.power = Metric(safe_float(power))
-        self.graphicsClock= Metric(safe_float(gc))
-        self.memoryClock = Metric(safe_float(mc))
+    def parseLine(self, line: str):
+        data = [x.strip() for x in line.split(",")]
+        if len(data) != 3 + len(self.fields):
+            return None
+        return data
 
-    def updateStats(self, temp: str, power: str, gc: str, mc: str):
-        self.temp.update(safe_float(temp))
-        self.power.update(safe_float(power))
-        self.graphicsClock.update(safe_float(gc))
-        self.memoryClock.update(safe_float(mc))
+    # drops the fields nvidia-smi reported as unknown in `errors`, whether there were any
+    def dropInvalid(self, errors: str) -> bool:
+        invalid = set(INVALID_FIELD.findall(errors))
+        fields = [field for field in self.fields if field.query not in invalid]
+        if len(fields) == len(self.fields):
+            return False
+        self.fields = fields
+        return True
 
-# discovers and maintains NvGPU objects built from the output of nvidia-smi
-class NvManager:
-    def __init__(self) -> None:
+# a query that takes longer than this is killed, the provider's deadline only decides
+# when its rows are served stale
+QUERY_TIMEOUT = 10
+
+# nvidia-smi as an Engine provider, discovers and maintains NvGPU objects
+# the FIELDS of one interval are read by one query, a group is queried when one of its
+# rows is due and its interval passed, the compute processes are a group of their own
+# that is due every APPS_INTERVAL seconds through the per-gpu process count
+# in streaming mode one long-lived `nvidia-smi -lms <interval>` per group feeds sample()
+# instead of a fork per call, it is restarted with exponential backoff if it exits
+class NvidiaProvider(Provider):
+    name = "nvidia"
+    # nvidia-smi can take a second to start on an idle driver
+    deadline = 1.0
+
+    def __init__(self, table: SensorTable, stream: bool = False, interval: int = 1000,
+                 minBackoff: float = 0.5, maxBackoff: float = 30.0, fields: tuple = FIELDS) -> None:
+        super().__init__(table)
         self.gpus = {}
+        self.stream = stream
+        self.interval = interval
+        self.minBackoff = minBackoff
+        self.maxBackoff = maxBackoff
+        self.restarts = 0
 
-    def refresh(self) -> None:
-        try:
-            out = subprocess.check_output([
-                "nvidia-smi",
-                "--query-gpu=index,name,temperature.gpu,power.draw,clocks.gr,clocks.mem",
-                "--format=csv,noheader,nounits"
-            ], text=True)
-        except subprocess.CalledProcessError:
-            print("Error: Could not query nvidia-smi")
-            return
-        
-        for line in out.strip().splitlines():
-            data = [x.strip() for x in line.split(",")]
+        intervals = {}
+        for field in fields:
+            intervals.setdefault(field.interval, []).append(field)
+        self.groups = [FieldGroup(interval, groupFields) for interval, groupFields in intervals.items()]
+        # table row -> its FieldGroup, None for the rows of the process group
+        self.owner = {}
+        self.appsLast = -math.inf
+        # a failed process query is retried by rescan() from this time on, with backoff
+        self.appsRetryAt = -math.inf
+        self.appsDelay = minBackoff
+        # (nvidia-smi option, kind of failure) already reported
+        self.reported = set()
 
-            if len(data) != 6: 
-                continue 
+    def command(self, group: FieldGroup) -> list:
+        args = ["nvidia-smi", f"--query-gpu={group.query()}", "--format=csv,noheader,nounits"]
+        if self.stream:
+            args += ["-lms", str(max(int(group.interval * 1000), self.interval))]
+        return args
 
-            idx, name, temp, power, gc, mc = data
+    async def discover(self) -> None:
+        if self.stream:
+            for group in self.groups:
+                group.received = asyncio.Event()
+                group.task = asyncio.create_task(self.run(group))
+            waits = [asyncio.ensure_future(group.received.wait()) for group in self.groups]
+            await asyncio.wait(waits, timeout=self.deadline)
+            for wait in waits:
+                wait.cancel()
+            for group in self.groups:
+                self.apply(group)
+        else:
+            await self.query(self.groups)
+        await self.queryApps()
 
-            if idx in self.gpus:
-                self.gpus[idx].updateStats(temp, power, gc, mc)
+    # the streaming process of a group, lines are kept until the next sample() takes them
+    async def run(self, group: FieldGroup) -> None:
+        delay = self.minBackoff
+        loop = asyncio.get_running_loop()
+        while group.fields:
+            started = loop.time()
+            try:
+                group.proc = await asyncio.create_subprocess_exec(*self.command(group), stdout=asyncio.subprocess.PIPE,
+                                                                  stderr=asyncio.subprocess.PIPE)
+            except OSError:
+                group.proc = None
             else:
-                self.gpus[idx] = NvGPU(idx, name, temp, power, gc, mc)
+                async for line in group.proc.stdout:
+                    data = group.parseLine(line.decode(errors="replace"))
+                    if data:
+                        group.latest[data[0]] = data
+                        group.received.set()
+                errors = await group.proc.stderr.read()
+                await group.proc.wait()
+                if group.dropInvalid(errors.decode(errors="replace")):
+                    continue
+
+            # a process that stayed up for a while starts over at the shortest delay
+            if loop.time() - started > self.maxBackoff:
+                delay = self.minBackoff
+            self.restarts += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.maxBackoff)
+
+    # one forked nvidia-smi call killed after QUERY_TIMEOUT, its output or None
+    # a --query-gpu call for `group` is retried without the fields it does not know
+    async def call(self, args: list, group: FieldGroup = None):
+        try:
+            proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            self.report(args, "start", f"cannot run nvidia-smi: {e}")
+            return None
+        try:
+            out, errors = await asyncio.wait_for(proc.communicate(), QUERY_TIMEOUT)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            self.report(args, "timeout", f"nvidia-smi did not answer within {QUERY_TIMEOUT} s")
+            return None
+        if proc.returncode != 0:
+            errors = errors.decode(errors="replace")
+            if group is not None and group.dropInvalid(errors) and group.fields:
+                return await self.call(self.command(group), group)
+            message = errors.strip().splitlines()[0] if errors.strip() else f"exit status {proc.returncode}"
+            self.report(args, "failed", f"nvidia-smi failed: {message}")
+            return None
+        return out.decode(errors="replace")
+
+    # a failing query fails again on every sample, each kind of failure is printed once per
+    # query type, on stderr so it stays out of the headless output
+    def report(self, args: list, kind: str, message: str) -> None:
+        key = (args[1].split("=")[0], kind)
+        if key in self.reported:
+            return
+        self.reported.add(key)
+        print(f"sensmon: {message}", file=sys.stderr, flush=True)
+
+    # forks a query per group, all at once, returns the rows that got a value
+    # the output is applied in group order, so new rows are added in the order of FIELDS
+    async def query(self, groups: list) -> list:
+        now = time.monotonic()
+        for group in groups:
+            group.last = now
+        outs = await asyncio.gather(*(self.call(self.command(group), group) for group in groups if group.fields))
+        rows = []
+        for group, out in zip([group for group in groups if group.fields], outs):
+            for line in (out or "").strip().splitlines():
+                data = group.parseLine(line)
+                if data:
+                    rows += self.update(group, data)
+        return rows
+
+    # lines of `group` received from the stream since the last call
+    def apply(self, group: FieldGroup) -> list:
+        latest, group.latest = group.latest, {}
+        rows = []
+        for data in latest.values():
+            rows += self.update(group, data)
+        return rows
 
-    # reset min/max tracking
-    def resetValues(self) -> None:
+    # refreshes the compute processes of every gpu, returns the rows that got a value
+    async def queryApps(self) -> list:
+        self.appsLast = time.monotonic()
+        if not self.gpus:
+            return []
+        out = await self.call(["nvidia-smi", f"--query-compute-apps={APPS_QUERY}", "--format=csv,noheader,nounits"])
+        if out is None:
+            self.appsRetryAt = time.monotonic() + self.appsDelay
+            self.appsDelay = min(self.appsDelay * 2, self.maxBackoff)
+            return []
+        self.appsDelay = self.minBackoff
+        processes = {gpu.uuid: [] for gpu in self.gpus.values()}
+        for line in out.strip().splitlines():
+            data = [x.strip() for x in line.split(",")]
+            if len(data) == 4 and data[0] in processes:
+                processes[data[0]].append(tuple(data[1:]))
+        rows = []
         for gpu in self.gpus.values():
-            gpu.temp.minValue = gpu.temp.currentValue
-            gpu.temp.maxValue = gpu.temp.currentValue
+            rows += gpu.updateProcesses(processes[gpu.uuid])
+            for row in gpu.rows():
+                self.owner.setdefault(row, None)
+        return rows
+
+    def channels(self) -> list:
+        return [row for gpu in self.gpus.values() for row in gpu.rows()]
+
+    def devices(self) -> list:
+        return [gpu.device for gpu in self.gpus.values()]
 
-            gpu.power.minValue = gpu.power.currentValue
-            gpu.power.maxValue = gpu.power.currentValue
+    # queries the groups with due rows whose interval passed, in parallel, rows of the
+    # other groups keep their last value
+    async def sample(self, rows: list):
+        now = time.monotonic()
+        owner = self.owner
+        due = {owner.get(row) for row in rows}
+        fresh = set()
+        work = []
+        if self.stream:
+            for group in self.groups:
+                if group in due:
+                    fresh.update(self.apply(group))
+        else:
+            groups = [group for group in self.groups if group in due and now - group.last >= group.interval]
+            if groups:
+                work.append(self.query(groups))
+        if None in due and now - self.appsLast >= APPS_INTERVAL:
+            work.append(self.queryApps())
+        for sampled in await asyncio.gather(*work):
+            fresh.update(sampled)
+        kept = {row: False for row in rows if row not in fresh}
+        return kept or None
 
-            gpu.graphicsClock.minValue = gpu.graphicsClock.currentValue
-            gpu.graphicsClock.maxValue = gpu.graphicsClock.currentValue
+    # gpus that did not answer during discovery, and their process rows
+    async def rescan(self) -> None:
+        if self.stream:
+            for group in self.groups:
+                if group.latest.keys() - self.gpus.keys():
+                    self.apply(group)
+        elif not self.gpus:
+            await self.query(self.groups)
+        if any(gpu.count is None for gpu in self.gpus.values()) and time.monotonic() >= self.appsRetryAt:
+            await self.queryApps()
 
-            gpu.memoryClock.minValue = gpu.memoryClock.currentValue
-            gpu.memoryClock.maxValue = gpu.memoryClock.currentValue
+    # one line of `group`, returns the rows that got a value
+    def update(self, group: FieldGroup, data: list) -> list:
+        idx, name, uuid = data[:3]
+        gpu = self.gpus.get(idx)
+        if gpu is None:
+            gpu = self.gpus[idx] = NvGPU(idx, name, uuid, self.table)
+        rows = gpu.update(group.fields, data[3:])
+        for row in rows:
+            self.owner[row] = group
+        return rows
 
+    def close(self) -> None:
+        super().close()
+        for group in self.groups:
+            if group.task:
+                group.task.cancel()
+            if group.proc and group.proc.returncode is None:
+                try:
+                    group.proc.terminate()
+                except ProcessLookupError:
+                    pass
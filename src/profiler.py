@@ -0,0 +1,180 @@
+import heapq
+import json
+import sys
+import threading
+import time
+
+# SENSMON_PROFILE=1 (or -) profiles from startup and prints the report on exit,
+# any other value is a file to write it to, json if it ends in .json
+PROFILE_ENV = "SENSMON_PROFILE"
+
+# 4 buckets per power of two, percentiles are accurate to about 20%
+SUBBUCKETS = 4
+
+def bucketOf(ns: int) -> int:
+    bits = ns.bit_length()
+    if bits <= 2:
+        return ns
+    return bits * SUBBUCKETS + ((ns >> (bits - 3)) & 3)
+
+# largest value that falls into the bucket
+def bucketBound(bucket: int) -> int:
+    bits, sub = divmod(bucket, SUBBUCKETS)
+    if bits <= 2:
+        return bucket
+    return ((SUBBUCKETS + sub + 1) << (bits - 3)) - 1
+
+# log-linear histogram of durations in nanoseconds
+class Histogram:
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (64 * SUBBUCKETS)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, ns: int) -> None:
+        self.buckets[bucketOf(ns)] += 1
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def percentile(self, q: float) -> int:
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(bucketBound(bucket), self.max)
+        return self.max
+
+def formatNs(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.1f}ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.1f}µs"
+    return f"{ns:.0f}ns"
+
+# per-phase duration histograms plus per-table-row read times
+# call sites check `enabled` and only take timestamps when it is set, so a disabled
+# profiler costs one attribute lookup per phase, phases are recorded from the collector
+# and the GUI thread
+class Profiler:
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.phases = {}
+        # per table row: reads, total ns, slowest ns
+        self.readCount = []
+        self.readTotal = []
+        self.readMax = []
+
+    def enable(self, enabled: bool) -> None:
+        if enabled and not self.enabled:
+            self.clear()
+        self.enabled = enabled
+
+    def clear(self) -> None:
+        with self.lock:
+            self.started = time.monotonic()
+            self.phases = {}
+            self.readCount = []
+            self.readTotal = []
+            self.readMax = []
+
+    def record(self, phase: str, ns: int) -> None:
+        with self.lock:
+            histogram = self.phases.get(phase)
+            if histogram is None:
+                histogram = self.phases[phase] = Histogram()
+            histogram.record(ns)
+
+    # one sensor read, also counted in the "read" phase
+    def recordRead(self, row: int, ns: int) -> None:
+        with self.lock:
+            if row >= len(self.readCount):
+                grow = row + 1 - len(self.readCount)
+                self.readCount.extend([0] * grow)
+                self.readTotal.extend([0] * grow)
+                self.readMax.extend([0] * grow)
+            self.readCount[row] += 1
+            self.readTotal[row] += ns
+            if ns > self.readMax[row]:
+                self.readMax[row] = ns
+
+            histogram = self.phases.get("read")
+            if histogram is None:
+                histogram = self.phases["read"] = Histogram()
+            histogram.record(ns)
+
+    # rows with the highest mean read time
+    def slowest(self, schema: tuple, n: int = 10) -> list:
+        with self.lock:
+            rows = [(self.readTotal[row] / count, row) for row, count in enumerate(self.readCount) if count]
+            top = heapq.nlargest(n, rows)
+            result = []
+            for mean, row in top:
+                info = schema[row] if row < len(schema) else None
+                result.append({
+                    "id": info.uid if info else str(row),
+                    "device": info.deviceName if info else "",
+                    "label": info.label if info else "",
+                    "reads": self.readCount[row],
+                    "meanUs": round(mean / 1e3, 2),
+                    "maxUs": round(self.readMax[row] / 1e3, 2)
+                })
+        return result
+
+    # compact p95 per phase for the status bar
+    def summary(self) -> str:
+        with self.lock:
+            parts = [f"{phase} {formatNs(h.percentile(0.95))}" for phase, h in self.phases.items() if h.count]
+        return "p95 " + ", ".join(parts) if parts else "profiling"
+
+    def report(self, schema: tuple, n: int = 10) -> dict:
+        with self.lock:
+            phases = {phase: {
+                "count": h.count,
+                "totalMs": round(h.total / 1e6, 3),
+                "meanUs": round(h.total / h.count / 1e3, 2),
+                "p50Us": round(h.percentile(0.5) / 1e3, 2),
+                "p95Us": round(h.percentile(0.95) / 1e3, 2),
+                "p99Us": round(h.percentile(0.99) / 1e3, 2),
+                "maxUs": round(h.max / 1e3, 2)
+            } for phase, h in self.phases.items() if h.count}
+        return {
+            "seconds": round(time.monotonic() - self.started, 1),
+            "phases": phases,
+            "slowest": self.slowest(schema, n)
+        }
+
+    def formatReport(self, schema: tuple, n: int = 10) -> str:
+        report = self.report(schema, n)
+        lines = [f"sensmon profile over {report['seconds']} s",
+                 f"{'phase':<10} {'count':>8} {'total':>10} {'mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'max':>10}"]
+        for phase, p in report["phases"].items():
+            lines.append(f"{phase:<10} {p['count']:>8} {formatNs(p['totalMs'] * 1e6):>10} " + " ".join(
+                f"{formatNs(p[key] * 1e3):>10}" for key in ("meanUs", "p50Us", "p95Us", "p99Us", "maxUs")))
+        if report["slowest"]:
+            lines.append("")
+            lines.append("slowest sensors (mean read time)")
+            for s in report["slowest"]:
+                lines.append(f"  {formatNs(s['meanUs'] * 1e3):>10} max {formatNs(s['maxUs'] * 1e3):>10}  {s['id']}  ({s['device']}, {s['label']})")
+        return "\n".join(lines) + "\n"
+
+    # target None or "-" -> stdout, a path ending in .json -> json, any other path -> text
+    def dump(self, schema: tuple, target: str = None, stream=None) -> None:
+        if target in (None, "-", "1"):
+            (stream or sys.stdout).write(self.formatReport(schema))
+            return
+        if target.endswith(".json"):
+            text = json.dumps(self.report(schema), indent=1) + "\n"
+        else:
+            text = self.formatReport(schema)
+        with open(target, "w") as out:
+            out.write(text)
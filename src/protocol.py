@@ -0,0 +1,100 @@
+import json
+import math
+import socket
+import struct
+
+# wire format between agent.py and remote.py, every frame is
+#   <kind u8> <payload length u32> <payload>
+#
+# agent -> client
+#   SCHEMA  json {"version", "host", "devices", "rows": [[uid, device, deviceName, sensType,
+#           label, unit, retired], ...]}, sent on connect and whenever the agent's rows change
+#   VALUES  <timestamp f64> <reads u64> <count u32> then count x <row u32> <cur f64> <min f64> <max f64>
+#           only rows that changed since the previous VALUES frame of this connection, all rows
+#           right after a SCHEMA frame, values are in display units with temperatures in celsius
+# client -> agent
+#   RESET   empty, reset min/max
+VERSION = 1
+SCHEMA, VALUES, RESET = 1, 2, 3
+
+HEADER = struct.Struct("<BI")
+VALUES_HEADER = struct.Struct("<dQI")
+VALUE = struct.Struct("<Iddd")
+
+# anything larger is treated as a corrupt stream
+MAX_PAYLOAD = 64 * 1024 * 1024
+
+DEFAULT_PORT = 7634
+
+class ProtocolError(Exception):
+    pass
+
+# "unix:/path", "host:port", "[v6addr]:port" or a bare port (loopback)
+def parseAddress(address: str) -> tuple:
+    if address.startswith("unix:"):
+        return (socket.AF_UNIX, address[5:])
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        host, port = address, str(DEFAULT_PORT)
+    host = host.strip("[]") or "127.0.0.1"
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return (family, (host, int(port)))
+
+def frame(kind: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(kind, len(payload)) + payload
+
+def schemaFrame(snapshot, host: str) -> bytes:
+    return frame(SCHEMA, json.dumps({
+        "version": VERSION,
+        "host": host,
+        "devices": list(snapshot.devices),
+        "rows": [[info.uid, info.device, info.deviceName, info.sensType, info.label, info.unit, info.retired]
+                 for info in snapshot.schema]
+    }, separators=(",", ":")).encode())
+
+# values -> iterable of (row, current, minimum, maximum)
+def valuesFrame(timestamp: float, reads: int, values: list) -> bytes:
+    body = b"".join(VALUE.pack(*value) for value in values)
+    return frame(VALUES, VALUES_HEADER.pack(timestamp, reads, len(values)) + body)
+
+def parseSchema(payload: bytes) -> dict:
+    try:
+        schema = json.loads(payload)
+    except ValueError as e:
+        raise ProtocolError(f"bad schema: {e}")
+    if schema.get("version") != VERSION:
+        raise ProtocolError(f"unsupported protocol version {schema.get('version')}")
+    return schema
+
+# returns (timestamp, reads, [(row, current, minimum, maximum), ...])
+def parseValues(payload: bytes) -> tuple:
+    if len(payload) < VALUES_HEADER.size:
+        raise ProtocolError("short values frame")
+    timestamp, reads, count = VALUES_HEADER.unpack_from(payload)
+    if len(payload) != VALUES_HEADER.size + count * VALUE.size:
+        raise ProtocolError("values frame length mismatch")
+    return (timestamp, reads, list(VALUE.iter_unpack(memoryview(payload)[VALUES_HEADER.size:])))
+
+def same(a: float, b: float) -> bool:
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+# splits a byte stream into (kind, payload) frames
+class FrameReader:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> list:
+        self.buffer += data
+        frames = []
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            kind, length = HEADER.unpack_from(self.buffer, offset)
+            if length > MAX_PAYLOAD:
+                raise ProtocolError(f"frame of {length} bytes")
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+            frames.append((kind, bytes(self.buffer[offset + HEADER.size:end])))
+            offset = end
+        del self.buffer[:offset]
+        return frames
@@ -0,0 +1,137 @@
+import os
+import time
+from pathlib import Path
+
+from engine import Provider
+from sensors import sysRoot
+from sensortable import RowInfo, SensorTable
+
+# providers beyond hwmon and nvidia-smi, each one is a device of its own in the tree
+# a new source only needs discover() to add its rows, channels() to hand them to the
+# scheduler and sample() to store raw values, see engine.Provider
+
+# the values are read on the provider's worker and stored by sample() on the loop thread,
+# the only thread that writes table.cur
+def store(table: SensorTable, values: list) -> None:
+    cur = table.cur
+    for row, value in values:
+        cur[row] = value
+
+def readInt(path: Path):
+    try:
+        return int(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+# current frequency of every cpu core from cpufreq (kHz), all cores are refreshed together
+class CpuFreqProvider(Provider):
+    name = "cpufreq"
+    device = "cpufreq"
+
+    def __init__(self, table: SensorTable, root: Path = None) -> None:
+        super().__init__(table)
+        self.path = (Path(root) if root is not None else sysRoot()) / "sys/devices/system/cpu"
+        # table row -> scaling_cur_freq
+        self.files = {}
+
+    async def discover(self) -> None:
+        await self.blocking(self.find)
+
+    def find(self) -> None:
+        cores = []
+        try:
+            for entry in self.path.iterdir():
+                freq = entry / "cpufreq/scaling_cur_freq"
+                if entry.name[3:].isdigit() and entry.name.startswith("cpu") and freq.exists():
+                    cores.append((int(entry.name[3:]), freq))
+        except OSError:
+            return
+
+        for core, freq in sorted(cores):
+            info = RowInfo(f"{self.device}/cpu{core}", self.device, "CPU Frequency", "Clock", f"Core {core}", 1000, "MHz")
+            self.files[self.table.addRow(info)] = freq
+
+    def channels(self) -> list:
+        return list(self.files)
+
+    def devices(self) -> list:
+        return [self.device] if self.files else []
+
+    async def sample(self, rows: list) -> None:
+        store(self.table, await self.blocking(self.read))
+
+    # (row, kHz) of every core that could be read
+    def read(self) -> list:
+        values = []
+        for row, freq in self.files.items():
+            value = readInt(freq)
+            if value is not None:
+                values.append((row, value))
+        return values
+
+# package/core/dram power from the RAPL energy counters in powercap (µJ)
+# power is the energy used since the previous sample divided by the time between them,
+# counters wrap at max_energy_range_uj, the first sample of a zone yields no value
+class RaplProvider(Provider):
+    name = "rapl"
+    device = "rapl"
+
+    def __init__(self, table: SensorTable, root: Path = None) -> None:
+        super().__init__(table)
+        self.path = (Path(root) if root is not None else sysRoot()) / "sys/class/powercap"
+        # table row -> (energy_uj, wrap range), and the previous (energy, monotonic ns)
+        self.zones = {}
+        self.previous = {}
+
+    async def discover(self) -> None:
+        await self.blocking(self.find)
+
+    def find(self) -> None:
+        zones = []
+        try:
+            entries = sorted(self.path.iterdir())
+        except OSError:
+            return
+        for zone in entries:
+            energy = zone / "energy_uj"
+            # the counters are root-only on kernels that mitigate PLATYPUS
+            if not zone.name.startswith("intel-rapl:") or not os.access(energy, os.R_OK):
+                continue
+            try:
+                label = (zone / "name").read_text().strip()
+            except OSError:
+                label = zone.name
+            zones.append((zone.name, label, energy, readInt(zone / "max_energy_range_uj") or 0))
+
+        for name, label, energy, wrap in zones:
+            info = RowInfo(f"{self.device}/{name}", self.device, "RAPL", "Power", label, 1000000, "W")
+            self.zones[self.table.addRow(info)] = (energy, wrap)
+
+    def channels(self) -> list:
+        return list(self.zones)
+
+    def devices(self) -> list:
+        return [self.device] if self.zones else []
+
+    async def sample(self, rows: list) -> None:
+        store(self.table, await self.blocking(self.read))
+
+    # (row, µW) like hwmon power attributes, of every zone with a value
+    def read(self) -> list:
+        values = []
+        for row, (energy, wrap) in self.zones.items():
+            value = readInt(energy)
+            now = time.monotonic_ns()
+            if value is None:
+                continue
+            previous = self.previous.get(row)
+            self.previous[row] = (value, now)
+            if previous is None or now <= previous[1]:
+                continue
+            used = value - previous[0]
+            if used < 0:
+                if not wrap:
+                    continue
+                used += wrap
+            values.append((row, used * 1e9 / (now - previous[1])))
+        return values
@@ -0,0 +1,124 @@
+import asyncio
+import queue
+import time
+
+from engine import Worker
+from sensortable import SensorTable
+
+# a read that takes longer than this moves its channel to the pool
+SLOW_READ = 0.005
+# a pooled channel whose reads average less than this goes back to being read inline
+FAST_READ = 0.001
+# weight of the newest read in a pooled channel's average
+LATENCY_WEIGHT = 0.2
+
+# threads reading pooled channels
+POOL_SIZE = 4
+# seconds a pooled read may take from being queued before its row is served stale
+READ_DEADLINE = 0.25
+
+# reads channels whose driver does real device I/O (drivetemp's SMART commands, nvme,
+# EC-backed *_wmi channels) on a few threads of their own, so they never hold up a tick
+#
+# the provider reads its channels inline and reports the ones that were slow, from then
+# on their reads are queued here each time they are due and the tick goes on without
+# waiting, a read returns the raw value and the loop thread stores it into table.cur once
+# the read completed, so no pool thread writes the table, the row counts as sampled at the
+# next tick, a row has at most one read in flight and is flagged stale once that read
+# is older than the deadline, channels whose reads got fast again go back inline
+class ReaderPool:
+    def __init__(self, table: SensorTable, name: str, size: int = POOL_SIZE, deadline: float = READ_DEADLINE) -> None:
+        self.table = table
+        self.name = name
+        self.size = size
+        self.deadline = deadline
+        self.calls = queue.SimpleQueue()
+        # started with the first slow channel
+        self.workers = []
+        # rows read here and the moving average of their read time in seconds
+        self.slow = {}
+        # row -> when its read in flight was queued
+        self.running = {}
+        # rows whose read completed since they were last collected
+        self.done = set()
+
+    # rows of `rows` that are read here, cheap while there are none
+    def pooled(self, rows: list) -> list:
+        if not self.slow:
+            return []
+        slow = self.slow
+        return [row for row in rows if row in slow]
+
+    # rows whose inline read took longer than SLOW_READ, and how long it took
+    def demote(self, rows: list, seconds: list) -> None:
+        for row, elapsed in zip(rows, seconds):
+            self.slow[row] = elapsed
+            self.done.discard(row)
+
+    # queue a read of every row of `rows` without one in flight, row -> callable returning the
+    # raw value or None in `reads`, read times go to `profiler` while it is enabled
+    def submit(self, rows: list, reads: dict, profiler=None) -> None:
+        loop = asyncio.get_running_loop()
+        if len(self.workers) < self.size:
+            self.workers.extend(Worker(f"{self.name}-{i}", self.calls) for i in range(len(self.workers), self.size))
+
+        now = time.monotonic()
+        for row in rows:
+            if row in self.running:
+                continue
+            future = loop.create_future()
+            future.add_done_callback(lambda future, row=row: self.finished(row, future, profiler))
+            self.running[row] = now
+            self.calls.put((loop, future, timed, (reads[row],)))
+
+    # rows of `rows` without a value read since the last call -> whether they are overdue,
+    # i.e. their read is past the deadline or failed
+    def collect(self, rows: list) -> dict:
+        now = time.monotonic()
+        done = self.done
+        waiting = {}
+        for row in rows:
+            if row in done:
+                done.discard(row)
+                continue
+            queued = self.running.get(row)
+            waiting[row] = queued is None or now - queued > self.deadline
+        return waiting
+
+    def finished(self, row: int, future, profiler) -> None:
+        self.running.pop(row, None)
+        # forgotten while in flight
+        if row not in self.slow:
+            return
+        if future.cancelled() or future.exception() is not None:
+            return
+        elapsed, value = future.result()
+        if profiler and profiler.enabled:
+            profiler.recordRead(row, int(elapsed * 1e9))
+        # a failed read stores nothing, collect() then reports the row as overdue
+        if value is not None:
+            self.table.cur[row] = value
+            self.done.add(row)
+        average = self.slow[row] + LATENCY_WEIGHT * (elapsed - self.slow[row])
+        if average < FAST_READ:
+            # read inline again from its next tick on
+            del self.slow[row]
+        else:
+            self.slow[row] = average
+
+    # stops pooling the rows that are not in `rows`, e.g. of a device that went away
+    def forget(self, rows) -> None:
+        for row in [row for row in self.slow if row not in rows]:
+            del self.slow[row]
+            self.running.pop(row, None)
+            self.done.discard(row)
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.stop()
+
+# (seconds `read` took, the value it returned)
+def timed(read) -> tuple:
+    start = time.monotonic()
+    value = read()
+    return (time.monotonic() - start, value)
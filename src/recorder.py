@@ -0,0 +1,242 @@
+import json
+import mmap
+import socket
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# a recording is a sequence of segments, a new one starts whenever the set of sensors changes
+#   <magic 8s> <record count u64> <header length u32> <json header, space padded to 8 bytes>
+#   count x <timestamp f64> <reads u64> <value f32> x len(rows)
+# the json header holds {"version", "host", "devices", "rows": [[uid, device, deviceName,
+# sensType, label, unit, retired], ...]} like protocol.SCHEMA, values are in display units
+# with temperatures in celsius, records are fixed width so record i of a segment is found
+# by arithmetic and seeking is a binary search over the timestamps
+#
+# the count of the segment being written is OPEN until the next segment starts or the
+# recorder is closed, readers then derive it from the file size, so a recording that was
+# cut short by a crash or kill stays readable
+MAGIC = b"SENSREC\x01"
+VERSION = 1
+SEGMENT = struct.Struct("<8sQI")
+RECORD = struct.Struct("<dQ")
+OPEN = 2 ** 64 - 1
+
+class RecordingError(Exception):
+    pass
+
+# walks the segments of a mapped recording, yields (offset, header, records offset, count)
+# the open segment and one cut short end the walk with the number of complete records it holds
+def scanSegments(data, path: str):
+    offset = 0
+    size = len(data)
+    if data[:len(MAGIC)] != MAGIC:
+        raise RecordingError(f"{path} is not a sensmon recording")
+    while offset + SEGMENT.size <= size:
+        magic, count, length = SEGMENT.unpack_from(data, offset)
+        if magic != MAGIC:
+            raise RecordingError(f"{path} is not a sensmon recording")
+        # cut short while the header was written
+        if offset + SEGMENT.size + length > size:
+            break
+        try:
+            header = json.loads(data[offset + SEGMENT.size:offset + SEGMENT.size + length])
+        except ValueError:
+            raise RecordingError(f"{path} has a corrupt segment header at byte {offset}")
+        if header.get("version") != VERSION:
+            raise RecordingError(f"{path} has unsupported version {header.get('version')}")
+
+        start = offset + SEGMENT.size + length
+        recordSize = RECORD.size + 4 * len(header["rows"])
+        # a partial last record is ignored
+        available = (size - start) // recordSize
+        if count == OPEN or count > available:
+            count = available
+            size = start + count * recordSize
+        yield offset, header, start, count
+        offset = start + count * recordSize
+
+# appends one record per sample, called on the collector thread
+# records are written unbuffered, a few hundred bytes per second at 1 Hz
+# an existing recording is continued: a segment left open by a crash is closed, anything
+# after its last complete record is cut off and the next sample starts a new segment
+class Recorder:
+    def __init__(self, path: str) -> None:
+        try:
+            self.file = open(path, "x+b", buffering=0)
+        except FileExistsError:
+            self.file = open(path, "r+b", buffering=0)
+            try:
+                self.resume(path)
+            except (OSError, RecordingError):
+                self.file.close()
+                raise
+        self.host = socket.gethostname()
+        self.schema = None
+        self.countOffset = None
+        self.count = 0
+
+    def resume(self, path: str) -> None:
+        try:
+            data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty
+            return
+        end = 0
+        last = None
+        try:
+            for offset, header, start, count in scanSegments(data, path):
+                end = start + count * (RECORD.size + 4 * len(header["rows"]))
+                last = (offset, count)
+        finally:
+            data.close()
+
+        if last is not None:
+            self.file.seek(last[0] + len(MAGIC))
+            self.file.write(struct.pack("<Q", last[1]))
+        self.file.truncate(end)
+        self.file.seek(end)
+
+    # snapshot -> collector.Snapshot, values -> current values of every schema row in display units, temperatures in celsius
+    def append(self, snapshot, values) -> None:
+        if snapshot.schema is not self.schema:
+            self.startSegment(snapshot)
+
+        if np is not None:
+            body = np.asarray(values, dtype="<f4").tobytes()
+        else:
+            body = array('f', values)
+            if sys.byteorder == "big":
+                body.byteswap()
+            body = body.tobytes()
+        self.file.write(RECORD.pack(snapshot.timestamp, snapshot.reads) + body)
+        self.count += 1
+
+    def startSegment(self, snapshot) -> None:
+        self.finishSegment()
+        header = json.dumps({
+            "version": VERSION,
+            "host": self.host,
+            "devices": list(snapshot.devices),
+            "rows": [[info.uid, info.device, info.deviceName, info.sensType, info.label, info.unit, info.retired]
+                     for info in snapshot.schema]
+        }, separators=(",", ":")).encode()
+        # keeps the f32 values of every record aligned
+        header += b" " * (-(SEGMENT.size + len(header)) % 8)
+
+        self.countOffset = self.file.tell() + len(MAGIC)
+        self.file.write(SEGMENT.pack(MAGIC, OPEN, len(header)) + header)
+        self.schema = snapshot.schema
+        self.count = 0
+
+    def finishSegment(self) -> None:
+        if self.countOffset is None:
+            return
+        end = self.file.tell()
+        self.file.seek(self.countOffset)
+        self.file.write(struct.pack("<Q", self.count))
+        self.file.seek(end)
+
+    def close(self) -> None:
+        self.finishSegment()
+        self.file.close()
+
+# timestamps of a segment as a sequence for bisect when numpy is missing
+class Timestamps:
+    def __init__(self, data: mmap.mmap, offset: int, size: int, count: int) -> None:
+        self.data = data
+        self.offset = offset
+        self.size = size
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> float:
+        return struct.unpack_from("<d", self.data, self.offset + i * self.size)[0]
+
+# one run of fixed-width records sharing a set of sensors
+class Segment:
+    def __init__(self, data: mmap.mmap, header: dict, offset: int, count: int) -> None:
+        self.header = header
+        self.rows = header["rows"]
+        self.devices = tuple(header["devices"])
+        self.offset = offset
+        self.count = count
+        self.size = RECORD.size + 4 * len(self.rows)
+
+        if np is not None:
+            dtype = np.dtype([("t", "<f8"), ("reads", "<u8"), ("v", "<f4", (len(self.rows),))])
+            self.records = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            self.times = self.records["t"]
+        else:
+            self.data = data
+            self.times = Timestamps(data, offset, self.size, count)
+        self.start = self.times[0]
+        self.end = self.times[count - 1]
+
+    # last record at or before timestamp, 0 when timestamp is before the segment
+    def locate(self, timestamp: float) -> int:
+        if np is not None:
+            return max(int(np.searchsorted(self.times, timestamp, side="right")) - 1, 0)
+        return max(bisect_right(self.times, timestamp) - 1, 0)
+
+    def reads(self, i: int) -> int:
+        if np is not None:
+            return int(self.records["reads"][i])
+        return RECORD.unpack_from(self.data, self.offset + i * self.size)[1]
+
+    # values of record i, zero-copy
+    def values(self, i: int):
+        if np is not None:
+            return self.records["v"][i]
+        start = self.offset + i * self.size + RECORD.size
+        values = memoryview(self.data)[start:start + self.size - RECORD.size].cast('f')
+        if sys.byteorder == "big":
+            values = array('f', values)
+            values.byteswap()
+        return values
+
+# a memory-mapped recording, opening it only reads the segment headers
+class Recording:
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as file:
+            try:
+                self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise RecordingError(f"{path} is empty")
+
+        self.segments = []
+        for offset, header, start, count in scanSegments(self.data, path):
+            if count:
+                self.segments.append(Segment(self.data, header, start, count))
+
+        if not self.segments:
+            raise RecordingError(f"{path} contains no samples")
+        self.starts = [segment.start for segment in self.segments]
+        self.start = self.segments[0].start
+        self.end = self.segments[-1].end
+        self.host = self.segments[0].header.get("host", "")
+
+    # (segment index, record index) of the last record at or before timestamp, O(log n)
+    def locate(self, timestamp: float) -> tuple:
+        seg = max(bisect_right(self.starts, timestamp) - 1, 0)
+        return (seg, self.segments[seg].locate(timestamp))
+
+    def __len__(self) -> int:
+        return sum(segment.count for segment in self.segments)
+
+    def close(self) -> None:
+        self.segments = []
+        self.starts = []
+        try:
+            self.data.close()
+        except BufferError:
+            # a snapshot still views the mapping, it is unmapped once that is collected
+            pass
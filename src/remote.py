@@ -0,0 +1,242 @@
+import errno
+import selectors
+import socket
+import threading
+import time
+
+import protocol
+from collector import Snapshot
+from sensortable import SensorTable
+
+# seconds between reconnect attempts, doubled per failure
+MIN_RETRY = 0.5
+MAX_RETRY = 30.0
+
+# one agent connection, its rows are kept in a local SensorTable so row indices stay stable
+# across reconnects and agent restarts: rows are matched by uid, rows that disappeared are
+# retired like hot-unplugged hwmon devices
+class RemoteHost:
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self.family, self.target = protocol.parseAddress(address)
+        self.name = address
+        self.sock = None
+        self.connected = False
+        self.reader = protocol.FrameReader()
+        self.outbuf = bytearray()
+        self.retryAt = 0.0
+        self.retry = MIN_RETRY
+
+        self.table = SensorTable()
+        # agent row -> local row, -1 for rows retired on the agent
+        self.remoteRows = []
+        self.devices = ()
+        self.timestamp = 0.0
+        self.reads = 0
+        self.received = False
+
+    def applySchema(self, schema: dict) -> None:
+        self.name = schema.get("host") or self.address
+        self.remoteRows = self.table.mirror(schema["rows"])
+        self.devices = tuple(schema["devices"])
+
+    def applyValues(self, payload: bytes) -> None:
+        self.timestamp, self.reads, values = protocol.parseValues(payload)
+        table = self.table
+        remoteRows = self.remoteRows
+        for remote, current, minimum, maximum in values:
+            if remote >= len(remoteRows) or remoteRows[remote] < 0:
+                continue
+            row = remoteRows[remote]
+            table.cur[row] = current
+            table.min[row] = minimum
+            table.max[row] = maximum
+        self.received = True
+
+    # the agent sends celsius, conversion to fahrenheit happens here
+    def snapshot(self, celsius: bool) -> Snapshot:
+        current, minimum, maximum = self.table.display(celsius)
+        return Snapshot(self.timestamp, celsius, self.devices, self.table.schema, current, minimum, maximum, self.reads)
+
+# connects to any number of agents from one thread with non-blocking sockets and a selector,
+# like Collector only the newest snapshot per host is kept and `publish` is called when
+# the consumer has nothing pending
+class RemoteClient(threading.Thread):
+    def __init__(self, addresses: list, publish=None) -> None:
+        super().__init__(name="sensmon-remote", daemon=True)
+        self.hosts = [RemoteHost(address) for address in addresses]
+        self.publish = publish
+        self.selector = selectors.DefaultSelector()
+        self.wakeRead, self.wakeWrite = socket.socketpair()
+        self.wakeRead.setblocking(False)
+        self.wakeWrite.setblocking(False)
+
+        self.celsius = True
+        self.resetRequested = False
+        self.republish = False
+        self.running = True
+
+        self.lock = threading.Lock()
+        self.latest = {}
+        self.pending = False
+
+    def run(self) -> None:
+        self.selector.register(self.wakeRead, selectors.EVENT_READ)
+        while self.running:
+            now = time.monotonic()
+            for host in self.hosts:
+                if host.sock is None and now >= host.retryAt:
+                    self.connect(host)
+
+            waiting = [host.retryAt for host in self.hosts if host.sock is None]
+            timeout = max(0.0, min(waiting) - time.monotonic()) if waiting else None
+            changed = set()
+            for key, mask in self.selector.select(timeout):
+                if key.fileobj is self.wakeRead:
+                    self.commands(changed)
+                elif self.service(key.data, mask):
+                    changed.add(key.data)
+
+            for host in changed:
+                self.offer(host)
+
+        for host in self.hosts:
+            self.disconnect(host, retry=False)
+        self.selector.close()
+
+    def connect(self, host: RemoteHost) -> None:
+        host.sock = socket.socket(host.family, socket.SOCK_STREAM)
+        host.sock.setblocking(False)
+        error = host.sock.connect_ex(host.target)
+        if error not in (0, errno.EINPROGRESS, errno.EAGAIN):
+            self.disconnect(host)
+            return
+        host.reader = protocol.FrameReader()
+        host.outbuf = bytearray()
+        # writable once the connection is established or failed
+        self.selector.register(host.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, host)
+
+    def disconnect(self, host: RemoteHost, retry: bool = True) -> None:
+        wasConnected = host.connected
+        if host.sock is not None:
+            try:
+                self.selector.unregister(host.sock)
+            except (KeyError, ValueError):
+                pass
+            host.sock.close()
+            host.sock = None
+        host.connected = False
+        if retry:
+            host.retryAt = time.monotonic() + host.retry
+            host.retry = min(host.retry * 2, MAX_RETRY)
+        # nothing is published once stop() was called, the consumer may be gone
+        if wasConnected and self.running:
+            self.offer(host)
+
+    def watch(self, host: RemoteHost) -> None:
+        events = selectors.EVENT_READ
+        if host.outbuf or not host.connected:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(host.sock, events, host)
+
+    # returns whether new values arrived
+    def service(self, host: RemoteHost, mask: int) -> bool:
+        if not host.connected:
+            if host.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+                self.disconnect(host)
+                return False
+            host.connected = True
+            host.retry = MIN_RETRY
+            if host.family != socket.AF_UNIX:
+                host.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.watch(host)
+
+        updated = False
+        if mask & selectors.EVENT_READ:
+            try:
+                data = host.sock.recv(262144)
+            except BlockingIOError:
+                data = None
+            except OSError:
+                data = b""
+            if data == b"":
+                self.disconnect(host)
+                return False
+            if data:
+                try:
+                    for kind, payload in host.reader.feed(data):
+                        if kind == protocol.SCHEMA:
+                            host.applySchema(protocol.parseSchema(payload))
+                        elif kind == protocol.VALUES:
+                            host.applyValues(payload)
+                            updated = True
+                except (protocol.ProtocolError, KeyError, ValueError, TypeError):
+                    self.disconnect(host)
+                    return False
+
+        if mask & selectors.EVENT_WRITE and host.outbuf:
+            try:
+                sent = host.sock.send(host.outbuf)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.disconnect(host)
+                return False
+            del host.outbuf[:sent]
+            self.watch(host)
+        return updated
+
+    # requests from the GUI thread
+    def commands(self, changed: set) -> None:
+        try:
+            while self.wakeRead.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        if self.resetRequested:
+            self.resetRequested = False
+            for host in self.hosts:
+                if host.connected:
+                    host.outbuf += protocol.frame(protocol.RESET)
+                    self.watch(host)
+        if self.republish:
+            self.republish = False
+            changed.update(host for host in self.hosts if host.received)
+
+    def offer(self, host: RemoteHost) -> None:
+        snapshot = host.snapshot(self.celsius) if host.received else None
+        with self.lock:
+            self.latest[host.address] = (host, snapshot)
+            notify = not self.pending
+            self.pending = True
+        if notify and self.publish:
+            self.publish()
+
+    # (host, snapshot or None) per host that changed since the last call
+    def takeSnapshots(self) -> list:
+        with self.lock:
+            self.pending = False
+            latest = list(self.latest.values())
+            self.latest = {}
+        return latest
+
+    def wake(self) -> None:
+        try:
+            self.wakeWrite.send(b"\0")
+        except OSError:
+            pass
+
+    # forwarded to every connected agent
+    def requestReset(self) -> None:
+        self.resetRequested = True
+        self.wake()
+
+    def setCelsius(self, celsius: bool) -> None:
+        self.celsius = celsius
+        self.republish = True
+        self.wake()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wake()
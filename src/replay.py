@@ -0,0 +1,191 @@
+import threading
+import time
+
+from collector import Snapshot
+from profiler import Profiler
+from recorder import Recording
+from sensortable import SensorTable
+from stats import SensorStats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# publishes at most this often (seconds), records in between are folded into min/max
+MIN_FRAME = 0.05
+
+# plays a recording back in place of a Collector, with the same takeSnapshot / requestReset /
+# setCelsius interface, `speed` is recorded seconds per wall second, 0 pauses
+# records skipped between two published frames are still folded into min/max and the
+# statistics, both start over after a seek
+class Replay(threading.Thread):
+    def __init__(self, path: str, speed: float = 1.0, publish=None) -> None:
+        super().__init__(name="sensmon-replay", daemon=True)
+        self.recording = Recording(path)
+        self.publish = publish
+        self.speed = speed
+
+        self.table = SensorTable()
+        self.stats = SensorStats(self.table)
+        self.profiler = Profiler()
+        self.celsius = True
+        # segment whose rows the table currently mirrors and its columns -> table rows
+        self.segment = None
+        self.columns = None
+        self.rows = None
+        # next record to apply and the playback clock anchor (wall time, recorded time)
+        self.position = (0, 0)
+        self.timestamp = self.recording.start
+        self.reads = 0
+        self.anchor = (0.0, 0.0)
+
+        self.lock = threading.Lock()
+        self.latest = None
+        self.pending = False
+        self.seekTo = self.recording.start
+        self.resetRequested = False
+        self.publishNow = False
+        self.running = True
+        self.wake = threading.Event()
+
+    def run(self) -> None:
+        while self.running:
+            if self.seekTo is not None:
+                timestamp, self.seekTo = self.seekTo, None
+                self.jump(timestamp)
+                self.publishNow = True
+
+            now = time.monotonic()
+            applied = self.advance(self.anchor[1] + (now - self.anchor[0]) * self.speed)
+
+            if self.resetRequested:
+                self.resetRequested = False
+                self.table.reset()
+                self.stats.reset()
+                self.publishNow = True
+            if applied or self.publishNow:
+                self.publishNow = False
+                self.sample()
+
+            timeout = self.nextDue()
+            if timeout is None or timeout > 0:
+                self.wake.wait(timeout)
+            self.wake.clear()
+
+        self.recording.close()
+
+    # wall seconds until the next record is due, None when paused or at the end
+    def nextDue(self):
+        seg, i = self.position
+        if self.speed <= 0 or seg >= len(self.recording.segments):
+            return None
+        due = self.anchor[0] + (self.recording.segments[seg].times[i] - self.anchor[1]) / self.speed
+        return max(due, time.monotonic() + MIN_FRAME) - time.monotonic()
+
+    def mirror(self, seg: int) -> None:
+        segment = self.recording.segments[seg]
+        local = self.table.mirror(segment.rows)
+        self.segment = seg
+        self.columns = [column for column, row in enumerate(local) if row >= 0]
+        self.rows = [local[column] for column in self.columns]
+        if np is not None:
+            self.columns = np.array(self.columns, dtype=np.intp)
+            self.rows = np.array(self.rows, dtype=np.intp)
+
+    # continue playback from the last record at or before timestamp
+    def jump(self, timestamp: float) -> None:
+        seg, i = self.recording.locate(timestamp)
+        if seg != self.segment:
+            self.mirror(seg)
+        self.apply(seg, i, i + 1)
+        self.table.reset()
+        self.stats.reset()
+        self.position = self.following(seg, i + 1)
+        self.anchor = (time.monotonic(), self.timestamp)
+
+    # (segment, record) normalised past the end of a segment
+    def following(self, seg: int, i: int) -> tuple:
+        if seg < len(self.recording.segments) and i >= self.recording.segments[seg].count:
+            return (seg + 1, 0)
+        return (seg, i)
+
+    # apply every record up to the recorded time `until`, returns whether any was applied
+    def advance(self, until: float) -> bool:
+        applied = False
+        seg, i = self.position
+        while seg < len(self.recording.segments):
+            segment = self.recording.segments[seg]
+            if segment.times[i] > until:
+                break
+            end = segment.locate(until) + 1
+            if seg != self.segment:
+                self.mirror(seg)
+            self.apply(seg, i, end)
+            applied = True
+            seg, i = self.following(seg, end)
+        self.position = (seg, i)
+        return applied
+
+    # records [first, end) of a segment, the last one becomes current, all fold into min/max
+    # and the statistics
+    def apply(self, seg: int, first: int, end: int) -> None:
+        segment = self.recording.segments[seg]
+        table = self.table
+        if np is not None:
+            block = segment.records["v"][first:end][:, self.columns]
+            rows = self.rows
+            table.cur[rows] = block[-1]
+            table.min[rows] = np.fmin(table.min[rows], np.fmin.reduce(block, axis=0))
+            table.max[rows] = np.fmax(table.max[rows], np.fmax.reduce(block, axis=0))
+            for timestamp, values in zip(segment.times[first:end], block):
+                self.stats.update(rows, timestamp, values)
+        else:
+            for i in range(first, end):
+                values = segment.values(i)
+                for column, row in zip(self.columns, self.rows):
+                    table.cur[row] = values[column]
+                table.update()
+                self.stats.update(self.rows, segment.times[i])
+        self.timestamp = segment.times[end - 1]
+        self.reads = segment.reads(end - 1)
+
+    def sample(self) -> None:
+        current, minimum, maximum = self.table.display(self.celsius)
+        devices = self.recording.segments[self.segment].devices
+        snapshot = Snapshot(self.timestamp, self.celsius, devices, self.table.schema, current, minimum, maximum, self.reads,
+                            stats=self.stats.display(self.celsius))
+        with self.lock:
+            self.latest = snapshot
+            notify = not self.pending
+            self.pending = True
+        if notify and self.publish:
+            self.publish()
+
+    def takeSnapshot(self):
+        with self.lock:
+            self.pending = False
+            return self.latest
+
+    def seek(self, timestamp: float) -> None:
+        self.seekTo = timestamp
+        self.wake.set()
+
+    # playback continues from the current position at the new speed
+    def setSpeed(self, speed: float) -> None:
+        self.anchor = (time.monotonic(), self.timestamp)
+        self.speed = speed
+        self.wake.set()
+
+    def requestReset(self) -> None:
+        self.resetRequested = True
+        self.wake.set()
+
+    def setCelsius(self, celsius: bool) -> None:
+        self.celsius = celsius
+        self.publishNow = True
+        self.wake.set()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wake.set()
@@ -0,0 +1,132 @@
+import heapq
+import json
+from pathlib import Path
+
+from config import configPath
+from sensortable import SensorTable
+
+# per sensor type polling interval limits in seconds: (floor, ceiling)
+DEFAULT_LIMITS = {
+    "Temperature": (0.25, 5.0),
+    "Power": (0.25, 5.0),
+    "Clock": (0.5, 5.0),
+    "RPM": (0.5, 10.0),
+    "Voltage": (1.0, 30.0)
+}
+FALLBACK_LIMITS = (1.0, 10.0)
+
+# change in display units that counts as "moving", smaller changes relax the interval
+DEFAULT_THRESHOLDS = {
+    "Temperature": 0.5,
+    "Power": 0.5,
+    "Clock": 10.0,
+    "RPM": 25.0,
+    "Voltage": 0.01
+}
+
+# optional overrides, e.g. {"Temperature": [0.1, 2], "Voltage": [5, 60]}
+def loadLimits(path: Path = None) -> dict:
+    limits = dict(DEFAULT_LIMITS)
+    try:
+        for sensType, (floor, ceiling) in json.loads((path or configPath("polling.json")).read_text()).items():
+            limits[sensType] = (float(floor), float(ceiling))
+    except (OSError, ValueError, TypeError):
+        pass
+    return limits
+
+# one polled table row
+class Channel:
+    __slots__ = ("row", "floor", "ceiling", "threshold", "interval", "due", "last", "reads", "removed")
+
+    def __init__(self, row: int, floor: float, ceiling: float, threshold: float) -> None:
+        self.row = row
+        self.floor = floor
+        self.ceiling = ceiling
+        self.threshold = threshold
+        # start at the old fixed 1 s rate and adapt from there
+        self.interval = min(max(1.0, floor), ceiling)
+        self.due = 0.0
+        self.last = None
+        self.reads = 0
+        self.removed = False
+
+# gives every channel its own polling interval, kept in a heap keyed by next due time
+# the interval halves while a value moves by at least its threshold and grows by half
+# toward the ceiling while it is stable
+class PollScheduler:
+    # fixed -> poll every channel at this interval instead of adapting
+    def __init__(self, table: SensorTable, limits: dict = None, thresholds: dict = None,
+                 tighten: float = 0.5, relax: float = 1.5, fixed: float = None) -> None:
+        self.table = table
+        self.fixed = fixed
+        self.limits = limits if limits is not None else loadLimits()
+        self.thresholds = thresholds if thresholds is not None else DEFAULT_THRESHOLDS
+        self.tighten = tighten
+        self.relax = relax
+        self.channels = {}
+        self.heap = []
+        self.reads = 0
+
+    # the row is read by its provider's sample() whenever it is due
+    def add(self, row: int, now: float) -> None:
+        info = self.table.rows[row]
+        if self.fixed:
+            floor = ceiling = self.fixed
+        else:
+            floor, ceiling = self.limits.get(info.sensType, FALLBACK_LIMITS)
+        threshold = self.thresholds.get(info.sensType, 0.0) * info.scale
+        channel = Channel(row, floor, ceiling, threshold)
+        channel.due = now
+        self.channels[row] = channel
+        heapq.heappush(self.heap, (now, row))
+
+    # heap entries of removed channels are skipped lazily
+    def remove(self, row: int) -> None:
+        channel = self.channels.pop(row, None)
+        if channel:
+            channel.removed = True
+
+    def nextDue(self) -> float:
+        while self.heap:
+            due, row = self.heap[0]
+            channel = self.channels.get(row)
+            if channel is not None and channel.due == due:
+                return due
+            heapq.heappop(self.heap)
+        return float("inf")
+
+    # pops every channel that is due at `now`
+    def due(self, now: float) -> list:
+        ready = []
+        while self.heap and self.heap[0][0] <= now:
+            due, row = heapq.heappop(self.heap)
+            channel = self.channels.get(row)
+            if channel is not None and channel.due == due:
+                ready.append(channel)
+        return ready
+
+    # adapt the interval to how much the value moved since its last read and reschedule
+    def sampled(self, channel: Channel, now: float) -> None:
+        channel.reads += 1
+        self.reads += 1
+
+        value = self.table.cur[channel.row]
+        if channel.last is not None and value == value:
+            change = abs(value - channel.last)
+            if change > 0 and change >= channel.threshold:
+                channel.interval = max(channel.floor, channel.interval * self.tighten)
+            else:
+                channel.interval = min(channel.ceiling, channel.interval * self.relax)
+        channel.last = value
+
+        if not channel.removed:
+            channel.due = now + channel.interval
+            heapq.heappush(self.heap, (channel.due, channel.row))
+
+    # reads per table row and the current interval, to verify the savings
+    def stats(self) -> dict:
+        return {
+            "reads": self.reads,
+            "channels": {self.table.rows[c.row].uid: {"reads": c.reads, "interval": c.interval}
+                         for c in self.channels.values()}
+        }
@@ -0,0 +1,465 @@
+import math
+import os
+
+from PyQt6.QtCore import QAbstractItemModel, QModelIndex, Qt, QTimer
+from PyQt6.QtGui import QColor, QFont, QIcon
+
+from sensortable import displayUnit
+from stats import STATS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HEADERS = ("Sensor", "Current", "Min", "Max") + STATS
+# first column of the running statistics
+STATS_COLUMN = 4
+
+HOST, DEVICE, GROUP, SENSOR = range(4)
+
+# roles data() answers, the view asks for seven per painted cell, the others get None
+# before any lookup
+DISPLAY, DECORATION, FONT, BACKGROUND, FOREGROUND, TOOLTIP = (
+    Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.DecorationRole, Qt.ItemDataRole.FontRole,
+    Qt.ItemDataRole.BackgroundRole, Qt.ItemDataRole.ForegroundRole, Qt.ItemDataRole.ToolTipRole)
+ROLES = frozenset((DISPLAY, DECORATION, FONT, BACKGROUND, FOREGROUND, TOOLTIP))
+
+# values of rows whose provider missed its deadline
+STALE_COLOR = QColor(128, 128, 128)
+# rows with a raised warning / critical alert, translucent so they work with both themes
+ALERT_COLORS = (None, QColor(255, 170, 0, 90), QColor(230, 30, 30, 120))
+ALERT_FONT = QFont()
+ALERT_FONT.setBold(True)
+
+# tree rows inserted in the first event loop turn while new devices are filled in, so
+# the window shows a screenful of sensors right away, every following turn inserts twice
+# as many as the one before, the view lays out all shown rows again after each turn
+BATCH_ROWS = 200
+
+# sensor type -> icon shared by every group of that type, so each svg is decoded once
+ICONS = {}
+
+# types without an icon, e.g. those of virtual sensors, get an empty one
+def typeIcon(sensType: str) -> QIcon:
+    icon = ICONS.get(sensType)
+    if icon is None:
+        path = f'../assets/icons/{sensType}.svg'
+        icon = ICONS[sensType] = QIcon(path) if os.path.exists(path) else QIcon()
+    return icon
+
+# a host, device, sensor type group or sensor row of the tree
+#   key    -> host key, device id, (device id, sensor type) or row uid
+#   row    -> table row of a sensor node, pos -> index among its parent's children
+#   source -> Source a sensor node's values come from
+#   status -> second column of a host node
+class Node:
+    __slots__ = ("parent", "children", "kind", "key", "label", "row", "pos", "icon", "source", "status")
+
+    def __init__(self, parent, kind: int, key, label: str, row: int = -1) -> None:
+        self.parent = parent
+        self.children = []
+        self.kind = kind
+        self.key = key
+        self.label = label
+        self.row = row
+        self.pos = 0
+        self.icon = None
+        self.source = None
+        self.status = None
+
+def renumber(node: Node) -> None:
+    for pos, child in enumerate(node.children):
+        child.pos = pos
+
+def formatValue(value: float, unit: str) -> str:
+    if not math.isfinite(value):
+        return "-"
+    if unit:
+        return f"{value} {unit}"
+    return f"{value}"
+
+# one stream of snapshots (the local collector or a remote agent) and the nodes built
+# from it, each source has its own table rows
+#   key  -> what applySnapshot() is called with for it
+#   node -> where its devices are attached, the root or its host node
+class Source:
+    def __init__(self, key, node: Node) -> None:
+        self.key = key
+        self.node = node
+        self.devices = {}
+        self.groups = {}
+        # collision-free identity (RowInfo.uid) -> sensor node, and table row -> sensor node
+        self.sensors = {}
+        self.rowNodes = []
+        # devices that are built but not in the tree yet, see fillWaiting()
+        self.waiting = {}
+        # device id -> position in the snapshot's device order (gpus first)
+        self.rank = {}
+
+        self.snapshot = None
+        self.current = []
+        self.minimum = []
+        self.maximum = []
+        self.stale = []
+        # one list per stats.STATS column, empty for sources without statistics
+        self.stats = ()
+        # table row -> (severity, description) of rows with a raised alert
+        self.alerts = {}
+
+# [host ->] device -> sensor type -> sensor tree backed directly by collector snapshots
+# text is only formatted in data(), i.e. for rows the view actually paints, and each
+# snapshot emits dataChanged only for the rows whose values changed
+#
+# with a single source its devices are the top-level nodes, sources added with addHost()
+# get a top-level host node each
+#
+# new devices are not inserted by applySnapshot() itself but in growing batches from the
+# event loop, see fillWaiting()
+class SensorTreeModel(QAbstractItemModel):
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.root = Node(None, HOST, None, "")
+        self.sources = {None: Source(None, self.root)}
+        self.fillScheduled = False
+        self.batchRows = BATCH_ROWS
+
+    def nodeOf(self, index: QModelIndex) -> Node:
+        return index.internalPointer() if index.isValid() else self.root
+
+    def indexOf(self, node: Node, column: int = 0) -> QModelIndex:
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.pos, column, node)
+
+    def index(self, row: int, column: int, parent: QModelIndex = QModelIndex()) -> QModelIndex:
+        node = self.nodeOf(parent)
+        if 0 <= row < len(node.children) and 0 <= column < len(HEADERS):
+            return self.createIndex(row, column, node.children[row])
+        return QModelIndex()
+
+    def parent(self, index: QModelIndex) -> QModelIndex:
+        if not index.isValid():
+            return QModelIndex()
+        return self.indexOf(index.internalPointer().parent)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        if parent.isValid() and parent.column() != 0:
+            return 0
+        return len(self.nodeOf(parent).children)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return len(HEADERS)
+
+    def headerData(self, section: int, orientation: Qt.Orientation, role: int = Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            return HEADERS[section]
+        return None
+
+    def data(self, index: QModelIndex, role: int = DISPLAY):
+        if role not in ROLES or not index.isValid():
+            return None
+        node = index.internalPointer()
+        column = index.column()
+
+        if role == DISPLAY:
+            if column == 0:
+                return node.label
+            if node.kind == HOST:
+                return node.status if column == 1 else None
+            if node.kind != SENSOR:
+                return None
+            source = node.source
+            if column >= STATS_COLUMN:
+                if not source.stats:
+                    return None
+                values = source.stats[column - STATS_COLUMN]
+            else:
+                values = (source.current, source.minimum, source.maximum)[column - 1]
+            unit = displayUnit(source.snapshot.schema[node.row], source.snapshot.celsius)
+            return formatValue(values[node.row], unit)
+
+        if role == DECORATION:
+            return node.icon if column == 0 else None
+        if node.kind != SENSOR:
+            return None
+        alert = node.source.alerts.get(node.row)
+        if alert is not None:
+            if role == BACKGROUND:
+                return ALERT_COLORS[alert[0]]
+            if role == FONT:
+                return ALERT_FONT
+            if role == TOOLTIP:
+                return alert[1]
+        if node.row < len(node.source.stale) and node.source.stale[node.row]:
+            if role == FOREGROUND and column > 0:
+                return STALE_COLOR
+            if role == TOOLTIP:
+                return "Last known value, the sensor did not answer in time"
+        return None
+
+    # (source key, table row, RowInfo) of a sensor row, or of every sensor of a sensor type group
+    def sensorsAt(self, index: QModelIndex) -> list:
+        node = self.nodeOf(index)
+        if node.kind == GROUP:
+            nodes = node.children
+        elif node.kind == SENSOR:
+            nodes = [node]
+        else:
+            return []
+        return [(child.source.key, child.row, child.source.snapshot.schema[child.row]) for child in nodes]
+
+    # top-level node for a source keyed by `key`, hosts are shown in the order they are added
+    def addHost(self, key, label: str) -> None:
+        if key in self.sources:
+            return
+        node = Node(self.root, HOST, key, label)
+        node.pos = len(self.root.children)
+        self.beginInsertRows(QModelIndex(), node.pos, node.pos)
+        self.root.children.append(node)
+        self.endInsertRows()
+        self.sources[key] = Source(key, node)
+
+    def setHostStatus(self, key, label: str, status: str) -> None:
+        node = self.sources[key].node
+        if node.label != label or node.status != status:
+            node.label = label
+            node.status = status
+            self.dataChanged.emit(self.indexOf(node, 0), self.indexOf(node, 1))
+
+    def applySnapshot(self, snapshot, key=None) -> None:
+        source = self.sources[key]
+        previous = source.snapshot
+        source.snapshot = snapshot
+
+        if previous is None or snapshot.schema is not previous.schema:
+            self.addRows(source, snapshot)
+            self.renameDevices(source, snapshot)
+            self.removeRetired(source, snapshot)
+
+        current = snapshot.current.tolist()
+        minimum = snapshot.minimum.tolist()
+        maximum = snapshot.maximum.tolist()
+        stale = snapshot.stale.tolist() if snapshot.stale is not None else []
+        stats = tuple(values.tolist() for values in snapshot.stats) if snapshot.stats is not None else ()
+        alerts = snapshot.alerts if snapshot.alerts is not None else {}
+
+        if previous is None or previous.celsius != snapshot.celsius or (previous.stats is None) != (snapshot.stats is None):
+            changed = range(len(current))
+        else:
+            changed = self.changedRows(previous, snapshot)
+            if alerts is not source.alerts:
+                # rows whose alert was raised, cleared or changed
+                moved = [row for row in alerts.keys() | source.alerts.keys() if alerts.get(row) != source.alerts.get(row)]
+                if moved:
+                    changed = sorted(set(changed).union(moved))
+
+        source.current, source.minimum, source.maximum, source.stale, source.stats = current, minimum, maximum, stale, stats
+        source.alerts = alerts
+        self.emitChanged(source, changed)
+
+    # table rows whose current, min, max, statistics or stale flag differ from the previous snapshot
+    def changedRows(self, previous, snapshot):
+        n = len(previous.current)
+        size = len(snapshot.current)
+        stale = previous.stale is not None and snapshot.stale is not None
+        columns = [(previous.current, snapshot.current), (previous.minimum, snapshot.minimum),
+                   (previous.maximum, snapshot.maximum)]
+        if snapshot.stats is not None:
+            columns.extend(zip(previous.stats, snapshot.stats))
+
+        if np is not None:
+            diff = np.zeros(size, dtype=bool)
+            for old, new in columns:
+                a, b = old[:n], new[:n]
+                diff[:n] |= ~((a == b) | (np.isnan(a) & np.isnan(b)))
+            if stale:
+                diff[:n] |= previous.stale[:n] != snapshot.stale[:n]
+            diff[n:] = True
+            return np.flatnonzero(diff).tolist()
+
+        changed = []
+        for row in range(size):
+            if row >= n or (stale and previous.stale[row] != snapshot.stale[row]):
+                changed.append(row)
+                continue
+            for old, new in columns:
+                a, b = old[row], new[row]
+                if a != b and (a == a or b == b):
+                    changed.append(row)
+                    break
+        return changed
+
+    # one dataChanged per run of adjacent sibling rows
+    def emitChanged(self, source: Source, rows) -> None:
+        rowNodes = source.rowNodes
+        waiting = source.waiting
+        first = last = None
+        for row in rows:
+            if row >= len(rowNodes):
+                continue
+            node = rowNodes[row]
+            if node is None or (waiting and node.parent.parent in waiting):
+                continue
+            if last is not None and node.parent is last.parent and node.pos == last.pos + 1:
+                last = node
+                continue
+            if first is not None:
+                self.dataChanged.emit(self.indexOf(first, 0), self.indexOf(last, len(HEADERS) - 1))
+            first = last = node
+        if first is not None:
+            self.dataChanged.emit(self.indexOf(first, 0), self.indexOf(last, len(HEADERS) - 1))
+
+    # builds nodes for rows that appeared since the last snapshot, new devices wait for
+    # fillWaiting(), groups and sensors of shown devices are inserted right away, a new
+    # group as a whole subtree so the view can expand it once inserted
+    def addRows(self, source: Source, snapshot) -> None:
+        schema = snapshot.schema
+        start = len(source.rowNodes)
+        if start >= len(schema):
+            return
+        source.rowNodes.extend([None] * (len(schema) - start))
+
+        # nodes built here that are not in the tree yet, and (parent, node) inserts to announce
+        fresh = set()
+        pending = []
+        waiting = source.waiting
+        for row in range(start, len(schema)):
+            info = schema[row]
+            if info.retired:
+                continue
+
+            device = source.devices.get(info.device)
+            if device is None:
+                device = Node(source.node, DEVICE, info.device, info.deviceName)
+                source.devices[info.device] = device
+                waiting[device] = None
+
+            key = (info.device, info.sensType)
+            group = source.groups.get(key)
+            if group is None:
+                group = Node(device, GROUP, key, info.sensType)
+                group.icon = typeIcon(info.sensType)
+                source.groups[key] = group
+                if device in waiting:
+                    device.children.append(group)
+                else:
+                    pending.append((device, group))
+                fresh.add(group)
+
+            sensor = Node(group, SENSOR, info.uid, info.label, row)
+            sensor.source = source
+            source.sensors[info.uid] = sensor
+            source.rowNodes[row] = sensor
+            if group in fresh or device in waiting:
+                group.children.append(sensor)
+            else:
+                pending.append((group, sensor))
+
+        source.rank = {device: i for i, device in enumerate(snapshot.devices)}
+        for parent, node in pending:
+            position = len(parent.children)
+            renumber(node)
+            self.beginInsertRows(self.indexOf(parent), position, position)
+            parent.children.append(node)
+            renumber(parent)
+            self.endInsertRows()
+
+        if waiting and not self.fillScheduled:
+            self.fillScheduled = True
+            QTimer.singleShot(0, self.fillWaiting)
+
+    # inserts the waiting devices of every source, first in device order, until a batch of
+    # rows went in, then continues with a larger batch on the next event loop turn
+    def fillWaiting(self) -> None:
+        self.fillScheduled = False
+        budget = self.batchRows
+        for source in self.sources.values():
+            if budget <= 0:
+                break
+            if not source.waiting:
+                continue
+            rank = source.rank
+            batch = []
+            for device in sorted(source.waiting, key=lambda device: rank.get(device.key, len(rank))):
+                batch.append(device)
+                budget -= 1 + len(device.children) + sum(len(group.children) for group in device.children)
+                if budget <= 0:
+                    break
+            for device in batch:
+                del source.waiting[device]
+                renumber(device)
+                for group in device.children:
+                    renumber(group)
+            self.insertDevices(source, batch)
+
+        if any(source.waiting for source in self.sources.values()):
+            self.batchRows *= 2
+            self.fillScheduled = True
+            QTimer.singleShot(0, self.fillWaiting)
+        else:
+            self.batchRows = BATCH_ROWS
+
+    # devices in device order, each run of them that lands between the same two shown
+    # devices is a single insert
+    def insertDevices(self, source: Source, devices: list) -> None:
+        parent = source.node
+        rank = source.rank
+        def position(device: Node) -> int:
+            # device order follows the snapshot's device order (gpus first)
+            return sum(1 for child in parent.children if rank.get(child.key, len(rank)) < rank.get(device.key, len(rank)))
+
+        i = 0
+        while i < len(devices):
+            first = position(devices[i])
+            end = i + 1
+            while end < len(devices) and position(devices[end]) == first:
+                end += 1
+            self.beginInsertRows(self.indexOf(parent), first, first + end - i - 1)
+            parent.children[first:first] = devices[i:end]
+            renumber(parent)
+            self.endInsertRows()
+            i = end
+
+    # device display names may be resolved after the rows were shown
+    def renameDevices(self, source: Source, snapshot) -> None:
+        for info in snapshot.schema:
+            device = source.devices.get(info.device)
+            if device is not None and device.label != info.deviceName:
+                device.label = info.deviceName
+                if device not in source.waiting:
+                    index = self.indexOf(device)
+                    self.dataChanged.emit(index, index)
+
+    # drops the rows of hot-unplugged devices, along with groups and devices left empty
+    def removeRetired(self, source: Source, snapshot) -> None:
+        for row, info in enumerate(snapshot.schema):
+            if not info.retired or row >= len(source.rowNodes) or source.rowNodes[row] is None:
+                continue
+            node = source.rowNodes[row]
+            source.rowNodes[row] = None
+            source.sensors.pop(info.uid, None)
+
+            device = node.parent.parent
+            while node.parent is not source.node and len(node.parent.children) == 1:
+                node = node.parent
+            if node.kind == DEVICE:
+                del source.devices[node.key]
+                for key in [key for key in source.groups if key[0] == node.key]:
+                    del source.groups[key]
+            elif node.kind == GROUP:
+                del source.groups[node.key]
+
+            parent = node.parent
+            if device in source.waiting:
+                # not in the tree yet
+                if node is device:
+                    del source.waiting[device]
+                else:
+                    parent.children.remove(node)
+                    renumber(parent)
+                continue
+            self.beginRemoveRows(self.indexOf(parent), node.pos, node.pos)
+            parent.children.remove(node)
+            renumber(parent)
+            self.endRemoveRows()
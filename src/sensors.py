@@ -1,19 +1,79 @@
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait
+import errno
+import functools
+import os
 import subprocess
+import time
+
+from engine import Provider
+from hotplug import HwmonWatcher
+from namecache import NameCache, deviceIdentity
+from readerpool import SLOW_READ, ReaderPool
+from sensortable import RowInfo, SensorTable
+
+# raw hwmon units -> display units (millidegrees, millivolts, microwatts, Hz)
+SCALES = {
+    "Temperature": (1000, "°C"),
+    "Voltage": (1000, "V"),
+    "RPM": (1, "RPM"),
+    "Power": (1000000, "W"),
+    "Clock": (1000000, "MHz")
+}
 
 # known motherboard indentifers / Super I/O chips
 MOTHERBOARDS = ("gigabyte_wmi", "asus_wmi", "asusec", "nct6", "it86", "it87", "w83", "pch_")
 
-# represents a single hwmon sensor (_input file)
+# discovery waits this long for uncached display names before showing kernel names
+RESOLVE_TIMEOUT = 0.5
+GLXINFO_TIMEOUT = 5
+
+# prefix for the sysfs and procfs paths read during discovery, lets sensmon run against a
+# generated tree (see bench/fakesys.py)
+ROOT_ENV = "SENSMON_ROOT"
+
+# errors returned by an open attribute whose device has been unbound or removed
+REOPEN_ERRNOS = (errno.ENODEV, errno.ENXIO)
+
+# limit attributes next to an _input file, raw units like the input, read once at discovery
+LIMITS = ("min", "max", "lcrit", "crit", "max_hyst", "crit_hyst")
+# alarm flags the chip raises itself, they change and are re-read once per published snapshot
+ALARMS = ("alarm", "min_alarm", "max_alarm", "lcrit_alarm", "crit_alarm")
+
+# represents a single hwmon sensor (_input file), a view over one SensorTable row
+# in persistent mode the _input file stays open for the sensor's lifetime and is
+# re-read with pread at offset 0, sysfs regenerates the value on every read from 0
+#   limits -> e.g. {"max": 80000, "crit": 95000} from the _max/_crit/... attributes
+#   alarms -> alarm attribute -> path, e.g. {"crit_alarm": .../temp1_crit_alarm}
 class Sensor:
-    def __init__(self, inputPath: Path, label: str, sensType: str) -> None:
+    def __init__(self, inputPath: Path, label: str, sensType: str, table: SensorTable, row: int, persistent: bool = True,
+                 limits: dict = None, alarms: dict = None) -> None:
         self.inputPath = inputPath
         self.label = label
         self.sensType = sensType
-        self.initValue = True
-        self.currentValue = 0
-        self.maxValue = 0
-        self.minValue = 0
+        self.table = table
+        self.row = row
+        self.persistent = persistent
+        self.limits = limits or {}
+        self.alarms = alarms or {}
+        self.fd = -1
+        self.buffer = bytearray(32)
+
+    @property
+    def uid(self) -> str:
+        return self.table.rows[self.row].uid
+
+    @property
+    def currentValue(self) -> float:
+        return self.table.cur[self.row]
+
+    @property
+    def maxValue(self) -> float:
+        return self.table.max[self.row]
+
+    @property
+    def minValue(self) -> float:
+        return self.table.min[self.row]
 
     def getCurrent(self) -> float:
         return float(self.currentValue)
@@ -25,27 +85,68 @@ class Sensor:
         return float(self.minValue)
 
     def read(self) -> None:
+        readValue = self.value()
+        if readValue is None:
+            return
+
+        # min/max are folded in by SensorTable.update() once per tick
+        self.table.cur[self.row] = readValue
+
+    # the raw value, None when it cannot be read, leaves the table alone
+    def value(self):
         try:
-            readValue = self.inputPath.read_text().strip()
-            self.currentValue = readValue
-            if self.initValue:
-                self.maxValue = readValue
-                self.minValue = readValue
-                self.initValue= False
-            else:
-                if int(self.currentValue) > int(self.maxValue):
-                    self.maxValue = readValue
-                if int(self.currentValue) < int(self.minValue):
-                    self.minValue = readValue
-        except (OSError):
-            pass
+            if self.persistent:
+                return self.readFd()
+            return int(self.inputPath.read_text())
+        except (OSError, ValueError):
+            return None
+
+    # names of the alarm attributes that are currently set
+    def raisedAlarms(self) -> tuple:
+        raised = []
+        for name, path in self.alarms.items():
+            try:
+                if int(path.read_text()):
+                    raised.append(name)
+            except (OSError, ValueError):
+                pass
+        return tuple(raised)
+
+    # one pread syscall per tick, the fd is reopened once if the device went away
+    def readFd(self) -> int:
+        if self.fd < 0:
+            self.fd = os.open(self.inputPath, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            size = os.preadv(self.fd, [self.buffer], 0)
+        except OSError as e:
+            if e.errno == errno.ESPIPE:
+                # not seekable, fall back to open/read/close for this sensor
+                self.close()
+                self.persistent = False
+                return int(self.inputPath.read_text())
+            if e.errno not in REOPEN_ERRNOS:
+                raise
+            self.close()
+            self.fd = os.open(self.inputPath, os.O_RDONLY | os.O_CLOEXEC)
+            size = os.preadv(self.fd, [self.buffer], 0)
+        return int(self.buffer[:size])
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = -1
 
 # represents a single hwmon device directory
 # a single hwmon device may consist of multiple sensors
 class HwmonDevice:
-    def __init__(self, name: str, path: Path) -> None:
+    def __init__(self, name: str, path: Path, persistent: bool = True, table: SensorTable = None) -> None:
         self.name = name
         self.path = path
+        self.persistent = persistent
+        self.table = table if table is not None else SensorTable()
         self.id = ""
         self.sensors = []
         self.sensorType = {
@@ -57,10 +158,14 @@ class HwmonDevice:
         }
 
     # discover valid input files in device directory and converts them to Sensor objects
+    # each sensor gets a table row, rows are added in display order
     def findSensors(self) -> None:
         sortOrder = {"Temperature": 0, "Voltage": 1, "RPM": 2, "Power": 3, "Clock": 4}
+        found = []
 
-        for file in self.path.iterdir():
+        files = list(self.path.iterdir())
+        names = {file.name for file in files}
+        for file in files:
             if self.isValidSensor(file):
                 labelPath = self.path / file.name.replace("input", "label")
                 if labelPath.exists():
@@ -69,26 +174,50 @@ class HwmonDevice:
                     label = file.name
 
                 sensType = self.getSensorType(str(file.name))
-
-                sensor = Sensor(file, label, sensType)
-                self.sensors.append(sensor)
+                found.append((file, label, sensType))
 
         # reorder the list of sensors, as discovery produced a random order
-        self.sensors.sort(key=lambda s: (
-            sortOrder.get(s.sensType, 99), 
-            Path(s.inputPath).name
+        found.sort(key=lambda f: (
+            sortOrder.get(f[2], 99), 
+            f[0].name
         ))
-    
+
+        for file, label, sensType in found:
+            scale, unit = SCALES.get(sensType, (1, ""))
+            row = self.table.addRow(RowInfo(f"{self.id}/{file.name}", self.id, self.name, sensType, label, scale, unit))
+            limits, alarms = self.findLimits(file.name[:-len("input")], names)
+            self.sensors.append(Sensor(file, label, sensType, self.table, row, self.persistent, limits, alarms))
+
+    # limit values and alarm paths of the sensor whose attributes start with `prefix` (e.g. "temp1_")
+    # unset limits read as 0 on many chips and are skipped
+    def findLimits(self, prefix: str, names: set) -> tuple:
+        limits = {}
+        for name in LIMITS:
+            if prefix + name in names:
+                try:
+                    value = int((self.path / (prefix + name)).read_text())
+                except (OSError, ValueError):
+                    continue
+                if value:
+                    limits[name] = value
+        alarms = {name: self.path / (prefix + name) for name in ALARMS if prefix + name in names}
+        return limits, alarms
+
     def getSensorType(self, fileName: str) -> str:
         return next((self.sensorType[prefix] for prefix in self.sensorType if fileName.startswith(prefix)), "Other")
 
+    # attributes are regular files in sysfs, generated trees may use fifos for slow sensors
     def isValidSensor(self, file: Path) -> bool:
-        if file.is_file() and file.name.endswith("_input"):
+        if file.name.endswith("_input") and not file.is_dir():
             for sType in self.sensorType:
                 if file.name.startswith(sType):
                     return True
         return False
 
+    def close(self) -> None:
+        for sensor in self.sensors:
+            sensor.close()
+
     def printSensors(self) -> None:
         print('-' + self.id)
         for i in self.sensors:
@@ -96,12 +225,67 @@ class HwmonDevice:
             print(i.getCurrent(), end=' ')
         print("")
 
-# builds a list of HwmonDevice objects from hwmon devices under /sys/class/hwmon
+def linkTarget(path: Path) -> str:
+    try:
+        return os.readlink(path)
+    except OSError:
+        return ""
+
+# /proc/cpuinfo and the DMI board files are the same for every device, read them only once
+@functools.lru_cache(maxsize=None)
+def cpuModel(cpuInfo: Path):
+    if cpuInfo.exists():
+        for line in cpuInfo.read_text().splitlines():
+            if line.startswith("model name"):
+                return line.split(":", 1)[1].strip()
+    return None
+
+@functools.lru_cache(maxsize=None)
+def boardName(dmiPath: Path) -> str:
+    vendor = (dmiPath / "board_vendor").read_text().strip()
+    board = (dmiPath / "board_name").read_text().strip()
+    return f"{vendor} {board}"
+
+def sysRoot() -> Path:
+    return Path(os.environ.get(ROOT_ENV) or "/")
+
+# builds a list of HwmonDevice objects from hwmon devices under <root>/sys/class/hwmon
+# display names come from the name cache when possible, otherwise they are resolved in
+# parallel and discovery waits at most RESOLVE_TIMEOUT for them, late results are applied
+# by applyResolvedNames() on the sampling thread
 class HwmonManager:
-    def __init__(self) -> None:
+    # root -> prefix for every sysfs/procfs path, defaults to $SENSMON_ROOT or /
+    def __init__(self, persistentFds: bool = True, table: SensorTable = None, names: NameCache = None, root: Path = None) -> None:
         self.hwmonx = []
-        self.path = Path("/sys/class/hwmon/")
+        self.root = Path(root) if root is not None else sysRoot()
+        self.path = self.root / "sys/class/hwmon"
+        self.dmiPath = self.root / "sys/class/dmi/id"
+        self.cpuInfo = self.root / "proc/cpuinfo"
         self.devNum = 0
+        self.persistentFds = persistentFds
+        self.table = table if table is not None else SensorTable()
+        self.names = names if names is not None else NameCache()
+        self.resolver = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sensmon-names")
+        self.resolved = []
+
+        # hwmon directory name -> (symlink target, HwmonDevice), diffed by rescan()
+        self.known = {}
+        self.watcher = None
+
+    # stores fresh raw values in the table, min/max follow on the next table.update()
+    def readAll(self) -> None:
+        if self.resolved:
+            self.applyResolvedNames()
+        for dev in self.hwmonx:
+            for sensor in dev.sensors:
+                sensor.read()
+
+    def close(self) -> None:
+        self.resolver.shutdown(wait=False, cancel_futures=True)
+        if self.watcher:
+            self.watcher.close()
+        for dev in self.hwmonx:
+            dev.close()
     
     """
     convert kernel provided hwmon name to more identifiable name:
@@ -114,19 +298,15 @@ class HwmonManager:
 
         # motherboard check
         if any(mb in defaultName for mb in MOTHERBOARDS):
-            vendor = Path("/sys/class/dmi/id/board_vendor").read_text().strip()
-            board = Path("/sys/class/dmi/id/board_name").read_text().strip()
-            return f"{vendor} {board}"
+            return boardName(self.dmiPath)
 
         # cpu check
         if defaultName in ["k10temp", "coretemp"]:
-            cpuInfo = Path("/proc/cpuinfo")
-            if cpuInfo.exists():
-                for line in cpuInfo.read_text().splitlines():
-                    if line.startswith("model name"):
-                        return line.split(":", 1)[1].strip()
-            else:
+            if not self.cpuInfo.exists():
                 return defaultName
+            model = cpuModel(self.cpuInfo)
+            if model:
+                return model
 
         # nvme check
         if "nvme" in defaultName:
@@ -136,49 +316,245 @@ class HwmonManager:
             else:
                 return defaultName
 
-        # gpu check
+        # gpu check, glxinfo may hang without a display
         if "gpu" in defaultName:
             try:
-                out = subprocess.check_output(["glxinfo", "-B"], text = True)
+                out = subprocess.check_output(["glxinfo", "-B"], text = True, timeout = GLXINFO_TIMEOUT,
+                                              stdin = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
                 for line in out.splitlines():
                     line = line.strip()
                     if line.startswith("OpenGL renderer string:"):
                         return line.split(":", 1)[1].strip()
-            except:
+            except Exception:
                 return defaultName
 
         return defaultName
+
+    # runs on the resolver pool, failed lookups fall back to the kernel name and are not cached
+    def resolveName(self, hwmonPath: Path, deviceName: str, identity: str) -> str:
+        try:
+            displayName = self.getDeviceDisplayName(hwmonPath, deviceName)
+        except OSError:
+            return deviceName
+        self.names.put(identity, hwmonPath.name, displayName)
+        return displayName
+
+    def nameResolved(self, dev: HwmonDevice, future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self.resolved.append((dev, future.result()))
+
+    def applyResolvedNames(self) -> None:
+        while self.resolved:
+            dev, name = self.resolved.pop()
+            if name != dev.name:
+                dev.name = name
+                self.table.renameDevice(dev.id, name)
+    
+    # reads the device name of a hwmon directory and looks up or starts resolving its display name
+    # returns None for directories without sensors
+    def probe(self, hwmonPath: Path):
+        # catches case where sensors may be found in hwmonX/device/
+        if (hwmonPath / "name").exists():
+            sensorPath = hwmonPath
+        elif (hwmonPath / "device/name").exists():
+            sensorPath = hwmonPath / "device"
+        else:
+            return None
+
+        try:
+            deviceName = (sensorPath / "name").read_text().strip()
+        except OSError:
+            return None
+        identity = deviceIdentity(hwmonPath, deviceName)
+        displayName = self.names.get(identity)
+        future = None
+        if displayName is None:
+            future = self.resolver.submit(self.resolveName, hwmonPath, deviceName, identity)
+        return (hwmonPath, sensorPath, deviceName, displayName, future)
+
+    def addDevice(self, hwmonPath: Path, sensorPath: Path, deviceName: str, displayName, future) -> HwmonDevice:
+        if future is not None:
+            displayName = future.result() if future.done() and not future.exception() else deviceName
+
+        dev = HwmonDevice(displayName, sensorPath, self.persistentFds, self.table)
+        dev.id = f"hwmon{self.devNum}{deviceName}"
+        self.devNum += 1
+        dev.findSensors()
+
+        if future is not None and not future.done():
+            future.add_done_callback(functools.partial(self.nameResolved, dev))
+
+        if displayName != deviceName:
+            self.hwmonx.insert(0, dev)
+        else:
+            self.hwmonx.append(dev)
+
+        self.known[hwmonPath.name] = (linkTarget(hwmonPath), dev)
+        return dev
+
+    def removeDevice(self, dev: HwmonDevice) -> None:
+        dev.close()
+        self.hwmonx.remove(dev)
+        self.table.retire([sensor.row for sensor in dev.sensors])
     
     # loop through hwmon directories, construct HwmonDevice objects
     def findDevices(self) -> None:
         if not self.path.exists():
             return
+        self.watcher = HwmonWatcher(self.path)
         
         # reorder to numerical order of hwmon directories
         hwmonDirs = sorted(
             self.path.iterdir(),
             key=lambda p: int(p.name.replace("hwmon", ""))
         )
-        
-        for hwmonPath in hwmonDirs:
-            # catches case where sensors may be found in hwmonX/device/
-            if (hwmonPath / "name").exists():
-                sensorPath = hwmonPath
-            elif (hwmonPath / "device/name").exists():
-                sensorPath = hwmonPath / "device"
-            else:
+
+        found = [f for f in map(self.probe, hwmonDirs) if f is not None]
+
+        futures = [f[4] for f in found if f[4] is not None]
+        if futures:
+            wait(futures, timeout=RESOLVE_TIMEOUT)
+
+        for f in found:
+            self.addDevice(*f)
+
+    # incremental rediscovery, only hwmon entries that appeared, vanished or now point at a
+    # different device are touched, every other device keeps its sensors and min/max values
+    # returns the (added, removed) devices
+    def rescan(self) -> tuple:
+        if self.watcher is None or not self.watcher.changed():
+            return ([], [])
+
+        current = {}
+        for hwmonPath in self.path.iterdir():
+            current[hwmonPath.name] = (hwmonPath, linkTarget(hwmonPath))
+
+        removed = []
+        for name, (target, dev) in list(self.known.items()):
+            if name not in current or current[name][1] != target:
+                del self.known[name]
+                self.removeDevice(dev)
+                removed.append(dev)
+
+        added = []
+        for name, (hwmonPath, target) in sorted(current.items()):
+            if name in self.known:
                 continue
+            found = self.probe(hwmonPath)
+            if found is not None:
+                added.append(self.addDevice(*found))
 
-            deviceName = (sensorPath / "name").read_text().strip()
-            displayName = self.getDeviceDisplayName(hwmonPath, deviceName)
+        return (added, removed)
 
-            dev = HwmonDevice(displayName, sensorPath)
-            dev.id = f"hwmon{self.devNum}{deviceName}"
-            self.devNum += 1
-            dev.findSensors()
+# hwmon as an Engine provider, discovery and reads run on the provider's own thread
+# every read is timed, channels that read slower than SLOW_READ are read by a ReaderPool
+# from then on and no longer hold up the others
+class HwmonProvider(Provider):
+    name = "hwmon"
 
-            if displayName != deviceName:
-                self.hwmonx.insert(0, dev)
-            else:
-                self.hwmonx.append(dev)
+    def __init__(self, table: SensorTable, root: Path = None) -> None:
+        super().__init__(table)
+        self.manager = HwmonManager(table=table, root=root)
+        # table row -> Sensor
+        self.sensors = {}
+        # table row -> alarm attributes set at the last rescan
+        self.raised = {}
+        self.pool = ReaderPool(table, f"sensmon-{self.name}-slow")
+
+    async def discover(self) -> None:
+        await self.blocking(self.manager.findDevices)
+        self.index()
+
+    def index(self) -> None:
+        self.sensors = {sensor.row: sensor for dev in self.manager.hwmonx for sensor in dev.sensors}
+
+    def channels(self) -> list:
+        return list(self.sensors)
+
+    def limits(self) -> dict:
+        return {row: dict(sensor.limits, alarms=tuple(sensor.alarms)) for row, sensor in self.sensors.items()
+                if sensor.limits or sensor.alarms}
+
+    def alarms(self) -> dict:
+        return self.raised
+
+    # display names resolved by HwmonManager go first, like before
+    def devices(self) -> list:
+        return [dev.id for dev in self.manager.hwmonx]
+
+    # pooled rows are queued on the pool and the inline ones read meanwhile, returns the
+    # pooled rows without a new value, see ReaderPool.collect()
+    async def sample(self, rows: list):
+        pool = self.pool
+        pooled = pool.pooled(rows)
+        if pooled:
+            slow = set(pooled)
+            rows = [row for row in rows if row not in slow]
+            pool.submit(pooled, {row: self.sensors[row].value for row in pooled}, self.profiler)
+
+        values, slowRows, slowTimes = await self.blocking(self.read, rows)
+        # stored here, on the loop thread, the worker only reads
+        cur = self.table.cur
+        for row, value in values:
+            cur[row] = value
+        if slowRows:
+            pool.demote(slowRows, slowTimes)
+        return pool.collect(pooled) if pooled else None
+
+    # returns the (row, raw value) pairs that were read, the rows read slower than
+    # SLOW_READ and their read times in seconds
+    def read(self, rows: list) -> tuple:
+        sensors = self.sensors
+        clock = time.monotonic_ns
+        limit = SLOW_READ * 1e9
+        values, slowRows, slowTimes = [], [], []
+        if not self.profiler or not self.profiler.enabled:
+            for row in rows:
+                start = clock()
+                value = sensors[row].value()
+                elapsed = clock() - start
+                if value is not None:
+                    values.append((row, value))
+                if elapsed > limit:
+                    slowRows.append(row)
+                    slowTimes.append(elapsed / 1e9)
+            return (values, slowRows, slowTimes)
+
+        # every read recorded, for the profiler's slowest sensors
+        recordRead = self.profiler.recordRead
+        for row in rows:
+            start = clock()
+            value = sensors[row].value()
+            elapsed = clock() - start
+            recordRead(row, elapsed)
+            if value is not None:
+                values.append((row, value))
+            if elapsed > limit:
+                slowRows.append(row)
+                slowTimes.append(elapsed / 1e9)
+        return (values, slowRows, slowTimes)
+
+    # refresh() rebuilds the sensors on the worker thread, the pool drops removed rows here
+    async def rescan(self) -> None:
+        await self.blocking(self.refresh)
+        self.pool.forget(self.sensors)
+
+    def refresh(self) -> None:
+        if self.manager.resolved:
+            self.manager.applyResolvedNames()
+        added, removed = self.manager.rescan()
+        if added or removed:
+            self.index()
+
+        raised = {}
+        for row, sensor in self.sensors.items():
+            if sensor.alarms:
+                names = sensor.raisedAlarms()
+                if names:
+                    raised[row] = names
+        self.raised = raised
 
+    def close(self) -> None:
+        super().close()
+        self.pool.close()
+        self.manager.close()
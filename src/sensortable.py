@@ -0,0 +1,214 @@
+import threading
+from array import array
+from typing import NamedTuple
+
+# numpy is optional, without it the table falls back to the array module
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# static description of a single table row
+#   uid        -> collision free identity, e.g. "hwmon3/temp1_input" or "gpu0/temp"
+#   device     -> device id the row belongs to, e.g. "hwmon3k10temp" or "gpu0"
+#   deviceName -> display name of that device
+#   scale      -> raw value / scale = value in display units
+#   retired    -> the device went away, the row index is never reused
+class RowInfo(NamedTuple):
+    uid: str
+    device: str
+    deviceName: str
+    sensType: str
+    label: str
+    scale: float
+    unit: str
+    retired: bool = False
+
+def displayUnit(info: RowInfo, celsius: bool) -> str:
+    if info.sensType == "Temperature":
+        return "°C" if celsius else "°F"
+    return info.unit
+
+# holds current/min/max for every hwmon and gpu channel in contiguous typed arrays
+# writers store raw values into `cur`, the tick owner then calls update() once, which
+# folds all of them into min/max in one batched operation
+#
+# rows that were never read hold NaN, min/max start at +inf/-inf
+# `stale` marks rows whose provider missed its deadline, they keep their last value
+#
+# providers may discover devices concurrently, adding, renaming and retiring rows is
+# serialized by `lock`, values are only written by the tick owner
+class SensorTable:
+    def __init__(self) -> None:
+        self.rows = []
+        self.index = {}
+        self.schema = ()
+        self.generation = 0
+        self.size = 0
+        self.lock = threading.Lock()
+
+        if np is not None:
+            self.capacity = 64
+            self.cur = np.full(self.capacity, np.nan)
+            self.min = np.full(self.capacity, np.inf)
+            self.max = np.full(self.capacity, -np.inf)
+            self.scale = np.ones(self.capacity)
+            self.isTemp = np.zeros(self.capacity, dtype=bool)
+            self.stale = np.zeros(self.capacity, dtype=bool)
+        else:
+            self.cur = array('d')
+            self.min = array('d')
+            self.max = array('d')
+            self.scale = array('d')
+            self.isTemp = array('b')
+            self.stale = array('b')
+
+    def addRow(self, info: RowInfo) -> int:
+        with self.lock:
+            row = self.size
+
+            if np is not None:
+                if row == self.capacity:
+                    self.grow()
+                self.scale[row] = info.scale
+                self.isTemp[row] = info.sensType == "Temperature"
+            else:
+                self.cur.append(float("nan"))
+                self.min.append(float("inf"))
+                self.max.append(float("-inf"))
+                self.scale.append(info.scale)
+                self.isTemp.append(info.sensType == "Temperature")
+                self.stale.append(False)
+
+            self.rows.append(info)
+            self.index[info.uid] = row
+            self.size += 1
+            self.schema = tuple(self.rows)
+            self.generation += 1
+            return row
+
+    # display names can be resolved after the device's rows were added
+    def renameDevice(self, device: str, name: str) -> None:
+        with self.lock:
+            for row, info in enumerate(self.rows):
+                if info.device == device:
+                    self.rows[row] = info._replace(deviceName=name)
+            self.schema = tuple(self.rows)
+            self.generation += 1
+
+    # rows of a removed device, their values are cleared and consumers drop them
+    def retire(self, rows: list) -> None:
+        with self.lock:
+            for row in rows:
+                info = self.rows[row]
+                self.rows[row] = info._replace(retired=True)
+                if self.index.get(info.uid) == row:
+                    del self.index[info.uid]
+                self.cur[row] = float("nan")
+                self.min[row] = float("inf")
+                self.max[row] = float("-inf")
+                self.stale[row] = False
+            self.schema = tuple(self.rows)
+            self.generation += 1
+
+    # make this table follow another table's rows given as (uid, device, deviceName, sensType,
+    # label, unit, retired), values are expected in display units so rows get scale 1
+    # rows are matched by uid, rows missing from `rows` are retired
+    # returns the local row of every given row, -1 for retired ones
+    def mirror(self, rows: list) -> list:
+        local = []
+        seen = set()
+        for uid, device, deviceName, sensType, label, unit, retired in rows:
+            if retired:
+                local.append(-1)
+                continue
+            row = self.index.get(uid)
+            if row is None:
+                row = self.addRow(RowInfo(uid, device, deviceName, sensType, label, 1, unit))
+            elif self.rows[row].deviceName != deviceName:
+                self.renameDevice(device, deviceName)
+            local.append(row)
+            seen.add(row)
+
+        gone = [row for row in self.index.values() if row not in seen]
+        if gone:
+            self.retire(gone)
+        return local
+
+    def grow(self) -> None:
+        self.capacity *= 2
+        for name, fill in (("cur", np.nan), ("min", np.inf), ("max", -np.inf), ("scale", 1.0)):
+            old = getattr(self, name)
+            new = np.full(self.capacity, fill)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        for name in ("isTemp", "stale"):
+            old = getattr(self, name)
+            new = np.zeros(self.capacity, dtype=bool)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def setStale(self, rows: list, stale: bool) -> None:
+        if np is not None:
+            self.stale[rows] = stale
+            return
+        for row in rows:
+            self.stale[row] = stale
+
+    # read-only copy of the stale flags
+    def staleRows(self):
+        if np is not None:
+            stale = self.stale[:self.size].copy()
+            stale.flags.writeable = False
+            return stale
+        return array('b', self.stale)
+
+    # fold the current values into min/max
+    def update(self) -> None:
+        n = self.size
+        if np is not None:
+            np.fmax(self.max[:n], self.cur[:n], out=self.max[:n])
+            np.fmin(self.min[:n], self.cur[:n], out=self.min[:n])
+        else:
+            self.max = array('d', map(max, self.max, self.cur))
+            self.min = array('d', map(min, self.min, self.cur))
+
+    # set min/max to the current value, for every row or just the given ones
+    def reset(self, rows=None) -> None:
+        if np is not None:
+            if rows is None:
+                rows = slice(0, self.size)
+            self.min[rows] = self.cur[rows]
+            self.max[rows] = self.cur[rows]
+        elif rows is None:
+            self.min = array('d', self.cur)
+            self.max = array('d', self.cur)
+        else:
+            for row in rows:
+                self.min[row] = self.cur[row]
+                self.max[row] = self.cur[row]
+
+    # raw values -> display units, temperatures are rounded to 2 decimals like before
+    def convert(self, values, celsius: bool):
+        n = len(values)
+        if np is not None:
+            isTemp = self.isTemp[:n]
+            out = values / self.scale[:n]
+            if not celsius:
+                out = np.where(isTemp, out * 1.8 + 32, out)
+            out = np.where(isTemp, np.round(out, 2), out)
+            out.flags.writeable = False
+            return out
+
+        if celsius:
+            return array('d', (round(v / s, 2) if t else v / s for v, s, t in zip(values, self.scale, self.isTemp)))
+        return array('d', (round(v / s * 1.8 + 32, 2) if t else v / s for v, s, t in zip(values, self.scale, self.isTemp)))
+
+    # read-only (current, min, max) copies in display units
+    def display(self, celsius: bool) -> tuple:
+        n = self.size
+        return (
+            self.convert(self.cur[:n], celsius),
+            self.convert(self.min[:n], celsius),
+            self.convert(self.max[:n], celsius)
+        )
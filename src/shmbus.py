@@ -0,0 +1,475 @@
+import json
+import os
+import threading
+import time
+from array import array
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import collector
+from history import History
+from profiler import Profiler
+from sensortable import SensorTable
+from stats import SensorStats
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# one sampler publishes every snapshot into a shared memory segment (/dev/shm/<name>), any
+# number of local readers map it and read it without syscalls
+#
+#   header   16 x u64 slots, see below
+#   values   cur, min, max f64 x capacity, then stale u8 x capacity padded to 8 bytes
+#            indexed like the schema rows, in display units with temperatures in celsius
+#   schema   json {"devices", "rows": [[uid, device, deviceName, sensType, label, unit,
+#            retired], ...]} like protocol.SCHEMA, rewritten when the publisher's rows change
+#   alerts   json {row: [severity, description]} of the raised alerts, see alerts.py
+#
+# the header's SEQUENCE is a sequence lock, the publisher makes it odd, writes, and makes
+# it even again, a reader takes an even sequence, copies what it needs and keeps the copy
+# only if the sequence is still the same, the schema and alerts blocks carry their own
+# generation so readers only parse them when they changed
+#
+# a segment never grows, a publisher that outgrows it marks it CLOSED, unlinks it and
+# creates a larger one under the same name, readers then attach again
+BUS_NAME = "sensmon"
+MAGIC = int.from_bytes(b"SENSBUS\x01", "little")
+
+MAGIC_SLOT, SEQUENCE, PID, CLOSED, CAPACITY, SCHEMA_SIZE, ALERTS_SIZE, ROWS, TIMESTAMP, READS, \
+    SCHEMA_GEN, SCHEMA_LEN, ALERTS_GEN, ALERTS_LEN = range(14)
+HEADER_SLOTS = 16
+
+# rows and json bytes a new segment has room for at least
+MIN_ROWS = 256
+SCHEMA_BYTES_PER_ROW = 256
+ALERTS_BYTES = 16384
+
+# readers give up on a sequence that stays odd this long, the publisher died mid-write
+WRITE_TIMEOUT = 0.5
+
+# how often an attached client looks for a new sequence, and for a bus to attach to
+POLL = 0.05
+RETRY = 1.0
+# an attached client checks that the publisher is alive once no frame came for this long
+SILENT = 5.0
+
+class BusError(Exception):
+    pass
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+# maps an existing segment without taking ownership of it
+def attachShared(name: str) -> SharedMemory:
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the segment with the resource tracker,
+        # which then unlinks it when this process exits
+        shm = SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+def layoutSize(capacity: int, schemaSize: int, alertsSize: int) -> int:
+    return HEADER_SLOTS * 8 + capacity * 24 + (capacity + 7) // 8 * 8 + schemaSize + alertsSize
+
+# views into a mapped bus segment
+class BusSegment:
+    def __init__(self, shm: SharedMemory) -> None:
+        self.shm = shm
+        buf = shm.buf
+        if len(buf) < HEADER_SLOTS * 8:
+            raise BusError(f"shared memory {shm.name} is not a sensmon bus")
+        self.header = buf[:HEADER_SLOTS * 8].cast("Q")
+        self.floats = buf[:HEADER_SLOTS * 8].cast("d")
+        if self.header[MAGIC_SLOT] != MAGIC:
+            self.release()
+            raise BusError(f"shared memory {shm.name} is not a sensmon bus")
+
+        capacity = self.capacity = self.header[CAPACITY]
+        schemaSize, alertsSize = self.header[SCHEMA_SIZE], self.header[ALERTS_SIZE]
+        if len(buf) < layoutSize(capacity, schemaSize, alertsSize):
+            self.release()
+            raise BusError(f"shared memory {shm.name} is truncated")
+
+        offset = HEADER_SLOTS * 8
+        if np is not None:
+            self.cur, self.min, self.max = (np.frombuffer(buf, np.float64, capacity, offset + i * capacity * 8) for i in range(3))
+            self.stale = np.frombuffer(buf, np.bool_, capacity, offset + capacity * 24)
+        else:
+            self.cur, self.min, self.max = (buf[offset + i * capacity * 8:offset + (i + 1) * capacity * 8].cast("d") for i in range(3))
+            self.stale = buf[offset + capacity * 24:offset + capacity * 25].cast("b")
+        offset += capacity * 24 + (capacity + 7) // 8 * 8
+        self.schema = buf[offset:offset + schemaSize]
+        self.alerts = buf[offset + schemaSize:offset + schemaSize + alertsSize]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    # runs function(self) until it saw a consistent frame, returns (sequence, result)
+    # function must copy whatever it keeps, the views change under it
+    def read(self, function):
+        header = self.header
+        deadline = None
+        while True:
+            sequence = header[SEQUENCE]
+            if sequence & 1:
+                # the publisher writes for a few microseconds
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + WRITE_TIMEOUT
+                elif now > deadline:
+                    raise BusError(f"bus {self.name} stopped in the middle of a write")
+                time.sleep(0)
+                continue
+            try:
+                result = function(self)
+            except Exception:
+                if header[SEQUENCE] == sequence:
+                    raise
+                continue
+            if header[SEQUENCE] == sequence:
+                return sequence, result
+
+    # a torn read of the schema or alerts text fails to parse, read() then retries
+    def schemaText(self) -> bytes:
+        return bytes(self.schema[:self.header[SCHEMA_LEN]])
+
+    def alertsText(self) -> bytes:
+        return bytes(self.alerts[:self.header[ALERTS_LEN]])
+
+    def release(self) -> None:
+        for name in ("cur", "min", "max", "stale", "schema", "alerts", "floats", "header"):
+            view = self.__dict__.pop(name, None)
+            if isinstance(view, memoryview):
+                view.release()
+
+    def close(self) -> None:
+        self.release()
+        try:
+            self.shm.close()
+        except BufferError:
+            # a caller still holds a view, the mapping goes away with it
+            pass
+
+# the segment `name`, BusError if nobody publishes under it
+def attach(name: str = BUS_NAME) -> BusSegment:
+    try:
+        shm = attachShared(name)
+    except FileNotFoundError:
+        raise BusError(f"no sensmon bus named {name}, start a sampler with --publish")
+    except ValueError:
+        # created but not sized yet
+        raise BusError(f"bus {name} is not ready")
+    try:
+        return BusSegment(shm)
+    except BusError:
+        shm.close()
+        raise
+
+# writes the collector's snapshots into the segment `name`, called on the collector thread
+class BusPublisher:
+    def __init__(self, name: str = BUS_NAME) -> None:
+        self.busName = name
+        self.segment = None
+        # last written schema and alerts, by identity
+        self.schema = None
+        self.alerts = None
+        self.create(MIN_ROWS, MIN_ROWS * SCHEMA_BYTES_PER_ROW, ALERTS_BYTES)
+
+    def create(self, capacity: int, schemaSize: int, alertsSize: int) -> None:
+        size = layoutSize(capacity, schemaSize, alertsSize)
+        try:
+            shm = SharedMemory(self.busName, create=True, size=size)
+        except FileExistsError:
+            self.takeOver()
+            shm = SharedMemory(self.busName, create=True, size=size)
+
+        header = shm.buf[:HEADER_SLOTS * 8].cast("Q")
+        header[CAPACITY] = capacity
+        header[SCHEMA_SIZE] = schemaSize
+        header[ALERTS_SIZE] = alertsSize
+        header[PID] = os.getpid()
+        header[MAGIC_SLOT] = MAGIC
+        header.release()
+        self.segment = BusSegment(shm)
+        self.schema = self.alerts = None
+
+    # an existing segment under our name is reused only if its publisher is gone
+    def takeOver(self) -> None:
+        shm = SharedMemory(self.busName)
+        header = shm.buf[:HEADER_SLOTS * 8].cast("Q") if shm.size >= HEADER_SLOTS * 8 else None
+        try:
+            if header is not None and header[MAGIC_SLOT] == MAGIC and not header[CLOSED] and alive(header[PID]):
+                # attaching registered it with the resource tracker, which must not unlink it
+                resource_tracker.unregister(shm._name, "shared_memory")
+                raise BusError(f"bus {self.busName} is already published by process {header[PID]}")
+            if header is not None:
+                header[CLOSED] = 1
+        finally:
+            if header is not None:
+                header.release()
+            shm.close()
+        shm.unlink()
+
+    # snapshot -> collector.Snapshot, current/minimum/maximum -> its values in celsius
+    def publish(self, snapshot, current, minimum, maximum) -> None:
+        n = len(snapshot.schema)
+        schema = None
+        if snapshot.schema is not self.schema:
+            schema = json.dumps({
+                "devices": list(snapshot.devices),
+                "rows": [[info.uid, info.device, info.deviceName, info.sensType, info.label, info.unit, info.retired]
+                         for info in snapshot.schema]
+            }, separators=(",", ":")).encode()
+        alerts = None
+        if snapshot.alerts is not self.alerts:
+            alerts = json.dumps({row: list(alert) for row, alert in (snapshot.alerts or {}).items()},
+                                separators=(",", ":")).encode()
+
+        segment = self.segment
+        header = segment.header
+        if n > segment.capacity or (schema and len(schema) > len(segment.schema)) or (alerts and len(alerts) > len(segment.alerts)):
+            capacity = max(segment.capacity, 2 * n)
+            schemaSize = max(capacity * SCHEMA_BYTES_PER_ROW, 2 * len(schema or b""))
+            alertsSize = max(len(segment.alerts), 2 * len(alerts or b""))
+            self.close()
+            self.create(capacity, schemaSize, alertsSize)
+            self.publish(snapshot, current, minimum, maximum)
+            return
+
+        sequence = header[SEQUENCE] + 1
+        header[SEQUENCE] = sequence
+        if schema is not None:
+            segment.schema[:len(schema)] = schema
+            header[SCHEMA_LEN] = len(schema)
+            header[SCHEMA_GEN] += 1
+            self.schema = snapshot.schema
+        if alerts is not None:
+            segment.alerts[:len(alerts)] = alerts
+            header[ALERTS_LEN] = len(alerts)
+            header[ALERTS_GEN] += 1
+            self.alerts = snapshot.alerts
+        segment.cur[:n] = current
+        segment.min[:n] = minimum
+        segment.max[:n] = maximum
+        segment.stale[:n] = snapshot.stale
+        header[ROWS] = n
+        header[READS] = snapshot.reads
+        segment.floats[TIMESTAMP] = snapshot.timestamp
+        header[SEQUENCE] = sequence + 1
+
+    # readers see CLOSED and let go of the segment
+    def close(self) -> None:
+        segment = self.segment
+        if segment is None:
+            return
+        self.segment = None
+        segment.header[CLOSED] = 1
+        segment.close()
+        try:
+            segment.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+# one consistent copy of a segment, values indexed like the publisher's rows
+def readFrame(segment: BusSegment, generation: int, alertsGeneration: int) -> tuple:
+    header = segment.header
+    n = header[ROWS]
+    schemaGeneration = header[SCHEMA_GEN]
+    schema = json.loads(segment.schemaText()) if schemaGeneration != generation else None
+    alertsGen = header[ALERTS_GEN]
+    alerts = json.loads(segment.alertsText()) if alertsGen != alertsGeneration else None
+    if np is not None:
+        values = [view[:n].copy() for view in (segment.cur, segment.min, segment.max, segment.stale)]
+    else:
+        values = [array(typecode, view[:n]) for typecode, view in zip("dddb", (segment.cur, segment.min, segment.max, segment.stale))]
+    return (schemaGeneration, schema, alertsGen, alerts, segment.floats[TIMESTAMP], header[READS], *values)
+
+# follows a bus in place of a Collector, with the same takeSnapshot / requestReset /
+# setCelsius interface, min/max come from the publisher until they are reset here, from
+# then on they are kept locally, the statistics and the graph history always are
+# if the publisher goes away every sensor turns stale until a bus shows up again
+class BusClient(threading.Thread):
+    def __init__(self, name: str = BUS_NAME, publish=None) -> None:
+        super().__init__(name="sensmon-bus", daemon=True)
+        self.busName = name
+        self.segment = attach(name)
+        self.publish = publish
+
+        self.table = SensorTable()
+        self.stats = SensorStats(self.table)
+        self.history = History(self.table)
+        self.profiler = Profiler()
+        # nothing to flush when stopping
+        self.recorder = None
+        self.bus = None
+        self.celsius = True
+        # last applied sequence, schema and alerts generations of the attached segment
+        self.sequence = None
+        self.generation = None
+        self.alertsGeneration = None
+        self.lastFrame = time.monotonic()
+        # publisher rows -> local rows, -1 for retired ones, and the live ones as columns -> rows
+        self.local = []
+        self.columns = []
+        self.rows = []
+        self.devices = ()
+        self.alerts = {}
+        self.timestamp = 0.0
+        self.reads = 0
+        # min/max are folded here once reset
+        self.folding = False
+
+        self.lock = threading.Lock()
+        self.latest = None
+        self.pending = False
+        self.resetRequested = False
+        self.publishNow = False
+        self.running = True
+        self.wake = threading.Event()
+
+    def run(self) -> None:
+        while self.running:
+            if self.segment is None:
+                try:
+                    self.segment = attach(self.busName)
+                except BusError:
+                    pass
+
+            applied = False
+            if self.segment is not None:
+                try:
+                    applied = self.poll()
+                except BusError:
+                    self.detach()
+
+            if self.resetRequested:
+                self.resetRequested = False
+                self.table.reset()
+                self.stats.reset()
+                self.folding = True
+                self.publishNow = True
+            if applied or self.publishNow:
+                self.publishNow = False
+                self.sample()
+
+            self.wake.wait(POLL if self.segment is not None else RETRY)
+            self.wake.clear()
+
+        if self.segment is not None:
+            self.segment.close()
+
+    # applies the newest frame, returns whether there was one
+    def poll(self) -> bool:
+        segment = self.segment
+        header = segment.header
+        if header[CLOSED]:
+            raise BusError(f"bus {self.busName} closed")
+        # nothing new, or nothing published yet
+        if header[SEQUENCE] in (self.sequence, 0):
+            if time.monotonic() - self.lastFrame > SILENT:
+                self.lastFrame = time.monotonic()
+                if not alive(header[PID]):
+                    raise BusError(f"bus {self.busName} lost its publisher")
+            return False
+
+        self.sequence, frame = segment.read(lambda segment: readFrame(segment, self.generation, self.alertsGeneration))
+        self.lastFrame = time.monotonic()
+        generation, schema, alertsGeneration, alerts, timestamp, reads, cur, minimum, maximum, stale = frame
+        if schema is not None:
+            self.mirror(schema)
+            self.generation = generation
+        if alerts is not None:
+            local = self.local
+            self.alerts = {local[int(row)]: tuple(alert) for row, alert in alerts.items()
+                           if int(row) < len(local) and local[int(row)] >= 0}
+            self.alertsGeneration = alertsGeneration
+        self.timestamp = timestamp
+        self.reads = reads
+
+        table = self.table
+        columns, rows = self.columns, self.rows
+        if np is not None:
+            table.cur[rows] = cur[columns]
+            table.stale[rows] = stale[columns]
+            if self.folding:
+                table.update()
+            else:
+                table.min[rows] = minimum[columns]
+                table.max[rows] = maximum[columns]
+        else:
+            for column, row in zip(columns, rows):
+                table.cur[row] = cur[column]
+                table.stale[row] = stale[column]
+            if self.folding:
+                table.update()
+            else:
+                for column, row in zip(columns, rows):
+                    table.min[row] = minimum[column]
+                    table.max[row] = maximum[column]
+        self.stats.update(rows, timestamp)
+        self.history.append(timestamp)
+        return True
+
+    def mirror(self, schema: dict) -> None:
+        self.devices = tuple(schema["devices"])
+        self.local = self.table.mirror(schema["rows"])
+        self.columns = [column for column, row in enumerate(self.local) if row >= 0]
+        self.rows = [self.local[column] for column in self.columns]
+        if np is not None:
+            self.columns = np.array(self.columns, dtype=np.intp)
+            self.rows = np.array(self.rows, dtype=np.intp)
+
+    # every sensor keeps its last value and turns stale until the bus is back
+    def detach(self) -> None:
+        self.segment.close()
+        self.sequence = self.generation = self.alertsGeneration = None
+        try:
+            # a publisher that outgrew its segment already created the next one
+            self.segment = attach(self.busName)
+        except BusError:
+            self.segment = None
+            for row in self.rows:
+                self.table.stale[row] = True
+            self.publishNow = True
+
+    def sample(self) -> None:
+        if self.generation is None and not self.table.size:
+            return
+        current, minimum, maximum = self.table.display(self.celsius)
+        snapshot = collector.Snapshot(self.timestamp, self.celsius, self.devices, self.table.schema, current, minimum, maximum,
+                            self.reads, self.table.staleRows(), self.stats.display(self.celsius), self.alerts)
+        with self.lock:
+            self.latest = snapshot
+            notify = not self.pending
+            self.pending = True
+        if notify and self.publish:
+            self.publish()
+
+    def takeSnapshot(self):
+        with self.lock:
+            self.pending = False
+            return self.latest
+
+    def requestReset(self) -> None:
+        self.resetRequested = True
+        self.wake.set()
+
+    def setCelsius(self, celsius: bool) -> None:
+        self.celsius = celsius
+        self.publishNow = True
+        self.wake.set()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wake.set()
@@ -0,0 +1,274 @@
+import math
+from array import array
+
+from sensortable import SensorTable
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# statistics shown next to current/min/max, in this order
+STATS = ("Mean", "Std Dev", "EMA", "p50", "p95", "p99")
+QUANTILES = (0.5, 0.95, 0.99)
+
+# time constant of the moving average in seconds, independent of how often a channel is polled
+EMA_TAU = 30.0
+
+# quantiles come from a log histogram of the raw values (a fixed-size DDSketch)
+# bucket k on either side of zero covers |v| in [LOWEST * GAMMA**k, LOWEST * GAMMA**(k+1)),
+# smaller values share the zero bucket and larger ones the last bucket, a quantile is off
+# by at most (GAMMA - 1) / (GAMMA + 1) ~ 1% of its value, and is clamped to [min, max]
+# raw values go up to ~1e10 (µW, kHz), which takes 1280 buckets per sign
+GAMMA = 1.02
+LOWEST = 0.1
+BUCKETS = 1280
+ZERO = BUCKETS
+WIDTH = 2 * BUCKETS + 1
+
+def bucketOf(value: float) -> int:
+    magnitude = abs(value)
+    if magnitude < LOWEST:
+        return ZERO
+    k = min(int(math.log(magnitude / LOWEST) / math.log(GAMMA)), BUCKETS - 1)
+    return ZERO + k + 1 if value > 0 else ZERO - k - 1
+
+# representative value of every bucket, the one with the smallest relative error
+def bucketValues() -> list:
+    upper = [LOWEST * GAMMA ** k * 2 * GAMMA / (GAMMA + 1) for k in range(BUCKETS)]
+    return [-v for v in reversed(upper)] + [0.0] + upper
+
+def rounded(values):
+    if np is not None:
+        out = np.round(values, 3)
+        out.flags.writeable = False
+        return out
+    return array('d', (round(v, 3) for v in values))
+
+# running statistics of every table row, updated with each sample of the row in O(1)
+#   count/mean/m2 -> Welford's online mean and variance
+#   ema/last      -> exponential moving average weighted by the time between samples
+#   histogram     -> WIDTH counts per row for p50/p95/p99
+#   low/high      -> lowest and highest bucket in use, quantiles only scan that window
+# everything is kept on raw values like min/max and converted by display()
+#
+# quantiles are only recomputed for rows sampled since the previous display()
+class SensorStats:
+    def __init__(self, table: SensorTable) -> None:
+        self.table = table
+        self.rows = 0
+        # timestamp of the latest update, reset() seeds the moving average with it
+        self.now = 0.0
+
+        if np is not None:
+            self.values = np.array(bucketValues())
+            self.count = np.zeros(0, dtype=np.int64)
+            self.mean = np.zeros(0)
+            self.m2 = np.zeros(0)
+            self.ema = np.zeros(0)
+            self.last = np.zeros(0)
+            self.histogram = np.zeros((0, WIDTH), dtype=np.uint32)
+            self.low = np.zeros(0, dtype=np.intp)
+            self.high = np.zeros(0, dtype=np.intp)
+            self.dirty = np.zeros(0, dtype=bool)
+            self.quantiles = np.zeros((len(QUANTILES), 0))
+        else:
+            self.values = bucketValues()
+            self.count = array('q')
+            self.mean = array('d')
+            self.m2 = array('d')
+            self.ema = array('d')
+            self.last = array('d')
+            # sparse, at most WIDTH entries per row
+            self.histogram = []
+            self.dirty = set()
+            self.quantiles = [array('d') for _ in QUANTILES]
+
+    # make room for new table rows
+    def resize(self, rows: int) -> None:
+        added = rows - self.rows
+        if added <= 0:
+            return
+
+        if np is not None:
+            self.count = np.concatenate((self.count, np.zeros(added, dtype=np.int64)))
+            self.mean = np.concatenate((self.mean, np.zeros(added)))
+            self.m2 = np.concatenate((self.m2, np.zeros(added)))
+            self.ema = np.concatenate((self.ema, np.full(added, np.nan)))
+            self.last = np.concatenate((self.last, np.full(added, np.nan)))
+            self.histogram = np.concatenate((self.histogram, np.zeros((added, WIDTH), dtype=np.uint32)))
+            self.low = np.concatenate((self.low, np.full(added, WIDTH, dtype=np.intp)))
+            self.high = np.concatenate((self.high, np.zeros(added, dtype=np.intp)))
+            self.dirty = np.concatenate((self.dirty, np.zeros(added, dtype=bool)))
+            self.quantiles = np.concatenate((self.quantiles, np.full((len(QUANTILES), added), np.nan)), axis=1)
+        else:
+            self.count.extend([0] * added)
+            self.mean.extend([0.0] * added)
+            self.m2.extend([0.0] * added)
+            self.ema.extend([float("nan")] * added)
+            self.last.extend([float("nan")] * added)
+            self.histogram.extend({} for _ in range(added))
+            for quantile in self.quantiles:
+                quantile.extend([float("nan")] * added)
+        self.rows = rows
+
+    # fold the current values of `rows` (distinct table rows) sampled at `now`, or the
+    # given values in the same order, unread rows (NaN) are skipped
+    def update(self, rows, now: float, values=None) -> None:
+        self.resize(self.table.size)
+        self.now = now
+        if values is None:
+            values = self.table.cur[rows] if np is not None else [self.table.cur[row] for row in rows]
+
+        if np is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            values = np.asarray(values, dtype=float)
+            valid = np.isfinite(values)
+            if not valid.all():
+                rows, values = rows[valid], values[valid]
+            if not len(rows):
+                return
+
+            count = self.count[rows] + 1
+            mean = self.mean[rows]
+            delta = values - mean
+            mean += delta / count
+            self.m2[rows] += delta * (values - mean)
+            self.mean[rows] = mean
+            self.count[rows] = count
+
+            ema = self.ema[rows]
+            weight = -np.expm1(-np.maximum(now - self.last[rows], 0) / EMA_TAU)
+            self.ema[rows] = np.where(np.isnan(ema), values, ema + weight * (values - ema))
+            self.last[rows] = now
+
+            magnitude = np.abs(values)
+            with np.errstate(divide="ignore"):
+                k = np.log(np.maximum(magnitude, LOWEST) / LOWEST) / math.log(GAMMA)
+            k = np.minimum(k.astype(np.intp), BUCKETS - 1) + 1
+            buckets = np.where(magnitude < LOWEST, ZERO, np.where(values > 0, ZERO + k, ZERO - k))
+            self.histogram[rows, buckets] += 1
+            self.low[rows] = np.minimum(self.low[rows], buckets)
+            self.high[rows] = np.maximum(self.high[rows], buckets)
+            self.dirty[rows] = True
+            return
+
+        for row, value in zip(rows, values):
+            if value != value or value in (math.inf, -math.inf):
+                continue
+            count = self.count[row] + 1
+            delta = value - self.mean[row]
+            self.mean[row] += delta / count
+            self.m2[row] += delta * (value - self.mean[row])
+            self.count[row] = count
+
+            ema = self.ema[row]
+            if ema != ema:
+                self.ema[row] = value
+            else:
+                self.ema[row] = ema - math.expm1(-max(now - self.last[row], 0) / EMA_TAU) * (value - ema)
+            self.last[row] = now
+
+            bucket = bucketOf(value)
+            histogram = self.histogram[row]
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+            self.dirty.add(row)
+
+    # start over from the current value, for every row or just the given ones
+    def reset(self, rows=None) -> None:
+        self.resize(self.table.size)
+        if rows is None:
+            rows = range(self.rows)
+
+        if np is not None:
+            rows = np.asarray(rows, dtype=np.intp)
+            self.count[rows] = 0
+            self.mean[rows] = 0
+            self.m2[rows] = 0
+            self.ema[rows] = np.nan
+            self.last[rows] = np.nan
+            self.histogram[rows] = 0
+            self.low[rows] = WIDTH
+            self.high[rows] = 0
+            self.quantiles[:, rows] = np.nan
+        else:
+            for row in rows:
+                self.count[row] = 0
+                self.mean[row] = 0.0
+                self.m2[row] = 0.0
+                self.ema[row] = float("nan")
+                self.last[row] = float("nan")
+                self.histogram[row] = {}
+                for quantile in self.quantiles:
+                    quantile[row] = float("nan")
+        self.update(rows, self.now)
+
+    # recompute p50/p95/p99 of the rows sampled since the last call, clamped to min/max
+    def refreshQuantiles(self) -> None:
+        table = self.table
+        if np is not None:
+            rows = np.flatnonzero(self.dirty)
+            if not len(rows):
+                return
+            self.dirty[rows] = False
+            # every row's buckets in use, starting at its lowest one
+            low = self.low[rows]
+            window = np.minimum(low[:, None] + np.arange(int((self.high[rows] - low).max()) + 1), WIDTH - 1)
+            cumulative = np.cumsum(self.histogram[rows[:, None], window], axis=1)
+            count = self.count[rows]
+            for i, q in enumerate(QUANTILES):
+                # bucket of the ceil(q * count)-th smallest value
+                rank = np.maximum(np.ceil(q * count), 1)
+                bucket = np.minimum(low + (cumulative < rank[:, None]).sum(axis=1), WIDTH - 1)
+                self.quantiles[i, rows] = np.clip(self.values[bucket], table.min[rows], table.max[rows])
+            return
+
+        for row in self.dirty:
+            buckets = sorted(self.histogram[row].items())
+            count = self.count[row]
+            for quantile, q in zip(self.quantiles, QUANTILES):
+                rank = max(math.ceil(q * count), 1)
+                seen = 0
+                for bucket, n in buckets:
+                    seen += n
+                    if seen >= rank:
+                        break
+                quantile[row] = min(max(self.values[bucket], table.min[row]), table.max[row])
+        self.dirty.clear()
+
+    # read-only copies in display units, in STATS order, indexed like the table rows
+    # temperatures have 2 decimals like current/min/max, everything else 3
+    def display(self, celsius: bool) -> tuple:
+        self.resize(self.table.size)
+        self.refreshQuantiles()
+        n = self.table.size
+
+        def convert(values, celsius):
+            return rounded(self.table.convert(values, celsius))
+
+        if np is not None:
+            count = self.count[:n]
+            mean = np.where(count > 0, self.mean[:n], np.nan)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                deviation = np.where(count > 1, np.sqrt(self.m2[:n] / (count - 1)), np.nan)
+            return (convert(mean, celsius), rounded(self.spread(deviation, celsius)), convert(self.ema[:n], celsius),
+                    *(convert(quantile[:n], celsius) for quantile in self.quantiles))
+
+        mean = array('d', (m if c > 0 else float("nan") for m, c in zip(self.mean, self.count)))
+        deviation = array('d', (math.sqrt(m2 / (c - 1)) if c > 1 else float("nan") for m2, c in zip(self.m2, self.count)))
+        return (convert(mean, celsius), rounded(self.spread(deviation, celsius)), convert(self.ema, celsius),
+                *(convert(quantile, celsius) for quantile in self.quantiles))
+
+    # a spread converts like a difference, °F only scales it
+    def spread(self, values, celsius: bool):
+        table = self.table
+        n = len(values)
+        if np is not None:
+            isTemp = table.isTemp[:n]
+            out = values / table.scale[:n]
+            if not celsius:
+                out = np.where(isTemp, out * 1.8, out)
+            return np.where(isTemp, np.round(out, 2), out)
+
+        factor = 1 if celsius else 1.8
+        return array('d', (round(v / s * factor, 2) if t else v / s for v, s, t in zip(values, table.scale, table.isTemp)))
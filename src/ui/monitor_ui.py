@@ -0,0 +1,91 @@
+# Form implementation generated from reading ui file 'ui/monitor.ui'
+#
+# Created by: PyQt6 UI code generator 6.11.0
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic6 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt6 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(800, 600)
+        self.centralwidget = QtWidgets.QWidget(parent=MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.verticalLayout = QtWidgets.QVBoxLayout(self.centralwidget)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.treeView = QtWidgets.QTreeView(parent=self.centralwidget)
+        self.treeView.setAlternatingRowColors(True)
+        self.treeView.setSortingEnabled(False)
+        self.treeView.setUniformRowHeights(True)
+        self.treeView.setObjectName("treeView")
+        self.verticalLayout.addWidget(self.treeView)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.statusbar = QtWidgets.QStatusBar(parent=MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+        self.menuBar = QtWidgets.QMenuBar(parent=MainWindow)
+        self.menuBar.setGeometry(QtCore.QRect(0, 0, 800, 30))
+        self.menuBar.setObjectName("menuBar")
+        self.menuFile = QtWidgets.QMenu(parent=self.menuBar)
+        self.menuFile.setObjectName("menuFile")
+        self.menuSettings = QtWidgets.QMenu(parent=self.menuBar)
+        self.menuSettings.setObjectName("menuSettings")
+        MainWindow.setMenuBar(self.menuBar)
+        self.actionExit = QtGui.QAction(parent=MainWindow)
+        self.actionExit.setObjectName("actionExit")
+        self.actionPreferences = QtGui.QAction(parent=MainWindow)
+        self.actionPreferences.setObjectName("actionPreferences")
+        self.actionExit_2 = QtGui.QAction(parent=MainWindow)
+        self.actionExit_2.setObjectName("actionExit_2")
+        self.actionQuit = QtGui.QAction(parent=MainWindow)
+        self.actionQuit.setObjectName("actionQuit")
+        self.actionExitProgram = QtGui.QAction(parent=MainWindow)
+        self.actionExitProgram.setObjectName("actionExitProgram")
+        self.actionSwitchTheme = QtGui.QAction(parent=MainWindow)
+        self.actionSwitchTheme.setObjectName("actionSwitchTheme")
+        self.actionResetValues = QtGui.QAction(parent=MainWindow)
+        self.actionResetValues.setObjectName("actionResetValues")
+        self.actionSwitchUnits = QtGui.QAction(parent=MainWindow)
+        self.actionSwitchUnits.setObjectName("actionSwitchUnits")
+        self.actionStatistics = QtGui.QAction(parent=MainWindow)
+        self.actionStatistics.setCheckable(True)
+        self.actionStatistics.setChecked(True)
+        self.actionStatistics.setObjectName("actionStatistics")
+        self.actionProfiling = QtGui.QAction(parent=MainWindow)
+        self.actionProfiling.setCheckable(True)
+        self.actionProfiling.setObjectName("actionProfiling")
+        self.actionDumpProfile = QtGui.QAction(parent=MainWindow)
+        self.actionDumpProfile.setObjectName("actionDumpProfile")
+        self.menuFile.addAction(self.actionDumpProfile)
+        self.menuFile.addAction(self.actionExitProgram)
+        self.menuSettings.addAction(self.actionSwitchTheme)
+        self.menuSettings.addAction(self.actionSwitchUnits)
+        self.menuSettings.addAction(self.actionResetValues)
+        self.menuSettings.addAction(self.actionStatistics)
+        self.menuSettings.addAction(self.actionProfiling)
+        self.menuBar.addAction(self.menuFile.menuAction())
+        self.menuBar.addAction(self.menuSettings.menuAction())
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.menuFile.setTitle(_translate("MainWindow", "File"))
+        self.menuSettings.setTitle(_translate("MainWindow", "Settings"))
+        self.actionExit.setText(_translate("MainWindow", "Preferences"))
+        self.actionPreferences.setText(_translate("MainWindow", "Exit"))
+        self.actionExit_2.setText(_translate("MainWindow", "Exit"))
+        self.actionQuit.setText(_translate("MainWindow", "Quit"))
+        self.actionExitProgram.setText(_translate("MainWindow", "Exit"))
+        self.actionSwitchTheme.setText(_translate("MainWindow", "Switch Theme (Dark/Light)"))
+        self.actionResetValues.setText(_translate("MainWindow", "Reset Min/Max and Statistics"))
+        self.actionSwitchUnits.setText(_translate("MainWindow", "Switch Units (°C/°F)"))
+        self.actionStatistics.setText(_translate("MainWindow", "Statistics Columns"))
+        self.actionProfiling.setText(_translate("MainWindow", "Profiling"))
+        self.actionDumpProfile.setText(_translate("MainWindow", "Dump Profile..."))
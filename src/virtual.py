@@ -0,0 +1,381 @@
+import ast
+import heapq
+import json
+import re
+import sys
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+from config import configPath
+from sensortable import RowInfo, SensorTable, np
+
+# device the virtual sensors are shown under
+DEVICE = "virtual"
+DEVICE_NAME = "Virtual Sensors"
+
+NAN = float("nan")
+
+# characters that make a sensor reference a glob
+GLOB = re.compile(r"[*?\[]")
+
+# aggregates skip inputs that were never read, they are NaN only when all of them are
+def total(*values) -> float:
+    values = [value for value in values if value == value]
+    return sum(values) if values else NAN
+
+def largest(*values) -> float:
+    values = [value for value in values if value == value]
+    return max(values) if values else NAN
+
+def smallest(*values) -> float:
+    values = [value for value in values if value == value]
+    return min(values) if values else NAN
+
+def mean(*values) -> float:
+    values = [value for value in values if value == value]
+    return sum(values) / len(values) if values else NAN
+
+# functions an expression may call -> what they evaluate to, rate() is rewritten to a
+# call of the Rate of its position in the expression
+AGGREGATES = {"sum": total, "max": largest, "min": smallest, "avg": mean}
+FUNCTIONS = {**AGGREGATES, "abs": abs, "rate": None}
+
+OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.USub, ast.UAdd)
+
+# change of its input per second between two evaluations
+class Rate:
+    __slots__ = ("value", "since")
+
+    def __init__(self) -> None:
+        self.value = NAN
+        self.since = None
+
+    def __call__(self, value: float, now: float) -> float:
+        previous, since = self.value, self.since
+        self.value, self.since = value, now
+        if since is None or now <= since:
+            return NAN
+        return (value - previous) / (now - since)
+
+# one entry of the configuration, its expression is parsed and checked once
+#   each  -> glob over sensor ids, one virtual sensor per matching sensor, `this` in the
+#            expression is that sensor
+#   rates -> number of rate() calls in the expression
+class Definition:
+    __slots__ = ("id", "name", "sensType", "unit", "expr", "each", "rates")
+
+    def __init__(self, id: str, name: str, sensType: str, unit: str, expr: str, each: str = None) -> None:
+        self.id = id
+        self.name = name
+        self.sensType = sensType
+        self.unit = unit
+        self.expr = expr
+        self.each = each
+        self.rates = 0
+        self.check(ast.parse(expr, mode="eval").body, False)
+
+    # only arithmetic, numbers, sensor ids and FUNCTIONS, globs only as aggregate arguments
+    def check(self, node, aggregated: bool) -> None:
+        if isinstance(node, ast.BinOp) and isinstance(node.op, OPERATORS):
+            self.check(node.left, False)
+            self.check(node.right, False)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, OPERATORS):
+            self.check(node.operand, False)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if not aggregated and GLOB.search(node.value):
+                raise ValueError(f"{self.name}: the glob '{node.value}' needs sum(), max(), min() or avg()")
+        elif isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            pass
+        elif isinstance(node, ast.Name) and node.id == "this" and self.each is not None:
+            pass
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS:
+            name = node.func.id
+            if node.keywords or any(isinstance(arg, ast.Starred) for arg in node.args):
+                raise ValueError(f"{self.name}: {name}() takes positional arguments only")
+            if not node.args or (name not in AGGREGATES and len(node.args) != 1):
+                raise ValueError(f"{self.name}: wrong number of arguments to {name}()")
+            if name == "rate":
+                self.rates += 1
+            for arg in node.args:
+                self.check(arg, name in AGGREGATES)
+        else:
+            raise ValueError(f"{self.name}: '{ast.unparse(node)}' is not allowed in an expression")
+
+def parseDefinition(entry: dict, index: int) -> Definition:
+    entry = dict(entry)
+    unknown = set(entry) - {"id", "name", "type", "unit", "expr", "each"}
+    if unknown:
+        raise ValueError(f"sensor {index}: unknown keys {', '.join(sorted(unknown))}")
+    if not entry.get("name") or not entry.get("expr"):
+        raise ValueError(f"sensor {index}: needs a name and an expr")
+    name = str(entry["name"])
+    id = str(entry.get("id") or re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_"))
+    try:
+        return Definition(id, name, str(entry.get("type", "Virtual")), str(entry.get("unit", "")), str(entry["expr"]),
+                          None if entry.get("each") is None else str(entry["each"]))
+    except SyntaxError as e:
+        raise ValueError(f"{name}: {e.msg}")
+
+# virtual sensor configuration, e.g.
+#   {"sensors": [{"name": "System power", "type": "Power", "unit": "W", "expr": "sum('hwmon*/power*_input', 'gpu*/power')"},
+#                {"name": "dT/dt", "unit": "°C/s", "each": "hwmon*/temp*_input", "expr": "rate(this)"}]}
+# a missing file means no virtual sensors, a broken one is reported and ignored
+def loadConfig(path: Path = None) -> tuple:
+    path = path or configPath("virtual.json")
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return ()
+    except (OSError, ValueError) as e:
+        print(f"sensmon: ignoring {path}: {e}", file=sys.stderr, flush=True)
+        return ()
+    try:
+        definitions = tuple(parseDefinition(entry, i) for i, entry in enumerate(data.get("sensors", [])))
+        ids = [definition.id for definition in definitions]
+        for id in ids:
+            if ids.count(id) > 1:
+                raise ValueError(f"more than one sensor with the id '{id}'")
+        return definitions
+    except (AttributeError, TypeError, ValueError) as e:
+        print(f"sensmon: ignoring {path}: {e}", file=sys.stderr, flush=True)
+        return ()
+
+# rewrites a checked expression into the body of
+#   lambda c, now, t, ts, r: ...
+# c -> table.cur, t/ts -> row and scale of `this`, r -> the Rates of the instance
+# sensor ids become c[row] / scale, globs are expanded to every matching sensor, ids that
+# do not exist (yet) become nan, `inputs` collects the rows that were referenced
+class Resolver(ast.NodeTransformer):
+    def __init__(self, table: SensorTable, inputs: set) -> None:
+        self.table = table
+        self.inputs = inputs
+        self.rates = 0
+
+    def ref(self, row: int) -> ast.expr:
+        self.inputs.add(row)
+        value = ast.Subscript(ast.Name("c", ast.Load()), ast.Constant(row), ast.Load())
+        scale = float(self.table.scale[row])
+        return value if scale == 1 else ast.BinOp(value, ast.Div(), ast.Constant(scale))
+
+    # rows of a sensor id, virtual sensors included, or of a glob over the other sensors
+    def match(self, pattern: str) -> list:
+        if not GLOB.search(pattern):
+            row = self.table.index.get(pattern)
+            return [] if row is None else [row]
+        return [row for row, info in enumerate(self.table.schema)
+                if not info.retired and info.device != DEVICE and fnmatchcase(info.uid, pattern)]
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, str):
+            return node
+        rows = self.match(node.value)
+        return self.ref(rows[0]) if rows else ast.Name("nan", ast.Load())
+
+    def visit_Name(self, node):
+        value = ast.Subscript(ast.Name("c", ast.Load()), ast.Name("t", ast.Load()), ast.Load())
+        return ast.BinOp(value, ast.Div(), ast.Name("ts", ast.Load()))
+
+    def visit_Call(self, node):
+        name = node.func.id
+        if name in AGGREGATES:
+            args = []
+            for arg in node.args:
+                if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                    args.extend(self.ref(row) for row in self.match(arg.value))
+                else:
+                    args.append(self.visit(arg))
+            return ast.Call(node.func, args, [])
+        if name == "rate":
+            rate = ast.Subscript(ast.Name("r", ast.Load()), ast.Constant(self.rates), ast.Load())
+            self.rates += 1
+            return ast.Call(rate, [self.visit(node.args[0]), ast.Name("now", ast.Load())], [])
+        return ast.Call(node.func, [self.visit(node.args[0])], [])
+
+# compiled function of a definition, shared by all of its instances, and the rows it reads
+def build(definition: Definition, table: SensorTable) -> tuple:
+    inputs = set()
+    body = Resolver(table, inputs).visit(ast.parse(definition.expr, mode="eval").body)
+    names = [ast.arg(name) for name in ("c", "now", "t", "ts", "r")]
+    tree = ast.Expression(ast.Lambda(ast.arguments([], names, None, [], [], None, []), body))
+    code = compile(ast.fix_missing_locations(tree), f"<virtual sensor {definition.name}>", "eval")
+    return eval(code, {"__builtins__": {}, "nan": NAN, "abs": abs, **AGGREGATES}), inputs
+
+# one virtual sensor of the evaluation plan
+#   this/scale -> row and scale of the sensor an `each` instance belongs to
+#   inputs     -> rows the expression reads, users -> indices of the steps reading this one
+class Step:
+    __slots__ = ("row", "name", "function", "this", "scale", "rates", "inputs", "users")
+
+    def __init__(self, row: int, name: str, function, this: int, scale: float, rates: list, inputs: frozenset) -> None:
+        self.row = row
+        self.name = name
+        self.function = function
+        self.this = this
+        self.scale = scale
+        self.rates = rates
+        self.inputs = inputs
+        self.users = ()
+
+# sensors computed from other sensors by small expressions, see loadConfig()
+#
+# the expressions are compiled whenever the table's rows change into a plan ordered so
+# every virtual sensor comes after the virtual sensors it reads, every tick the engine
+# hands over the rows it sampled and update() recomputes, in plan order, only the virtual
+# sensors reading one of them (or a virtual sensor recomputed before them)
+# values are stored in display units with scale 1 in the shared table, so min/max, the
+# statistics, alerts, history and every export treat them like any other row
+# a virtual sensor with a stale input is stale and keeps its last value
+class VirtualSensors:
+    def __init__(self, table: SensorTable, definitions: tuple = None) -> None:
+        self.table = table
+        self.definitions = definitions if definitions is not None else loadConfig()
+        self.compiled = -1
+        # evaluation order and input row -> indices into the plan of the steps reading it
+        self.plan = []
+        self.users = {}
+        # (definition id, uid of the `each` sensor or None) -> table row, Rates
+        self.rows = {}
+        self.rates = {}
+        self.reported = set()
+
+    def devices(self) -> list:
+        return [DEVICE] if self.rows else []
+
+    # row of an instance, added to the table the first time it is seen
+    def instance(self, definition: Definition, source: RowInfo = None) -> int:
+        key = (definition.id, source.uid if source else None)
+        row = self.rows.get(key)
+        if row is None:
+            if source is None:
+                info = RowInfo(f"{DEVICE}/{definition.id}", DEVICE, DEVICE_NAME, definition.sensType, definition.name, 1, definition.unit)
+            else:
+                label = f"{source.deviceName} {source.label} {definition.name}"
+                info = RowInfo(f"{DEVICE}/{definition.id}/{source.uid}", DEVICE, DEVICE_NAME, definition.sensType, label, 1, definition.unit)
+            row = self.rows[key] = self.table.addRow(info)
+            self.rates[key] = [Rate() for _ in range(definition.rates)]
+        return row
+
+    # rebuild the plan if the table's rows changed since the last call, adds and retires
+    # the rows of the virtual sensors, called by the engine before it syncs its channels
+    def compile(self) -> None:
+        table = self.table
+        if not self.definitions or self.compiled == table.generation:
+            return
+
+        # rows first, so expressions can refer to virtual sensors defined after them
+        instances = []
+        for definition in self.definitions:
+            if definition.each is None:
+                instances.append((definition, self.instance(definition), None))
+                continue
+            for this, info in enumerate(table.schema):
+                if not info.retired and info.device != DEVICE and fnmatchcase(info.uid, definition.each):
+                    instances.append((definition, self.instance(definition, info), this))
+
+        # instances whose sensor went away
+        live = {row for _, row, _ in instances}
+        gone = [key for key, row in self.rows.items() if row not in live]
+        if gone:
+            table.retire([self.rows[key] for key in gone])
+            for key in gone:
+                del self.rows[key]
+                del self.rates[key]
+
+        functions = {definition.id: build(definition, table) for definition in self.definitions}
+        steps = []
+        for definition, row, this in instances:
+            function, inputs = functions[definition.id]
+            if this is None:
+                rates = self.rates[(definition.id, None)]
+                steps.append(Step(row, definition.name, function, 0, 1.0, rates, frozenset(inputs)))
+            else:
+                rates = self.rates[(definition.id, table.schema[this].uid)]
+                steps.append(Step(row, table.schema[row].label, function, this, float(table.scale[this]), rates, frozenset(inputs | {this})))
+
+        self.plan = self.order(steps)
+        users = {}
+        for index, step in enumerate(self.plan):
+            for row in step.inputs:
+                users.setdefault(row, []).append(index)
+        self.users = users
+        for step in self.plan:
+            step.users = tuple(users.get(step.row, ()))
+        self.compiled = table.generation
+        # constant expressions and those whose sensors do not exist are never triggered
+        self.update([], 0.0, [index for index, step in enumerate(self.plan) if not step.inputs])
+
+    # steps sorted so that no step comes before a virtual sensor it reads, steps that
+    # read each other are left out and reported once
+    def order(self, steps: list) -> list:
+        virtual = {step.row for step in steps}
+        plan = []
+        done = set()
+        while steps:
+            ready = [step for step in steps if all(row in done or row not in virtual for row in step.inputs)]
+            if not ready:
+                names = sorted({step.name for step in steps} - self.reported)
+                if names:
+                    print(f"sensmon: ignoring virtual sensors that depend on each other: {', '.join(names)}",
+                          file=sys.stderr, flush=True)
+                    self.reported.update(names)
+                break
+            plan.extend(ready)
+            done.update(step.row for step in ready)
+            steps = [step for step in steps if step.row not in done]
+        return plan
+
+    # recompute the virtual sensors reading any of `rows`, the rows that were just sampled,
+    # returns the virtual rows that got a fresh value
+    # the steps are taken in plan order, virtual sensors reading one that was recomputed are
+    # merged in from a heap, they always come later in the plan
+    def update(self, rows: list, now: float, start: list = None) -> list:
+        users = self.users
+        queued = set(start or ())
+        for row in rows:
+            steps = users.get(row)
+            if steps:
+                queued.update(steps)
+        if not queued:
+            return []
+
+        plan = self.plan
+        flags = self.table.stale
+        stale = self.staleRows()
+        order = sorted(queued)
+        count = len(order)
+        position = 0
+        later = []
+        fresh = []
+        with memoryview(self.table.cur) as values:
+            while position < count or later:
+                if later and (position == count or later[0] < order[position]):
+                    step = plan[heapq.heappop(later)]
+                else:
+                    step = plan[order[position]]
+                    position += 1
+                row = step.row
+                if not step.inputs.isdisjoint(stale):
+                    flags[row] = True
+                    stale.add(row)
+                else:
+                    flags[row] = False
+                    stale.discard(row)
+                    try:
+                        value = float(step.function(values, now, step.this, step.scale, step.rates))
+                    except (ArithmeticError, ValueError):
+                        value = NAN
+                    values[row] = value
+                    if value == value:
+                        fresh.append(row)
+                for index in step.users:
+                    if index not in queued:
+                        queued.add(index)
+                        heapq.heappush(later, index)
+        return fresh
+
+    # rows flagged stale
+    def staleRows(self) -> set:
+        stale = self.table.stale
+        if np is not None:
+            return set(np.flatnonzero(stale[:self.table.size]).tolist())
+        return {row for row, flag in enumerate(stale) if flag}